@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('authentication', '0005_user_domain'),
+        ('tenants', '0007_alter_activitylogs_action_type'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(fields=('username', 'tenant'), name='unique_username_per_tenant'),
+        ),
+    ]
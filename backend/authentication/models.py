@@ -33,5 +33,10 @@ class User(AbstractBaseUser,PermissionsMixin):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['username', 'tenant'], name='unique_username_per_tenant'),
+        ]
+
     def __str__(self):
         return f"{self.username} ({self.email})"
\ No newline at end of file
@@ -2,4 +2,6 @@ from django.contrib import admin
 from .models import *
 # Register your models here.
 admin.site.register(Bill)
-admin.site.register(BillItem)
\ No newline at end of file
+admin.site.register(BillItem)
+admin.site.register(BillPayment)
+admin.site.register(PaymentRun)
@@ -0,0 +1,114 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def open_existing_bills(apps, schema_editor):
+    """
+    nothing has been recorded as paid yet, so every existing bill is owed in full
+    """
+    Bill = apps.get_model('billing', 'Bill')
+    Bill.objects.update(outstanding=F('total_amount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0002_initial'),
+        ('suppliers', '0001_initial'),
+        ('tenants', '0008_alter_activitylogs_action_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillPayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('paid_on', models.DateField(default=django.utils.timezone.localdate)),
+                ('method', models.CharField(blank=True, max_length=50)),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('recorded_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-paid_on', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PaymentRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('due_by', models.DateField(help_text='Bills due on or before this date were picked')),
+                ('pay_date', models.DateField(default=django.utils.timezone.localdate)),
+                ('status', models.CharField(choices=[('draft', 'Draft'), ('paid', 'Paid')], default='draft', max_length=20)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('bills_count', models.IntegerField(default=0)),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('paid_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PaymentRunBill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='amount_paid',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='outstanding',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='total_amount less amount_paid, kept up to date as payments are made', max_digits=10),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(condition=models.Q(('outstanding__gt', 0)), fields=['tenant', 'due_date'], name='bill_open_due_idx'),
+        ),
+        migrations.AddField(
+            model_name='billpayment',
+            name='bill',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments_made', to='billing.bill'),
+        ),
+        migrations.AddField(
+            model_name='billpayment',
+            name='tenant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tenants.tenant'),
+        ),
+        migrations.AddField(
+            model_name='paymentrun',
+            name='tenant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tenants.tenant'),
+        ),
+        migrations.AddField(
+            model_name='billpayment',
+            name='payment_run',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to='billing.paymentrun'),
+        ),
+        migrations.AddField(
+            model_name='paymentrunbill',
+            name='bill',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_run_items', to='billing.bill'),
+        ),
+        migrations.AddField(
+            model_name='paymentrunbill',
+            name='run',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='billing.paymentrun'),
+        ),
+        migrations.AddConstraint(
+            model_name='paymentrunbill',
+            constraint=models.UniqueConstraint(fields=('run', 'bill'), name='unique_bill_per_payment_run'),
+        ),
+        migrations.RunPython(open_existing_bills, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:54
+
+from django.db import migrations, models
+from django.db.models import F
+
+from erp.totals import refresh_totals
+
+
+def _fill_line_totals(lines):
+    # numeric(12, 2) columns round each step to the cent, as line_amounts() does
+    lines.update(line_net=F('quantity') * F('rate'))
+    lines.update(line_tax=F('line_net') * F('tax_rate') / 100)
+    lines.update(line_gross=F('line_net') + F('line_tax'))
+
+
+def fill_line_totals(apps, schema_editor):
+    """
+    store the totals of existing lines and bring every bill header in line with them
+    """
+    Bill = apps.get_model('billing', 'Bill')
+    BillItem = apps.get_model('billing', 'BillItem')
+    _fill_line_totals(BillItem.objects.all())
+    refresh_totals(Bill, BillItem, 'bill', Bill.objects.values('pk'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0003_payables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billitem',
+            name='line_gross',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='billitem',
+            name='line_net',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='billitem',
+            name='line_tax',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(fill_line_totals, migrations.RunPython.noop),
+    ]
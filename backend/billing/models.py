@@ -1,4 +1,7 @@
 from django.db import models
+from django.utils import timezone
+from erp.rendering import money
+from erp.totals import LineTotals
 
 #this app handles transactions with vendors
 
@@ -15,13 +18,48 @@ class Bill(models.Model):
     subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total_tax = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    outstanding = models.DecimalField(max_digits=10, decimal_places=2, default=0,
+                                      help_text="total_amount less amount_paid, kept up to date as payments are made")
     tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # open bills only: payables, aging and payment runs never look at paid ones
+            models.Index(fields=['tenant', 'due_date'], condition=models.Q(outstanding__gt=0),
+                         name='bill_open_due_idx'),
+        ]
+
     def __str__(self):
         return f"Bill #{self.bill_number}"
 
+    def document_data(self):
+        """
+        the bill as a plain dict for erp.rendering; prefetch `items` and select `tenant`
+        when rendering many
+        """
+        return {
+            'kind': 'Bill',
+            'number': self.bill_number,
+            'issued': str(self.bill_date or ''),
+            'due': str(self.due_date or ''),
+            'issuer': self.tenant.name,
+            'party_label': 'From',
+            'party': [value for value in (self.vendor_name, self.vendor_address, self.vendor_email,
+                                          self.vendor_phone, self.vendor_gstin) if value],
+            'lines': [
+                # the stored, rounded line amounts, so the lines add up to the header totals
+                [item.description, f"{item.quantity:g}", money(item.rate), money(item.line_tax),
+                 money(item.line_net)]
+                for item in self.items.all()
+            ],
+            'totals': [['Subtotal', money(self.subtotal)], ['Tax', money(self.total_tax)],
+                       ['Total', money(self.total_amount)]],
+            'notes': '',
+        }
+
 
-class BillItem(models.Model):
+class BillItem(LineTotals):
     bill = models.ForeignKey(Bill, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey('products.Product', on_delete=models.SET_NULL, null=True) 
     description = models.TextField()
@@ -30,4 +68,63 @@ class BillItem(models.Model):
     tax_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0.18)
     
     def __str__(self):
-        return self.description
\ No newline at end of file
+        return self.description
+
+
+PAYMENT_RUN_STATUSES = [
+    ('draft', 'Draft'),
+    ('paid', 'Paid'),
+]
+
+
+class PaymentRun(models.Model):
+    """
+    a batch of bills picked to be paid together, e.g. the weekly supplier payments; see
+    billing.payables
+    """
+    due_by = models.DateField(help_text="Bills due on or before this date were picked")
+    pay_date = models.DateField(default=timezone.localdate)
+    status = models.CharField(max_length=20, choices=PAYMENT_RUN_STATUSES, default='draft')
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    bills_count = models.IntegerField(default=0)
+    reference = models.CharField(max_length=100, blank=True)
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    paid_at = models.DateTimeField(null=True, blank=True)
+    tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Payment run #{self.pk} ({self.status})"
+
+
+class PaymentRunBill(models.Model):
+    run = models.ForeignKey(PaymentRun, on_delete=models.CASCADE, related_name='items')
+    bill = models.ForeignKey(Bill, on_delete=models.CASCADE, related_name='payment_run_items')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['run', 'bill'], name='unique_bill_per_payment_run')]
+
+
+class BillPayment(models.Model):
+    """
+    money paid against a bill, by hand or as part of a payment run
+    """
+    bill = models.ForeignKey(Bill, on_delete=models.CASCADE, related_name='payments_made')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    paid_on = models.DateField(default=timezone.localdate)
+    method = models.CharField(max_length=50, blank=True)
+    reference = models.CharField(max_length=100, blank=True)
+    payment_run = models.ForeignKey(PaymentRun, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='payments')
+    recorded_at = models.DateTimeField(auto_now_add=True)
+    tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ['-paid_on', '-id']
+
+    def __str__(self):
+        return f"{self.amount} against bill #{self.bill_id}"
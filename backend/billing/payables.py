@@ -0,0 +1,153 @@
+"""
+Accounts payable.
+
+Every bill carries `amount_paid` and `outstanding`, moved by single UPDATEs as payments are
+made, the same way invoice.receivables does it for invoices. Open bills are found through
+the partial (tenant, due_date) index on outstanding > 0, which the aging report and the
+payment-run planner both group over in SQL.
+
+A payment run picks every open bill due by a date (optionally for one vendor) and stores
+the amounts picked. Paying the run writes all its BillPayments with one bulk insert and
+settles all its bills with one UPDATE that reads each bill's amount from the run.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Min, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from erp.aging import aging_buckets, amount_by_pk
+from .models import Bill, BillPayment, PaymentRun, PaymentRunBill
+
+
+class PayablesError(Exception):
+    """
+    raised when a payment or payment run cannot be applied
+    """
+
+
+def apply_payments(payments):
+    """
+    save unsaved BillPayment instances and move their bills' balances in one UPDATE.
+    Raises PayablesError, saving nothing, when a payment is not positive or would take a
+    bill below zero.
+    """
+    amounts = {}
+    for payment in payments:
+        if payment.amount <= 0:
+            raise PayablesError("Payment amounts must be positive.")
+        amounts[payment.bill_id] = amounts.get(payment.bill_id, 0) + payment.amount
+    if not amounts:
+        return []
+
+    with transaction.atomic():
+        change = amount_by_pk(amounts)
+        covered = Q()
+        for bill_id, amount in amounts.items():
+            covered |= Q(pk=bill_id, outstanding__gte=amount)
+        updated = Bill.objects.filter(covered).update(
+            amount_paid=F('amount_paid') + change,
+            outstanding=F('outstanding') - change,
+        )
+        if updated != len(amounts):
+            raise PayablesError("A payment is larger than the bill's outstanding balance.")
+        return BillPayment.objects.bulk_create(payments)
+
+
+def reverse_payment(payment):
+    """
+    delete a recorded payment and put its amount back on the bill
+    """
+    with transaction.atomic():
+        Bill.objects.filter(pk=payment.bill_id).update(
+            amount_paid=F('amount_paid') - payment.amount,
+            outstanding=F('outstanding') + payment.amount,
+        )
+        payment.delete()
+
+
+def open_bills(tenant=None):
+    bills = Bill.objects.filter(outstanding__gt=0)
+    if tenant is not None:
+        bills = bills.filter(tenant=tenant)
+    return bills
+
+
+def aging_report(as_of=None, tenant=None):
+    """
+    outstanding balances per vendor split into 0–30, 31–60, 61–90 and 90+ days past due
+    at `as_of` (today by default), largest balance first, from one grouped query
+    """
+    as_of = as_of or timezone.localdate()
+    return list(
+        open_bills(tenant).values('vendor_id', 'vendor_name')
+        .annotate(total=Sum('outstanding'), bills=Count('id'), **aging_buckets(as_of))
+        .order_by('-total', 'vendor_name')
+    )
+
+
+def _due_bills(due_by, tenant=None, vendor=None):
+    bills = open_bills(tenant).filter(due_date__lte=due_by).exclude(payment_run_items__run__status='draft')
+    if vendor is not None:
+        bills = bills.filter(vendor_id=vendor)
+    return bills
+
+
+def plan_payment_run(due_by, tenant=None, vendor=None):
+    """
+    what a payment run for bills due by `due_by` would pay each vendor, earliest due first.
+    Bills already in a draft run are left out.
+    """
+    return list(
+        _due_bills(due_by, tenant, vendor).values('vendor_id', 'vendor_name')
+        .annotate(total=Sum('outstanding'), bills=Count('id'), earliest_due=Min('due_date'))
+        .order_by('earliest_due', 'vendor_name')
+    )
+
+
+def create_payment_run(due_by, tenant, vendor=None, pay_date=None, notes=''):
+    """
+    save a draft run paying the full outstanding balance of every bill due by `due_by`
+    """
+    with transaction.atomic():
+        bills = list(_due_bills(due_by, tenant, vendor).select_for_update(of=('self',))
+                     .order_by('pk').values_list('pk', 'outstanding'))
+        run = PaymentRun.objects.create(
+            due_by=due_by, pay_date=pay_date or timezone.localdate(), notes=notes, tenant=tenant,
+            total_amount=sum(amount for _, amount in bills), bills_count=len(bills),
+        )
+        PaymentRunBill.objects.bulk_create(
+            [PaymentRunBill(run=run, bill_id=bill_id, amount=amount) for bill_id, amount in bills],
+            batch_size=1000,
+        )
+    return run
+
+
+def pay_payment_run(run, paid_on=None, reference='', method='bank_transfer'):
+    """
+    mark every bill of a draft run as paid: one UPDATE settles the bills and one bulk
+    insert records the payments. Raises PayablesError when the run was already paid or a
+    bill no longer owes what the run planned to pay.
+    """
+    now = timezone.now()
+    paid_on = paid_on or timezone.localdate()
+    with transaction.atomic():
+        run = PaymentRun.objects.select_for_update().get(pk=run.pk)
+        if run.status != 'draft':
+            raise PayablesError("This payment run has already been paid.")
+        amount = Subquery(PaymentRunBill.objects.filter(run=run, bill=OuterRef('pk')).values('amount')[:1])
+        in_run = PaymentRunBill.objects.filter(run=run).values('bill_id')
+        updated = Bill.objects.filter(pk__in=in_run, outstanding__gte=amount).update(
+            amount_paid=F('amount_paid') + amount,
+            outstanding=F('outstanding') - amount,
+        )
+        if updated != run.bills_count:
+            raise PayablesError("Some bills of this run were paid or changed since it was planned; plan a new run.")
+        BillPayment.objects.bulk_create([
+            BillPayment(bill_id=bill_id, amount=amount, paid_on=paid_on, method=method, reference=reference,
+                        payment_run=run, tenant_id=run.tenant_id)
+            for bill_id, amount in run.items.values_list('bill_id', 'amount')
+        ], batch_size=1000)
+        run.status = 'paid'
+        run.paid_at = now
+        run.reference = reference
+        run.save(update_fields=['status', 'paid_at', 'reference'])
+    return run
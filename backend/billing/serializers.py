@@ -1,15 +1,24 @@
+from decimal import Decimal
+from django.db import transaction
 from rest_framework import serializers
+from erp.db import sync_line_items
+from erp.totals import LINE_TOTAL_FIELDS, refresh_totals
 from .models import *
 
 
        
         
+LINE_FIELDS = ['product','description','quantity','rate','tax_rate']
+
+
 class BillItemSerializer(serializers.ModelSerializer):
-    
+    # sent back on update to keep a line; lines without an id are added
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = BillItem
-        fields = ['id','bill','description','quantity','rate','tax_rate']
-        read_only_fields = ['bill']
+        fields = ['id','bill','description','quantity','rate','tax_rate','line_net','line_tax','line_gross']
+        read_only_fields = ['bill', *LINE_TOTAL_FIELDS]
         
         
 class BillSerializer(serializers.ModelSerializer):
@@ -17,24 +26,26 @@ class BillSerializer(serializers.ModelSerializer):
     items = BillItemSerializer(many = True)
     class Meta:
         model = Bill
-        fields = ['id','bill_number','bill_date','due_date','vendor_name',
-                  'vendor_email','vendor_phone','vendor_address','subtotal','total_tax','total_amount','tenant','items']
-        read_only_fields = ['tenant']
+        fields = ['id','bill_number','bill_date','due_date','vendor','vendor_name',
+                  'vendor_email','vendor_phone','vendor_address','subtotal','total_tax','total_amount',
+                  'amount_paid','outstanding','tenant','items']
+        read_only_fields = ['tenant','subtotal','total_tax','total_amount','amount_paid','outstanding']
+        # one-off bills need not come from a supplier on file
+        extra_kwargs = {'vendor': {'required': False}}
         
+    @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop('items', [])
-        subtotal = sum(item['quantity'] * item['rate'] for item in items_data)
-        total_tax = sum(item['quantity'] * item['rate'] * (item['tax_rate'] / 100) for item in items_data)
-        total_amount = subtotal + total_tax
-        validated_data['subtotal'] = subtotal
-        validated_data['total_tax'] = total_tax
-        validated_data['total_amount'] = total_amount
         bill = Bill.objects.create(**validated_data)
         for item in items_data:
-            BillItem.objects.create(bill=bill, **item)
-            
+            item.pop('id', None)
+        BillItem.objects.bulk_create([BillItem(bill=bill, **item).set_totals() for item in items_data])
+        refresh_totals(Bill, BillItem, 'bill', [bill.pk])
+        bill.refresh_from_db(fields=['subtotal', 'total_tax', 'total_amount', 'outstanding'])
+
         return bill
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         items_data = validated_data.pop('items', None)
         for attr, value in validated_data.items():
@@ -42,9 +53,61 @@ class BillSerializer(serializers.ModelSerializer):
         instance.save()
 
         if items_data is not None:
-            instance.items.all().delete()
-            for item_data in items_data:
-                BillItem.objects.create(bill=instance, **item_data)
+            try:
+                sync_line_items(BillItem, 'bill', instance, items_data, LINE_FIELDS,
+                                prepare=BillItem.set_totals, prepared_fields=LINE_TOTAL_FIELDS)
+            except ValueError as e:
+                raise serializers.ValidationError({'items': [str(e)]})
+            refresh_totals(Bill, BillItem, 'bill', [instance.pk])
+            instance.refresh_from_db(fields=['subtotal', 'total_tax', 'total_amount', 'outstanding'])
 
         return instance
- 
\ No newline at end of file
+
+
+class BillPaymentSerializer(serializers.ModelSerializer):
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+
+    class Meta:
+        model = BillPayment
+        fields = ['id','bill','amount','paid_on','method','reference','payment_run','recorded_at']
+        read_only_fields = ['bill','payment_run','recorded_at']
+
+
+class PayablesAgingSerializer(serializers.Serializer):
+    as_of = serializers.DateField(required=False)
+
+
+class PaymentRunPlanSerializer(serializers.Serializer):
+    due_by = serializers.DateField()
+    vendor = serializers.IntegerField(required=False)
+
+
+class PaymentRunCreateSerializer(PaymentRunPlanSerializer):
+    pay_date = serializers.DateField(required=False)
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+class PaymentRunPaySerializer(serializers.Serializer):
+    paid_on = serializers.DateField(required=False)
+    reference = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+    method = serializers.CharField(max_length=50, required=False, default='bank_transfer')
+
+
+class PaymentRunBillSerializer(serializers.ModelSerializer):
+    bill_number = serializers.CharField(source='bill.bill_number', read_only=True)
+    vendor_name = serializers.CharField(source='bill.vendor_name', read_only=True)
+    due_date = serializers.DateField(source='bill.due_date', read_only=True)
+
+    class Meta:
+        model = PaymentRunBill
+        fields = ['bill','bill_number','vendor_name','due_date','amount']
+        read_only_fields = fields
+
+
+class PaymentRunSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = PaymentRun
+        fields = ['id','due_by','pay_date','status','total_amount','bills_count','reference','notes',
+                  'created_at','paid_at']
+        read_only_fields = fields
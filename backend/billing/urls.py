@@ -4,5 +4,13 @@ from .views import *
 
 urlpatterns = [
     path('bills/', BillListCreateBillAPIView.as_view()),
-    path('bills/<int:pk>/', BillRetrieveUpdateDestroyAPIView.as_view())
+    path('bills/<int:pk>/', BillRetrieveUpdateDestroyAPIView.as_view()),
+    path('bills/<int:pk>/document/', BillDocumentAPIView.as_view()),
+    path('bills/<int:pk>/payments/', BillPaymentListCreateAPIView.as_view()),
+    path('bills/<int:pk>/payments/<int:payment_pk>/', BillPaymentDestroyAPIView.as_view()),
+    path('payables/aging/', PayablesAgingAPIView.as_view()),
+    path('payment_runs/', PaymentRunListCreateAPIView.as_view()),
+    path('payment_runs/plan/', PaymentRunPlanAPIView.as_view()),
+    path('payment_runs/<int:pk>/', PaymentRunRetrieveDestroyAPIView.as_view()),
+    path('payment_runs/<int:pk>/pay/', PaymentRunPayAPIView.as_view())
 ]
\ No newline at end of file
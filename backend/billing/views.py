@@ -8,6 +8,11 @@ from .models import *
 from tenants.models import *
 from django.db import transaction
 from drf_yasg.utils import swagger_auto_schema
+from erp.rendering import FORMATS, document_response
+from django.utils import timezone
+from .payables import (PayablesError, aging_report, apply_payments, create_payment_run, pay_payment_run,
+                       plan_payment_run, reverse_payment)
+
 class BillListCreateBillAPIView(APIView):
     serializer_class = BillSerializer
    
@@ -80,4 +85,173 @@ class BillRetrieveUpdateDestroyAPIView(APIView):
     def delete(self, pk):
         bill = self.get_object(pk)
         bill.delete()
-        return Response(status = status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response(status = status.HTTP_204_NO_CONTENT)
+
+
+class BillDocumentAPIView(APIView):
+    """
+    GET METHOD: To get a bill as a PDF (default) or HTML page, rendered on the server and
+    cached until the bill changes, e.g. ?output=html; ?download=true sends it as an attachment
+    """
+    @swagger_auto_schema(tags=['Bills'])
+    def get(self, request, pk):
+        output = request.query_params.get('output', 'pdf')
+        if output not in FORMATS:
+            return Response({'error': f"output must be one of {', '.join(FORMATS)}"}, status = status.HTTP_400_BAD_REQUEST)
+        bill = get_object_or_404(Bill.objects.select_related('tenant').prefetch_related('items'), pk=pk)
+        download = request.query_params.get('download', '').lower() in ('1', 'true')
+        return document_response(request, bill.document_data(), output, download)
+
+
+class BillPaymentListCreateAPIView(APIView):
+    serializer_class = BillPaymentSerializer
+    """
+    GET METHOD: To get the payments made against a bill
+    """
+    @swagger_auto_schema(tags=['Bills'])
+    def get(self, request, pk):
+        bill = get_object_or_404(Bill, pk=pk)
+        serializer = self.serializer_class(bill.payments_made.all(), many=True)
+        return Response(serializer.data, status = status.HTTP_200_OK)
+
+    """
+    POST METHOD: To record a payment made against a bill outside a payment run
+    """
+    @swagger_auto_schema(tags=['Bills'])
+    def post(self, request, pk):
+        bill = get_object_or_404(Bill, pk=pk)
+        serializer = self.serializer_class(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
+        payment = BillPayment(bill=bill, tenant=request.user.tenant, **serializer.validated_data)
+        try:
+            apply_payments([payment])
+        except PayablesError as e:
+            return Response({'error': str(e)}, status = status.HTTP_400_BAD_REQUEST)
+        return Response(self.serializer_class(payment).data, status = status.HTTP_201_CREATED)
+
+
+class BillPaymentDestroyAPIView(APIView):
+    """
+    DELETE METHOD: To reverse a payment recorded against a bill by mistake
+    """
+    @swagger_auto_schema(tags=['Bills'])
+    def delete(self, request, pk, payment_pk):
+        payment = get_object_or_404(BillPayment, pk=payment_pk, bill_id=pk)
+        reverse_payment(payment)
+        return Response(status = status.HTTP_204_NO_CONTENT)
+
+
+class PayablesAgingAPIView(APIView):
+    serializer_class = PayablesAgingSerializer
+    """
+    GET METHOD: To get what we owe each vendor, split into 0-30, 31-60, 61-90 and 90+ days
+    past due, e.g. ?as_of=2025-06-30 (today by default)
+    """
+    @swagger_auto_schema(tags=['Bills'])
+    def get(self, request):
+        serializer = self.serializer_class(data = request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
+        as_of = serializer.validated_data.get('as_of') or timezone.localdate()
+        report = aging_report(as_of, tenant=request.user.tenant)
+        return Response({'as_of': as_of, 'vendors': report}, status = status.HTTP_200_OK)
+
+
+class PaymentRunPlanAPIView(APIView):
+    serializer_class = PaymentRunPlanSerializer
+    """
+    GET METHOD: To preview a payment run: what each vendor is owed on bills due by a date,
+    e.g. ?due_by=2025-06-07&vendor=3
+    """
+    @swagger_auto_schema(tags=['Bills'])
+    def get(self, request):
+        serializer = self.serializer_class(data = request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        vendors = plan_payment_run(data['due_by'], tenant=request.user.tenant, vendor=data.get('vendor'))
+        return Response({
+            'due_by': data['due_by'],
+            'total_amount': sum(row['total'] for row in vendors),
+            'bills_count': sum(row['bills'] for row in vendors),
+            'vendors': vendors,
+        }, status = status.HTTP_200_OK)
+
+
+class PaymentRunListCreateAPIView(APIView):
+    serializer_class = PaymentRunSerializer
+    """
+    GET METHOD: To get the payment runs, latest first
+    """
+    @swagger_auto_schema(tags=['Bills'])
+    def get(self, request):
+        serializer = self.serializer_class(PaymentRun.objects.all(), many=True)
+        return Response(serializer.data, status = status.HTTP_200_OK)
+
+    """
+    POST METHOD: To save a draft payment run of every open bill due by a date
+    """
+    @swagger_auto_schema(tags=['Bills'])
+    def post(self, request):
+        serializer = PaymentRunCreateSerializer(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        run = create_payment_run(data['due_by'], request.user.tenant, vendor=data.get('vendor'),
+                                 pay_date=data.get('pay_date'), notes=data['notes'])
+        if not run.bills_count:
+            run.delete()
+            return Response({'error': 'No open bills are due by that date.'}, status = status.HTTP_400_BAD_REQUEST)
+        return Response(self.serializer_class(run).data, status = status.HTTP_201_CREATED)
+
+
+class PaymentRunRetrieveDestroyAPIView(APIView):
+    serializer_class = PaymentRunSerializer
+    """
+    GET METHOD: To get a payment run with the bills it pays
+    """
+    @swagger_auto_schema(tags=['Bills'])
+    def get(self, request, pk):
+        run = get_object_or_404(PaymentRun, pk=pk)
+        data = dict(self.serializer_class(run).data)
+        items = run.items.select_related('bill').order_by('bill__vendor_name', 'bill__due_date')
+        data['bills'] = PaymentRunBillSerializer(items, many=True).data
+        return Response(data, status = status.HTTP_200_OK)
+
+    """
+    DELETE METHOD: To drop a draft payment run; its bills can be picked by another run
+    """
+    @swagger_auto_schema(tags=['Bills'])
+    def delete(self, request, pk):
+        run = get_object_or_404(PaymentRun, pk=pk)
+        if run.status != 'draft':
+            return Response({'error': 'Only draft payment runs can be deleted.'}, status = status.HTTP_400_BAD_REQUEST)
+        run.delete()
+        return Response(status = status.HTTP_204_NO_CONTENT)
+
+
+class PaymentRunPayAPIView(APIView):
+    serializer_class = PaymentRunPaySerializer
+    """
+    POST METHOD: To mark every bill of a payment run as paid in one go
+    """
+    @swagger_auto_schema(tags=['Bills'])
+    def post(self, request, pk):
+        run = get_object_or_404(PaymentRun, pk=pk)
+        serializer = self.serializer_class(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        try:
+            with transaction.atomic():
+                run = pay_payment_run(run, paid_on=data.get('paid_on'), reference=data['reference'],
+                                      method=data['method'])
+                ActivityLogs.objects.create(
+                    tenant=request.user.tenant,
+                    action_type='payment_run_paid',
+                    message=f'Payment run #{run.pk} paid {run.bills_count} bills totalling {run.total_amount}.'
+                )
+        except PayablesError as e:
+            return Response({'error': str(e)}, status = status.HTTP_400_BAD_REQUEST)
+        return Response(PaymentRunSerializer(run).data, status = status.HTTP_200_OK)
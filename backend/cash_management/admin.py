@@ -3,4 +3,5 @@ from .models import *
 
 admin.site.register(CashDrawer)
 admin.site.register(CashExpense)
-admin.site.register(CashReconciliation)
\ No newline at end of file
+admin.site.register(CashReconciliation)
+admin.site.register(CashMovement)
\ No newline at end of file
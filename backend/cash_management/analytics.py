@@ -0,0 +1,63 @@
+"""
+Cash expense analytics.
+
+Spend is bucketed by day, week, month or year with date_trunc and grouped by branch and/or
+drawer in the database. Breakdowns that do not need the drawer are read from the per-branch
+daily rollup (BranchDailyMetrics) that expense writes already keep up to date, so a
+year-to-date query touches one row per branch and day however many expenses there are.
+Drawer breakdowns go to CashExpense itself through its (cash_drawer, recorded_at) index.
+Both paths return buckets as dates (the first day of the bucket, in local time), so a
+response looks the same whichever path served it.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from multi_location.models import BranchDailyMetrics
+from .models import CashExpense
+
+BUCKETS = ('day', 'week', 'month', 'year')
+GROUPS = ('branch', 'drawer')
+
+
+def _day_start(day):
+    # compare against a bare timestamp rather than recorded_at::date so the index is usable
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def expense_breakdown(start=None, end=None, bucket='week', group_by=('branch',), branch=None, use_rollup=True):
+    """
+    total and number of expenses per bucket and group, oldest bucket first.
+
+    `start` and `end` are inclusive dates; `branch` narrows the breakdown to one branch.
+    """
+    if use_rollup and 'drawer' not in group_by:
+        rows = BranchDailyMetrics.objects.filter(expense_count__gt=0)
+        date_field, total, count = 'date', Sum('expense_total'), Sum('expense_count')
+        if start:
+            rows = rows.filter(date__gte=start)
+        if end:
+            rows = rows.filter(date__lte=end)
+    else:
+        rows = CashExpense.objects.all()
+        date_field, total, count = 'recorded_at', Sum('amount'), Count('pk')
+        if start:
+            rows = rows.filter(recorded_at__gte=_day_start(start))
+        if end:
+            rows = rows.filter(recorded_at__lt=_day_start(end + timedelta(days=1)))
+    if branch is not None:
+        rows = rows.filter(branch=branch)
+
+    keys = {'bucket': Trunc(date_field, bucket, output_field=DateField())}
+    if 'branch' in group_by:
+        keys['branch_name'] = F('branch__branch_name')
+    if 'drawer' in group_by:
+        keys['drawer'] = F('cash_drawer_id')
+
+    return list(
+        rows.annotate(**keys).values(*keys)
+        .annotate(total=total, count=count)
+        .order_by(*keys)
+    )
@@ -0,0 +1,106 @@
+"""
+End-of-day cash close.
+
+Closes every open CashDrawer in scope in one transaction: the expected cash of all the
+drawers comes from a single grouped query over their CashMovement journals (sales and
+refunds, expenses, floats, drops; cash payments are posted as sales when they are
+recorded, see `record_cash_payment`), the counted cash is compared against it and the
+CashReconciliation rows are written in bulk. The variance report is ranked by the size
+of the difference so head office starts with the drawers that are furthest out.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Abs
+from django.utils import timezone
+
+from .models import CashDrawer, CashMovement, CashReconciliation, drawer_metrics
+
+MOVEMENT_GROUPS = {
+    'sales': ('sale', 'refund'),
+    'expenses': ('expense', 'expense_reversal'),
+    'floats': ('opening_float', 'float_top_up'),
+    'drops': ('drop',),
+    'adjustments': ('adjustment',),
+}
+
+ZERO = Decimal('0.00')
+
+
+def expected_cash(drawer_ids):
+    """
+    expected cash and its breakdown per drawer, from one grouped query over the journals
+    """
+    breakdown = {
+        name: Sum('amount', filter=Q(movement_type__in=types), default=ZERO)
+        for name, types in MOVEMENT_GROUPS.items()
+    }
+    rows = (
+        CashMovement.objects.filter(cash_drawer_id__in=drawer_ids)
+        .values('cash_drawer_id')
+        .annotate(expected=Sum('amount', default=ZERO), **breakdown)
+    )
+    return {row.pop('cash_drawer_id'): row for row in rows}
+
+
+def close_drawers(drawers, counts, notes=''):
+    """
+    close the open drawers of the `drawers` queryset that have a count in `counts`
+    ({drawer id: counted cash}) and record their reconciliations.
+
+    Drawers without a count are left open and reported as uncounted. Returns the variance
+    report: one entry per drawer, largest absolute variance first, uncounted drawers last.
+    """
+    from multi_location.models import adjust_branch_metrics
+
+    now = timezone.now()
+    with transaction.atomic():
+        open_drawers = list(
+            drawers.filter(status='open').select_related('branch', 'cashier')
+            .select_for_update(of=('self',)).order_by('pk')
+        )
+        expected = expected_cash([drawer.pk for drawer in open_drawers])
+
+        report, reconciliations, closed = [], [], []
+        for drawer in open_drawers:
+            totals = expected.get(drawer.pk) or {'expected': ZERO, **{name: ZERO for name in MOVEMENT_GROUPS}}
+            entry = {
+                'cash_drawer': drawer.pk,
+                'branch': drawer.branch.branch_name,
+                'cashier': drawer.cashier.username if drawer.cashier else None,
+                **totals,
+                'actual_cash_count': None,
+                'variance': None,
+                'status': 'uncounted',
+            }
+            if drawer.pk in counts:
+                counted = Decimal(counts[drawer.pk])
+                entry.update(actual_cash_count=counted, variance=counted - totals['expected'], status='closed')
+                reconciliations.append(CashReconciliation(
+                    cash_drawer=drawer,
+                    actual_cash_count=counted,
+                    expected_cash=totals['expected'],
+                    variance=entry['variance'],
+                    notes=notes,
+                    tenant_id=drawer.tenant_id,
+                ))
+                closed.append(drawer)
+            report.append(entry)
+
+        CashReconciliation.objects.bulk_create(reconciliations, batch_size=1000)
+        CashDrawer.objects.filter(pk__in=[drawer.pk for drawer in closed]).update(status='closed', closed_at=now)
+        adjust_branch_metrics([drawer_metrics(drawer, sign=-1) for drawer in closed])
+
+    report.sort(key=lambda entry: (entry['variance'] is None, -abs(entry['variance'] or 0)))
+    return report
+
+
+def variance_report(reconciliations):
+    """
+    reconciliations ranked by the size of their variance, largest first
+    """
+    return (
+        reconciliations.select_related('cash_drawer__branch', 'cash_drawer__cashier')
+        .order_by(Abs('variance').desc(), 'pk')
+    )
@@ -0,0 +1,45 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_management.end_of_day import close_drawers
+from cash_management.models import CashDrawer
+
+
+class Command(BaseCommand):
+    help = (
+        "Close the open cash drawers against a file of counted cash and print the variance report. "
+        "Run per tenant, e.g. `manage.py tenant_command close_cash_drawers counts.csv --schema=<tenant>`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('counts',
+                            help="CSV file with a cash_drawer and an actual_cash_count column.")
+        parser.add_argument('--branch',
+                            help="Only close the drawers of the branch with this name.")
+        parser.add_argument('--notes', default='',
+                            help="Notes stored on every reconciliation.")
+        parser.add_argument('--top', type=int, default=20,
+                            help="Number of report lines to print.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['counts'], newline='') as handle:
+                counts = {int(row['cash_drawer']): row['actual_cash_count'] for row in csv.DictReader(handle)}
+        except (OSError, KeyError, ValueError) as e:
+            raise CommandError(f"Could not read the counts file: {e}")
+
+        cash_drawers = CashDrawer.objects.all()
+        if options['branch']:
+            cash_drawers = cash_drawers.filter(branch__branch_name=options['branch'])
+        report = close_drawers(cash_drawers, counts, notes=options['notes'])
+
+        for entry in report[:options['top']]:
+            variance = 'uncounted' if entry['variance'] is None else f"{entry['variance']:+.2f}"
+            self.stdout.write(
+                f"#{entry['cash_drawer']:<6} {entry['branch']:<30} expected {entry['expected']:>12.2f}  {variance}"
+            )
+        closed = sum(1 for entry in report if entry['status'] == 'closed')
+        self.stdout.write(self.style.SUCCESS(
+            f"Closed {closed} of {len(report)} open cash drawers."
+        ))
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_drawer_journals(apps, schema_editor):
+    """
+    give every existing drawer a journal that explains its current balance: the opening
+    float, plus one adjustment for whatever moved the balance before movements were kept
+    """
+    CashDrawer = apps.get_model('cash_management', 'CashDrawer')
+    CashMovement = apps.get_model('cash_management', 'CashMovement')
+    movements = []
+    for drawer in CashDrawer.objects.all().iterator():
+        if drawer.opening_balance:
+            movements.append(CashMovement(
+                cash_drawer_id=drawer.pk, movement_type='opening_float', amount=drawer.opening_balance,
+                balance_after=drawer.opening_balance, tenant_id=drawer.tenant_id,
+            ))
+        difference = drawer.current_balance - drawer.opening_balance
+        if difference:
+            movements.append(CashMovement(
+                cash_drawer_id=drawer.pk, movement_type='adjustment', amount=difference,
+                balance_after=drawer.current_balance, reference='Balance before the cash journal',
+                tenant_id=drawer.tenant_id,
+            ))
+    CashMovement.objects.bulk_create(movements, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_management', '0002_initial'),
+        ('tenants', '0007_alter_activitylogs_action_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cashreconciliation',
+            name='expected_cash',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='cashreconciliation',
+            name='variance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='cashdrawer',
+            name='current_balance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='cashdrawer',
+            name='opening_balance',
+            field=models.DecimalField(decimal_places=2, max_digits=12),
+        ),
+        migrations.CreateModel(
+            name='CashMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('movement_type', models.CharField(choices=[('opening_float', 'Opening Float'), ('sale', 'Sale'), ('refund', 'Refund'), ('expense', 'Expense'), ('expense_reversal', 'Expense Reversal'), ('float_top_up', 'Float Top-up'), ('drop', 'Cash Drop'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('recorded_at', models.DateTimeField(auto_now_add=True)),
+                ('cash_drawer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='cash_management.cashdrawer')),
+                ('cash_expense', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movements', to='cash_management.cashexpense')),
+                ('recorded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tenants.tenant')),
+            ],
+            options={
+                'ordering': ['recorded_at', 'id'],
+                'indexes': [models.Index(fields=['cash_drawer', 'recorded_at'], name='cash_manage_cash_dr_f7cde0_idx')],
+            },
+        ),
+        migrations.RunPython(seed_drawer_journals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_management', '0003_cash_movement_journal'),
+        ('multi_location', '0007_branch_metrics'),
+        ('tenants', '0007_alter_activitylogs_action_type'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cashexpense',
+            index=models.Index(fields=['branch', 'recorded_at'], name='cash_manage_branch__881791_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cashexpense',
+            index=models.Index(fields=['cash_drawer', 'recorded_at'], name='cash_manage_cash_dr_c97404_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cashexpense',
+            index=models.Index(fields=['recorded_at'], name='cash_manage_recorde_4d9ead_idx'),
+        ),
+    ]
@@ -1,5 +1,8 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
 from django.conf import settings
+from django.utils import timezone
 
 
 STATUS_CHOICES = [
@@ -7,11 +10,42 @@ STATUS_CHOICES = [
     ('closed', 'Closed'),
 ]
 
+MOVEMENT_TYPES = [
+    ('opening_float', 'Opening Float'),
+    ('sale', 'Sale'),
+    ('refund', 'Refund'),
+    ('expense', 'Expense'),
+    ('expense_reversal', 'Expense Reversal'),
+    ('float_top_up', 'Float Top-up'),
+    ('drop', 'Cash Drop'),
+    ('adjustment', 'Adjustment'),
+]
+
+# +1 puts cash into the drawer, -1 takes it out
+MOVEMENT_DIRECTIONS = {
+    'opening_float': 1,
+    'sale': 1,
+    'refund': -1,
+    'expense': -1,
+    'expense_reversal': 1,
+    'float_top_up': 1,
+    'drop': -1,
+    'adjustment': 1,
+}
+
+
+class CashDrawerError(Exception):
+    """
+    raised when a cash movement cannot be applied to a drawer
+    """
+
+
 class CashDrawer(models.Model):
     branch = models.ForeignKey('multi_location.Branch', on_delete=models.CASCADE)
     cashier = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='cash_drawers')
-    opening_balance = models.IntegerField()
-    current_balance = models.IntegerField()
+    opening_balance = models.DecimalField(max_digits=12, decimal_places=2)
+    # running projection of the drawer's CashMovement journal, only moved by record_movement()
+    current_balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
     opened_at = models.DateTimeField(auto_now_add=True)
     closed_at = models.DateTimeField(null=True, blank=True)
@@ -19,6 +53,55 @@ class CashDrawer(models.Model):
 
     def __str__(self):
         return f"Cash Drawer at {self.branch.branch_name} ({self.cashier.get_full_name()})"
+
+    def record_movement(self, movement_type, amount, reference='', recorded_by=None, cash_expense=None,
+                        correction=False):
+        """
+        append a movement to the drawer's journal and move `current_balance` with it in the
+        same transaction. `amount` is always positive; the movement type decides the direction.
+
+        Only a `correction` (an expense edited or deleted after the fact) may go to a closed
+        drawer: no cash moves, but the journal records it, dated now, and the drawer's last
+        reconciliation is restated with it, so its expected cash and variance stay right.
+        """
+        from multi_location.models import adjust_branch_metrics
+
+        amount = Decimal(amount)
+        if amount <= 0:
+            raise CashDrawerError("The amount of a cash movement must be positive.")
+        delta = amount * MOVEMENT_DIRECTIONS[movement_type]
+        with transaction.atomic():
+            drawer = CashDrawer.objects.select_for_update().get(pk=self.pk)
+            is_open = drawer.status == 'open'
+            if not is_open and not correction:
+                raise CashDrawerError("Cash can only move through an open drawer.")
+            if is_open and drawer.current_balance + delta < 0:
+                raise CashDrawerError(
+                    f"The drawer holds {drawer.current_balance}, not enough to pay out {amount}."
+                )
+            drawer.current_balance += delta
+            drawer.save(update_fields=['current_balance'])
+            movement = CashMovement.objects.create(
+                cash_drawer=drawer,
+                movement_type=movement_type,
+                amount=delta,
+                balance_after=drawer.current_balance,
+                reference=reference,
+                cash_expense=cash_expense,
+                recorded_by=recorded_by,
+                tenant_id=drawer.tenant_id,
+            )
+            if is_open:
+                adjust_branch_metrics([{'branch_id': drawer.branch_id, 'tenant_id': drawer.tenant_id,
+                                        'open_drawer_balance': delta}])
+            else:
+                reconciliation = drawer.reconciliations.select_for_update().order_by('-recorded_at', '-pk').first()
+                if reconciliation is not None:
+                    reconciliation.expected_cash += delta
+                    reconciliation.variance -= delta
+                    reconciliation.save(update_fields=['expected_cash', 'variance'])
+        self.current_balance = drawer.current_balance
+        return movement
     
     
 class CashExpense(models.Model):
@@ -29,16 +112,97 @@ class CashExpense(models.Model):
     recorded_at = models.DateTimeField(auto_now_add=True)
     tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['branch', 'recorded_at']),
+            models.Index(fields=['cash_drawer', 'recorded_at']),
+            models.Index(fields=['recorded_at']),
+        ]
+
     def __str__(self):
         return f"Expense of KES {self.amount} from {self.branch.branch_name}"
     
 
+class CashMovement(models.Model):
+    """
+    one entry of a drawer's cash journal. `amount` is signed: money into the drawer is
+    positive, money out is negative, and `balance_after` is the drawer balance once it applied.
+    """
+    cash_drawer = models.ForeignKey(CashDrawer, on_delete=models.CASCADE, related_name='movements')
+    movement_type = models.CharField(max_length=20, choices=MOVEMENT_TYPES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2)
+    reference = models.CharField(max_length=100, blank=True)
+    cash_expense = models.ForeignKey(CashExpense, on_delete=models.SET_NULL, null=True, blank=True, related_name='movements')
+    recorded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    recorded_at = models.DateTimeField(auto_now_add=True)
+    tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ['recorded_at', 'id']
+        indexes = [models.Index(fields=['cash_drawer', 'recorded_at'])]
+
+    def __str__(self):
+        return f"{self.get_movement_type_display()} of KES {self.amount} on drawer {self.cash_drawer_id}"
+
+
 class CashReconciliation(models.Model):
     cash_drawer = models.ForeignKey(CashDrawer, on_delete=models.CASCADE, related_name='reconciliations')
     actual_cash_count = models.DecimalField(max_digits=10, decimal_places=2)
+    expected_cash = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    variance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     notes = models.TextField(blank=True)
     recorded_at = models.DateTimeField(auto_now_add=True)
     tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE)
 
     def __str__(self):
-        return f"Reconciliation for {self.cash_drawer} on {self.recorded_at.date()}"
\ No newline at end of file
+        return f"Reconciliation for {self.cash_drawer} on {self.recorded_at.date()}"
+
+
+def record_cash_payment(payment, recorded_by=None):
+    """
+    post the cash a till payment brought in (what it paid of the order, not the change handed
+    back) as a sale on the open drawer of the order's cashier, or of `recorded_by` when the
+    order has none. Returns the movement, or None for non-cash payments and for cashiers
+    without an open drawer, i.e. shops that do not use drawers.
+    """
+    if (payment.payment_type or '').lower() != 'cash':
+        return None
+    amount = min(payment.amount_paid, payment.total_amount)
+    cashier_id = payment.order.cashier_id or getattr(recorded_by, 'pk', None)
+    if amount <= 0 or cashier_id is None:
+        return None
+    drawers = CashDrawer.objects.filter(status='open', cashier_id=cashier_id)
+    if payment.order.branch_id:
+        drawers = drawers.filter(branch_id=payment.order.branch_id)
+    drawer = drawers.order_by('-opened_at').first()
+    if drawer is None:
+        return None
+    return drawer.record_movement('sale', amount, reference=f"Order {payment.order.order_id}"[:100],
+                                  recorded_by=recorded_by)
+
+
+def drawer_metrics(cash_drawer, sign=1):
+    """
+    what an open drawer contributes to its branch's dashboard counters
+    """
+    is_open = cash_drawer.status == 'open'
+    return {
+        'branch_id': cash_drawer.branch_id,
+        'tenant_id': cash_drawer.tenant_id,
+        'open_drawers': sign if is_open else 0,
+        'open_drawer_balance': sign * cash_drawer.current_balance if is_open else 0,
+    }
+
+
+def expense_metrics(cash_expense, sign=1):
+    """
+    what an expense contributes to its branch's daily dashboard counters
+    """
+    return {
+        'branch_id': cash_expense.branch_id,
+        'tenant_id': cash_expense.tenant_id,
+        'date': timezone.localdate(cash_expense.recorded_at),
+        'expense_total': sign * cash_expense.amount,
+        'expense_count': sign,
+    }
\ No newline at end of file
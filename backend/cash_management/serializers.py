@@ -1,14 +1,17 @@
+from decimal import Decimal
 from rest_framework import serializers
 from .models import *
+from .analytics import BUCKETS, GROUPS
+from erp.lookups import CachedSlugRelatedField
 from multi_location.models import *
 from authentication.models import *
 
 class CashDrawerSerializer(serializers.ModelSerializer):
-    branch = serializers.SlugRelatedField(
+    branch = CachedSlugRelatedField(
         slug_field='branch_name', 
         queryset=Branch.objects.all()
     )
-    cashier = serializers.SlugRelatedField(
+    cashier = CachedSlugRelatedField(
         slug_field='username',  
         queryset=User.objects.all()
     )
@@ -16,20 +19,107 @@ class CashDrawerSerializer(serializers.ModelSerializer):
         model = CashDrawer
         fields = ['id','branch','cashier','opening_balance',
                   'current_balance','status','opened_at','closed_at','tenant']
-        read_only_fields = ['tenant']
+        read_only_fields = ['tenant','current_balance']
+
+    def update(self, instance, validated_data):
+        # the opening float is part of the drawer's journal and cannot be rewritten afterwards
+        validated_data.pop('opening_balance', None)
+        return super().update(instance, validated_data)
         
 class CashReconciliationSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = CashReconciliation
-        fields = ['id','cash_drawer','actual_cash_count','notes','recorded_at','tenant']
-        read_only_fields = ['tenant','recorded_at']
+        fields = ['id','cash_drawer','actual_cash_count','expected_cash','variance',
+                  'notes','recorded_at','tenant']
+        read_only_fields = ['tenant','recorded_at','expected_cash','variance']
+
+    def create(self, validated_data):
+        cash_drawer = validated_data['cash_drawer']
+        validated_data['expected_cash'] = cash_drawer.current_balance
+        validated_data['variance'] = validated_data['actual_cash_count'] - cash_drawer.current_balance
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        instance = super().update(instance, validated_data)
+        variance = instance.actual_cash_count - instance.expected_cash
+        if variance != instance.variance:
+            instance.variance = variance
+            instance.save(update_fields=['variance'])
+        return instance
+
+
+class CashCountSerializer(serializers.Serializer):
+    cash_drawer = serializers.IntegerField()
+    actual_cash_count = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'))
+
+
+class CashCloseSerializer(serializers.Serializer):
+    branch = CachedSlugRelatedField(
+        slug_field='branch_name',
+        queryset=Branch.objects.all(),
+        required=False
+    )
+    counts = CashCountSerializer(many=True)
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate_counts(self, counts):
+        drawer_ids = [count['cash_drawer'] for count in counts]
+        if len(set(drawer_ids)) != len(drawer_ids):
+            raise serializers.ValidationError("Each cash drawer can only be counted once.")
+        return counts
+
+
+class CashVarianceSerializer(serializers.ModelSerializer):
+    branch = serializers.CharField(source='cash_drawer.branch.branch_name', read_only=True)
+    cashier = serializers.CharField(source='cash_drawer.cashier.username', read_only=True, default=None)
+
+    class Meta:
+        model = CashReconciliation
+        fields = ['id','cash_drawer','branch','cashier','expected_cash','actual_cash_count',
+                  'variance','notes','recorded_at']
+        read_only_fields = fields
+
+
+class CashExpenseAnalyticsSerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    bucket = serializers.ChoiceField(choices=BUCKETS, default='week')
+    group_by = serializers.MultipleChoiceField(choices=GROUPS, required=False)
+    branch = CachedSlugRelatedField(
+        slug_field='branch_name',
+        queryset=Branch.objects.all(),
+        required=False
+    )
+    rollup = serializers.BooleanField(default=True)
+
+    def validate(self, attrs):
+        if attrs.get('start') and attrs.get('end') and attrs['start'] > attrs['end']:
+            raise serializers.ValidationError("The start date must not be after the end date.")
+        # query strings without group_by arrive as an empty selection rather than the default
+        attrs['group_by'] = attrs.get('group_by') or {'branch'}
+        return attrs
+
+
+class CashMovementSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = CashMovement
+        fields = ['id','cash_drawer','movement_type','amount','balance_after','reference',
+                  'cash_expense','recorded_by','recorded_at','tenant']
+        read_only_fields = fields
+
+
+class CashMovementCreateSerializer(serializers.Serializer):
+    movement_type = serializers.ChoiceField(choices=['sale', 'refund', 'float_top_up', 'drop'])
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0.01'))
+    reference = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
         
 class CashExpenseSerializer(serializers.ModelSerializer):
     cash_drawer = serializers.PrimaryKeyRelatedField(
         queryset=CashDrawer.objects.all()
     )
-    branch = serializers.SlugRelatedField(
+    branch = CachedSlugRelatedField(
         slug_field='branch_name',
         read_only=True
     )
@@ -40,5 +130,5 @@ class CashExpenseSerializer(serializers.ModelSerializer):
         
     def create(self,validated_data):
         cash_drawer = validated_data.get('cash_drawer')
-        validated_data['branch'] = cash_drawer.branch
+        validated_data['branch_id'] = cash_drawer.branch_id
         return super().create(validated_data)
\ No newline at end of file
@@ -1,3 +1,43 @@
-from django.test import TestCase
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
 
-# Create your tests here.
+from django_tenants.test.cases import TenantTestCase
+
+from multi_location.models import Branch, adjust_daily_metrics
+from .analytics import expense_breakdown
+from .models import CashExpense, expense_metrics
+
+
+class ExpenseBreakdownTests(TenantTestCase):
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Test Mart'
+        tenant.contact_person = 'Tester'
+        tenant.phone_number = '0700000000'
+
+    def setUp(self):
+        super().setUp()
+        branch = Branch.objects.create(branch_name='CBD', manager='M', address='A', city='Nairobi',
+                                       county='Nairobi', phone_number='0700000001', operating_hours='8-8',
+                                       tenant=self.tenant)
+        for day, amount in ((date(2026, 3, 2), '100'), (date(2026, 3, 4), '50'), (date(2026, 3, 10), '20')):
+            expense = CashExpense.objects.create(branch=branch, amount=Decimal(amount), description='Fuel',
+                                                 tenant=self.tenant)
+            recorded_at = datetime.combine(day, datetime.min.time(), dt_timezone.utc).replace(hour=9)
+            CashExpense.objects.filter(pk=expense.pk).update(recorded_at=recorded_at)
+            expense.recorded_at = recorded_at
+            adjust_daily_metrics([expense_metrics(expense)])
+
+    def test_the_rollup_and_the_expenses_give_the_same_breakdown(self):
+        for bucket in ('day', 'week', 'month'):
+            with self.subTest(bucket=bucket):
+                rollup = expense_breakdown(bucket=bucket, use_rollup=True)
+                raw = expense_breakdown(bucket=bucket, use_rollup=False)
+                self.assertEqual(rollup, raw)
+                self.assertTrue(all(type(row['bucket']) is date for row in raw))
+
+    def test_weeks_start_on_monday(self):
+        rows = expense_breakdown(bucket='week', group_by=())
+        self.assertEqual([(row['bucket'], row['total'], row['count']) for row in rows],
+                         [(date(2026, 3, 2), Decimal('150.00'), 2), (date(2026, 3, 9), Decimal('20.00'), 1)])
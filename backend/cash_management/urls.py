@@ -4,8 +4,11 @@ from .views import *
 urlpatterns = [
     path('cash_drawers/', CashDrawerListCreateAPIView.as_view(),name = 'cash_drawer'),
     path('cash_drawers/<int:pk>/', CashDrawerRetrieveUpdateDestroyAPIView.as_view(), name = 'cash_drawer_instance'),
+    path('cash_drawers/<int:pk>/movements/', CashMovementListCreateAPIView.as_view(), name = 'cash_drawer_movements'),
     path('cash_expenses/', CashExpenseListCreateAPIView.as_view(),name = 'cash_expense' ),
+    path('cash_expenses/analytics/', CashExpenseAnalyticsAPIView.as_view(), name = 'cash_expense_analytics'),
     path('cash_expenses/<int:pk>', CashExpenseRetrieveUpdateDestroyAPIView.as_view(), name = 'cash_expense_instance'),
     path('cash_reconciliations/', CashReconciliationListCreateAPIView.as_view(), name = 'cash_reconciliation'),
+    path('cash_reconciliations/close/', CashCloseAPIView.as_view(), name = 'cash_close'),
     path('cash_reconciliations/<int:pk>', CashReconciliationRetrieveUpdateDestroyAPIView.as_view(),name = 'cash_recon_instance'),
 ]
\ No newline at end of file
@@ -7,6 +7,10 @@ from .serializers import *
 from django.shortcuts import get_object_or_404
 from tenants.models import *
 from django.db import transaction
+from django.utils import timezone
+from multi_location.models import adjust_branch_metrics, adjust_daily_metrics
+from .end_of_day import close_drawers, variance_report
+from .analytics import expense_breakdown
 class CashDrawerListCreateAPIView(APIView):
     serializer_class = CashDrawerSerializer
     """
@@ -28,7 +32,10 @@ class CashDrawerListCreateAPIView(APIView):
         opened_at = request.data.get('opened_at')
         with transaction.atomic():
             if serializer.is_valid():
-                serializer.save(tenant = request.user.tenant)
+                cash_drawer = serializer.save(tenant = request.user.tenant, current_balance = 0)
+                adjust_branch_metrics([drawer_metrics(cash_drawer)])
+                if cash_drawer.opening_balance > 0:
+                    cash_drawer.record_movement('opening_float', cash_drawer.opening_balance, recorded_by=request.user)
                 ActivityLogs.objects.create(
                         tenant=request.user.tenant,
                         action_type='cash_drawer_created',
@@ -60,9 +67,15 @@ class CashDrawerRetrieveUpdateDestroyAPIView(APIView):
     """
     def put(self, request, pk):
         cash_drawer = self.get_object(pk)
-        serializer = self.serializer_class(cash_drawer, data = serializer.data, partial = True)
+        serializer = self.serializer_class(cash_drawer, data = request.data, partial = True)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                before = drawer_metrics(cash_drawer, sign=-1)
+                if serializer.validated_data.get('status') == 'closed' and not serializer.validated_data.get('closed_at'):
+                    cash_drawer = serializer.save(closed_at = timezone.now())
+                else:
+                    cash_drawer = serializer.save()
+                adjust_branch_metrics([before, drawer_metrics(cash_drawer)])
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
     
@@ -72,10 +85,38 @@ class CashDrawerRetrieveUpdateDestroyAPIView(APIView):
     def delete(self,request, pk):
         cash_drawer = self.get_object(pk)
         if cash_drawer:
-            cash_drawer.delete()
+            with transaction.atomic():
+                adjust_branch_metrics([drawer_metrics(cash_drawer, sign=-1)])
+                cash_drawer.delete()
             return Response("Cash Drawer deleted", status=status.HTTP_204_NO_CONTENT)
         return Response('Cash Drawer does not exist')
     
+class CashMovementListCreateAPIView(APIView):
+    serializer_class = CashMovementSerializer
+    """
+    GET METHOD: To get the cash journal of a drawer
+    """
+
+    def get(self, request, pk):
+        cash_drawer = get_object_or_404(CashDrawer, pk=pk)
+        serializer = self.serializer_class(cash_drawer.movements.all(), many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    """
+    POST METHOD: To record a sale, refund, float top-up or cash drop against a drawer
+    """
+
+    def post(self, request, pk):
+        cash_drawer = get_object_or_404(CashDrawer, pk=pk)
+        serializer = CashMovementCreateSerializer(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            movement = cash_drawer.record_movement(recorded_by=request.user, **serializer.validated_data)
+        except CashDrawerError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.serializer_class(movement).data, status=status.HTTP_201_CREATED)
+    
 ## APIs FOR CASH RECONCILITION
 
 
@@ -108,6 +149,49 @@ class CashReconciliationListCreateAPIView(APIView):
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
+class CashCloseAPIView(APIView):
+    serializer_class = CashCloseSerializer
+    """
+    GET METHOD: To get the day's reconciliations ranked by the size of their variance
+    (?date=YYYY-MM-DD defaults to today, ?branch=<branch name> narrows it to one branch)
+    """
+
+    def get(self, request):
+        date = request.query_params.get('date') or timezone.localdate()
+        cash_reconciliations = CashReconciliation.objects.filter(recorded_at__date=date)
+        branch = request.query_params.get('branch')
+        if branch:
+            cash_reconciliations = cash_reconciliations.filter(cash_drawer__branch__branch_name=branch)
+        serializer = CashVarianceSerializer(variance_report(cash_reconciliations), many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    """
+    POST METHOD: To close every open cash drawer of a branch (or of the whole tenant when no
+    branch is given) against the cash counted in each, and get back the variance report
+    """
+
+    def post(self, request):
+        serializer = self.serializer_class(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        cash_drawers = CashDrawer.objects.all()
+        if data.get('branch'):
+            cash_drawers = cash_drawers.filter(branch=data['branch'])
+        counts = {count['cash_drawer']: count['actual_cash_count'] for count in data['counts']}
+        with transaction.atomic():
+            report = close_drawers(cash_drawers, counts, notes=data['notes'])
+            closed = sum(1 for entry in report if entry['status'] == 'closed')
+            if closed:
+                ActivityLogs.objects.create(
+                                tenant=request.user.tenant,
+                                action_type='cash_recon_created',
+                                message=f'End of day close: {closed} cash drawers reconciled'
+                                        f'{" at " + data["branch"].branch_name if data.get("branch") else ""}.'
+                        )
+        return Response({'closed': closed, 'report': report}, status=status.HTTP_200_OK)
+
+
 class CashReconciliationRetrieveUpdateDestroyAPIView(APIView):
     serializer_class = CashReconciliationSerializer
     """
@@ -144,7 +228,7 @@ class CashReconciliationRetrieveUpdateDestroyAPIView(APIView):
     DELETE METHOD: To dlete a single cash recon instance by its ID
     """
     
-    def delete(self,pk):
+    def delete(self, request, pk):
         cash_reconciliation = self.get_object(pk)
         if not cash_reconciliation:
             return Response("Cash Reconcilaition does not exist", status = status.HTTP_404_NOT_FOUND)
@@ -174,17 +258,49 @@ class CashExpenseListCreateAPIView(APIView):
     def post(self, request):
         amount = request.data.get('amount')
         serializer = self.serializer_class(data = request.data)
-        with transaction.atomic():
-            if serializer.is_valid():
-                serializer.save(tenant = request.user.tenant)
-                ActivityLogs.objects.create(
-                                    tenant=request.user.tenant,
-                                    action_type='cash_expense_created',
-                                    message=f'Cash expense of {amount}  has been recorded.'
-                            )
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            return Response(serializer.errors,status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                if serializer.is_valid():
+                    cash_expense = serializer.save(tenant = request.user.tenant)
+                    if cash_expense.cash_drawer is not None:
+                        cash_expense.cash_drawer.record_movement(
+                            'expense', cash_expense.amount, reference=f'Expense #{cash_expense.pk}',
+                            recorded_by=request.user, cash_expense=cash_expense,
+                        )
+                    adjust_daily_metrics([expense_metrics(cash_expense)])
+                    ActivityLogs.objects.create(
+                                        tenant=request.user.tenant,
+                                        action_type='cash_expense_created',
+                                        message=f'Cash expense of {amount}  has been recorded.'
+                                )
+                    return Response(serializer.data, status=status.HTTP_201_CREATED)
+                return Response(serializer.errors,status=status.HTTP_400_BAD_REQUEST)
+        except CashDrawerError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
+class CashExpenseAnalyticsAPIView(APIView):
+    serializer_class = CashExpenseAnalyticsSerializer
+    """
+    GET METHOD: To get spend per day, week, month or year broken down by branch and/or drawer,
+    e.g. ?start=2025-01-01&bucket=week&group_by=branch&group_by=drawer
+    """
+
+    def get(self, request):
+        serializer = self.serializer_class(data = request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        breakdown = expense_breakdown(
+            start=data.get('start'),
+            end=data.get('end'),
+            bucket=data['bucket'],
+            group_by=data['group_by'],
+            branch=data.get('branch'),
+            use_rollup=data['rollup'],
+        )
+        return Response(breakdown, status=status.HTTP_200_OK)
+
+
 class CashExpenseRetrieveUpdateDestroyAPIView(APIView):
     serializer_class = CashExpenseSerializer
     """
@@ -210,7 +326,26 @@ class CashExpenseRetrieveUpdateDestroyAPIView(APIView):
         cash_expense = self.get_object(pk)
         serializer = self.serializer_class(cash_expense, data= request.data, partial = True)
         if serializer.is_valid():
-            serializer.save()
+            try:
+                with transaction.atomic():
+                    before = expense_metrics(cash_expense, sign=-1)
+                    previous_drawer, previous_amount = cash_expense.cash_drawer, cash_expense.amount
+                    cash_expense = serializer.save()
+                    if (previous_drawer, previous_amount) != (cash_expense.cash_drawer, cash_expense.amount):
+                        reference = f'Expense #{cash_expense.pk} edited'
+                        if previous_drawer is not None:
+                            previous_drawer.record_movement('expense_reversal', previous_amount, reference=reference,
+                                                            recorded_by=request.user, cash_expense=cash_expense,
+                                                            correction=True)
+                        if cash_expense.cash_drawer is not None:
+                            # re-amounting an expense corrects its (maybe closed) drawer; moving it needs an open one
+                            correction = cash_expense.cash_drawer == previous_drawer
+                            cash_expense.cash_drawer.record_movement('expense', cash_expense.amount, reference=reference,
+                                                                     recorded_by=request.user, cash_expense=cash_expense,
+                                                                     correction=correction)
+                    adjust_daily_metrics([before, expense_metrics(cash_expense)])
+            except CashDrawerError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -218,10 +353,19 @@ class CashExpenseRetrieveUpdateDestroyAPIView(APIView):
     DELETE METHOD:To delete a particular cash expense
     """
     
-    def delete(self, pk):
+    def delete(self, request, pk):
         cash_expense = self.get_object(pk)
         if not cash_expense:
             return Response('Cash Expense does not exist', status=status.HTTP_404_NOT_FOUND)
-        cash_expense.delete()
+        try:
+            with transaction.atomic():
+                if cash_expense.cash_drawer is not None:
+                    cash_expense.cash_drawer.record_movement('expense_reversal', cash_expense.amount,
+                                                             reference=f'Expense #{cash_expense.pk} deleted',
+                                                             recorded_by=request.user, correction=True)
+                adjust_daily_metrics([expense_metrics(cash_expense, sign=-1)])
+                cash_expense.delete()
+        except CashDrawerError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         return Response('Cash expense deleted succssfully', status=status.HTTP_204_NO_CONTENT)
         
\ No newline at end of file
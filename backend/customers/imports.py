@@ -0,0 +1,165 @@
+"""
+Bulk customer import, e.g. the loyalty list of an acquired store.
+
+The file is read one row at a time. Every row is normalized (emails trimmed and lower
+cased, phones through `normalize_phone`, names with collapsed whitespace) and checked
+against in-memory hash indexes of the emails and phones already seen, so a customer listed
+twice in the file is loaded once: the first row wins and later ones count as duplicates.
+
+Rows are then written in batches. Per batch, one query finds the customers already on
+file with the same email (case-insensitively, on the UPPER(email) index) or the same
+phone (on the phone_normalized index). A row matching an existing customer is merged
+into it: values in the file replace the stored ones, blank cells keep them, and a row
+matched on the phone alone keeps the stored email. The batch is then upserted with
+`bulk_create(update_conflicts=True)` on the unique email, so a batch costs two queries
+however many of its rows are new.
+"""
+import csv
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Upper
+
+from .models import Customer, TIERS, normalize_phone
+
+HEADER_ALIASES = {
+    'full_name': ('full name', 'full_name', 'name', 'customer name', 'customer'),
+    'email': ('email', 'email address', 'e-mail'),
+    'phone_number': ('phone', 'phone number', 'phone_number', 'mobile', 'msisdn'),
+    'address': ('address', 'location'),
+    'membership_tier': ('membership tier', 'membership_tier', 'tier'),
+}
+MERGE_FIELDS = ['full_name', 'phone_number', 'phone_normalized', 'address', 'membership_tier']
+BATCH_SIZE = 2000
+# shorter numbers are too partial to say two customers are the same person
+MIN_MATCH_DIGITS = 9
+# how many rejected rows the report lists; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+class CustomerImportError(Exception):
+    """
+    raised when a customer file cannot be read
+    """
+
+
+def _field_length(name):
+    return Customer._meta.get_field(name).max_length
+
+
+def _match_phone(row):
+    phone = row['phone_normalized']
+    return phone if len(phone) >= MIN_MATCH_DIGITS else None
+
+
+def read_customers(handle):
+    """
+    yield (row number, normalized customer dict or None, error) for every data row
+    """
+    reader = csv.reader(handle)
+    header = next(reader, None)
+    cells = [cell.strip().lower() for cell in header or []]
+    columns = {
+        name: next((cells.index(alias) for alias in aliases if alias in cells), None)
+        for name, aliases in HEADER_ALIASES.items()
+    }
+    if columns['email'] is None:
+        raise CustomerImportError("The file has no email column.")
+    tiers = {tier for tier, _ in TIERS}
+
+    for number, row in enumerate(reader, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+
+        def cell(name):
+            index = columns[name]
+            return ' '.join(row[index].split()) if index is not None and index < len(row) else ''
+
+        email = cell('email').lower()
+        try:
+            validate_email(email)
+        except ValidationError:
+            yield number, None, f"Invalid email {email!r}." if email else "No email."
+            continue
+        phone = cell('phone_number')
+        tier = cell('membership_tier').lower()
+        yield number, {
+            'email': email,
+            'full_name': cell('full_name')[:_field_length('full_name')],
+            'phone_number': phone[:_field_length('phone_number')],
+            'phone_normalized': normalize_phone(phone)[:_field_length('phone_normalized')],
+            'address': cell('address')[:_field_length('address')],
+            'membership_tier': tier if tier in tiers else '',
+        }, None
+
+
+def _write_batch(batch, tenant_id, report, claimed):
+    emails = [row['email'] for row in batch]
+    phones = [phone for phone in map(_match_phone, batch) if phone]
+    existing = Customer.objects.annotate(email_upper=Upper('email')).filter(
+        Q(email_upper__in=[email.upper() for email in emails]) | Q(phone_normalized__in=phones)
+    ).values('email', 'email_upper', *MERGE_FIELDS)
+    by_email, by_phone = {}, {}
+    for customer in existing:
+        by_email[customer['email_upper']] = customer
+        if customer['phone_normalized']:
+            by_phone.setdefault(customer['phone_normalized'], customer)
+
+    customers = []
+    for row in batch:
+        match = by_email.get(row['email'].upper())
+        matched_on = 'email'
+        if match is None and _match_phone(row):
+            match = by_phone.get(_match_phone(row))
+            matched_on = 'phone'
+        if match is not None and match['email'] in claimed:
+            # an earlier row of the file already went to this stored customer
+            report['duplicates'] += 1
+            continue
+        if match is None:
+            report['created'] += 1
+            values = row
+        else:
+            report['updated' if matched_on == 'email' else 'merged_by_phone'] += 1
+            claimed.add(match['email'])
+            values = {field: row[field] or match[field] for field in MERGE_FIELDS}
+            values['email'] = match['email']
+        customers.append(Customer(tenant_id=tenant_id, **{**values, 'membership_tier': values['membership_tier'] or None}))
+
+    Customer.objects.bulk_create(customers, update_conflicts=True, unique_fields=['email'],
+                                 update_fields=[*MERGE_FIELDS, 'updated_at'])
+
+
+def import_customers(handle, tenant_id, batch_size=BATCH_SIZE):
+    """
+    load a customer CSV (a text file object) and return the merge report: how many rows
+    were read, created, updated on a matching email, merged into a customer with the same
+    phone, skipped as duplicates or rejected, with the first rejections listed
+    """
+    report = dict.fromkeys(('rows', 'created', 'updated', 'merged_by_phone', 'duplicates', 'invalid'), 0)
+    report['errors'] = []
+    seen_emails, seen_phones, claimed, batch = set(), set(), set(), []
+    with transaction.atomic():
+        for number, row, error in read_customers(handle):
+            report['rows'] += 1
+            if error:
+                report['invalid'] += 1
+                if len(report['errors']) < MAX_REPORTED_ERRORS:
+                    report['errors'].append({'row': number, 'error': error})
+                continue
+            phone = _match_phone(row)
+            if row['email'] in seen_emails or (phone and phone in seen_phones):
+                report['duplicates'] += 1
+                continue
+            seen_emails.add(row['email'])
+            if phone:
+                seen_phones.add(phone)
+            batch.append(row)
+            if len(batch) >= batch_size:
+                _write_batch(batch, tenant_id, report, claimed)
+                batch.clear()
+        if batch:
+            _write_batch(batch, tenant_id, report, claimed)
+    return report
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from customers.imports import CustomerImportError, import_customers
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a customer CSV, merging rows into customers already on file with the same email "
+        "or phone. Run per tenant, e.g. `manage.py tenant_command import_customers customers.csv "
+        "--schema=<tenant>`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="Path of the customer CSV.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['file'], encoding='utf-8-sig', newline='') as handle:
+                report = import_customers(handle, connection.tenant.pk, batch_size=options['batch_size'])
+        except (OSError, UnicodeDecodeError, CustomerImportError) as e:
+            raise CommandError(str(e))
+        for error in report['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['rows']} rows: {report['created']} customers created, {report['updated']} updated, "
+            f"{report['merged_by_phone']} merged on phone, {report['duplicates']} duplicates, "
+            f"{report['invalid']} rejected."
+        ))
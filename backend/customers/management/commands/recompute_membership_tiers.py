@@ -0,0 +1,28 @@
+from datetime import date, datetime, time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from customers.tiers import recompute_membership_tiers
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every customer's membership tier from their spend over the last 12 months. "
+        "Run nightly per tenant, e.g. from cron: "
+        "`manage.py tenant_command recompute_membership_tiers --schema=<tenant>`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat,
+                            help="Count spend up to the end of this day (YYYY-MM-DD) instead of now.")
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options['date']:
+            as_of = timezone.make_aware(datetime.combine(options['date'], time.max))
+        result = recompute_membership_tiers(as_of, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {result['checked']} customers, moved {result['updated']} to a new tier."
+        ))
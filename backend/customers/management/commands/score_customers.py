@@ -0,0 +1,26 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from customers.stats import rebuild_customer_stats, score_customers
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every customer's RFM scores and segment. Run nightly per tenant, e.g. from cron: "
+        "`manage.py tenant_command score_customers --schema=<tenant>`. With --rebuild the purchase "
+        "stats are first recomputed from the orders and invoices, e.g. after loading sales directly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help="Score as of this day (YYYY-MM-DD).")
+        parser.add_argument('--rebuild', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            customers = rebuild_customer_stats()
+            self.stdout.write(f"Rebuilt the stats of {customers} customers.")
+        result = score_customers(options['date'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {result['scored']} customers, {result['updated']} changed."
+        ))
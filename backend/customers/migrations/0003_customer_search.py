@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:55
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def fill_phone_normalized(apps, schema_editor):
+    from customers.models import normalize_phone
+
+    Customer = apps.get_model('customers', 'Customer')
+    batch = []
+    for customer in Customer.objects.only('phone_number').iterator(chunk_size=2000):
+        customer.phone_normalized = normalize_phone(customer.phone_number)
+        batch.append(customer)
+        if len(batch) >= 2000:
+            Customer.objects.bulk_update(batch, ['phone_normalized'])
+            batch = []
+    Customer.objects.bulk_update(batch, ['phone_normalized'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0002_alter_customer_membership_tier_delete_membershiptier'),
+        ('tenants', '0008_alter_activitylogs_action_type'),
+    ]
+
+    operations = [
+        # in public, which is on every tenant's search path; created from a tenant schema
+        # the extension would land in that schema and be invisible to the others
+        migrations.RunSQL('CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public', migrations.RunSQL.noop),
+        migrations.AddField(
+            model_name='customer',
+            name='phone_normalized',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('full_name'), name='gin_trgm_ops'), name='customer_name_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('full_name'), name='text_pattern_ops'), name='customer_name_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('email'), name='text_pattern_ops'), name='customer_email_prefix_idx'),
+        ),
+        migrations.RunPython(fill_phone_normalized, migrations.RunPython.noop),
+    ]
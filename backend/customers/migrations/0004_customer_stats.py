@@ -0,0 +1,71 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def seed_customer_stats(apps, schema_editor):
+    """
+    stats for the sales made before they were kept: completed orders and paid invoices,
+    one grouped query each
+    """
+    Order = apps.get_model('products', 'Order')
+    Invoice = apps.get_model('invoice', 'Invoice')
+    CustomerStats = apps.get_model('customers', 'CustomerStats')
+    stats = {}
+    sources = [
+        Order.objects.filter(status='completed', customer__isnull=False)
+        .values('customer_id', 'tenant_id')
+        .annotate(first=Min('timestamp__date'), last=Max('timestamp__date'), count=Count('id'), spend=Sum('total_amount')),
+        Invoice.objects.filter(outstanding=0, customer__isnull=False)
+        .values('customer_id', 'tenant_id')
+        .annotate(first=Min('invoice_date'), last=Max('invoice_date'), count=Count('id'), spend=Sum('total_amount')),
+    ]
+    for source in sources:
+        for row in source.order_by().iterator():
+            current = stats.get(row['customer_id'])
+            if current is None:
+                stats[row['customer_id']] = CustomerStats(
+                    customer_id=row['customer_id'], first_purchase=row['first'], last_purchase=row['last'],
+                    purchases_count=row['count'], total_spend=row['spend'] or 0, tenant_id=row['tenant_id'],
+                )
+                continue
+            current.first_purchase = min(filter(None, (current.first_purchase, row['first'])), default=None)
+            current.last_purchase = max(filter(None, (current.last_purchase, row['last'])), default=None)
+            current.purchases_count += row['count']
+            current.total_spend += row['spend'] or 0
+    CustomerStats.objects.bulk_create(stats.values(), batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0003_customer_search'),
+        ('invoice', '0006_stored_line_totals'),
+        ('products', '0012_order_customer'),
+        ('tenants', '0008_alter_activitylogs_action_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_purchase', models.DateField(blank=True, null=True)),
+                ('last_purchase', models.DateField(blank=True, null=True)),
+                ('purchases_count', models.IntegerField(default=0)),
+                ('total_spend', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('recency_score', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('frequency_score', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('monetary_score', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('segment', models.CharField(blank=True, choices=[('champions', 'Champions'), ('loyal', 'Loyal'), ('potential_loyalist', 'Potential Loyalist'), ('new', 'New'), ('need_attention', 'Need Attention'), ('at_risk', 'At Risk'), ('hibernating', 'Hibernating')], max_length=20)),
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='customers.customer')),
+                ('tenant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='tenants.tenant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['segment', '-id'], name='customers_c_segment_6c8720_idx')],
+            },
+        ),
+        migrations.RunPython(seed_customer_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:11
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0004_customer_stats'),
+        ('tenants', '0008_alter_activitylogs_action_type'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass('phone_normalized', name='gin_trgm_ops'), name='customer_phone_trgm_idx'),
+        ),
+    ]
@@ -1,6 +1,23 @@
+import re
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
 
 # Create your models here.
+def normalize_phone(value):
+    """
+    digits only, in international form: 0712 345 678, +254 712 345 678 and 254712345678 all
+    become 254712345678. Partial numbers normalize the same way, so prefixes still match.
+    """
+    digits = re.sub(r'\D', '', value or '')
+    if digits.startswith('0'):
+        digits = '254' + digits[1:]
+    elif len(digits) == 9 and digits[0] in '17':
+        digits = '254' + digits
+    return digits
+
+
 TIERS = [
     ('regular','Regular'),
     ('silver','Silver'),
@@ -13,6 +30,7 @@ class Customer(models.Model):
     full_name = models.CharField(max_length=100)
     email = models.EmailField(unique=True)
     phone_number = models.CharField(max_length=20)
+    phone_normalized = models.CharField(max_length=20, blank=True, db_index=True, editable=False)
     address = models.CharField(max_length=100)
     membership_tier = models.CharField(max_length=100, choices=TIERS,null=True)
     member_since = models.DateField(auto_now_add=True)
@@ -20,9 +38,68 @@ class Customer(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True, blank=True, null=True)
     tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE)
-    
-    
+
+    class Meta:
+        indexes = [
+            # substring search on names (UPPER(full_name) LIKE '%...%'), via pg_trgm
+            GinIndex(OpClass(Upper('full_name'), name='gin_trgm_ops'), name='customer_name_trgm_idx'),
+            # digits from anywhere in a phone number (phone_normalized LIKE '%...%')
+            GinIndex(OpClass('phone_normalized', name='gin_trgm_ops'), name='customer_phone_trgm_idx'),
+            # prefix search on names and emails (UPPER(...) LIKE '...%')
+            models.Index(OpClass(Upper('full_name'), name='text_pattern_ops'), name='customer_name_prefix_idx'),
+            models.Index(OpClass(Upper('email'), name='text_pattern_ops'), name='customer_email_prefix_idx'),
+        ]
+
     def __str__(self):
         return self.full_name
-    
-    
\ No newline at end of file
+
+    def save(self, *args, **kwargs):
+        self.phone_normalized = normalize_phone(self.phone_number)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone_number' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'phone_normalized'}
+        super().save(*args, **kwargs)
+
+
+SEGMENTS = [
+    ('champions', 'Champions'),
+    ('loyal', 'Loyal'),
+    ('potential_loyalist', 'Potential Loyalist'),
+    ('new', 'New'),
+    ('need_attention', 'Need Attention'),
+    ('at_risk', 'At Risk'),
+    ('hibernating', 'Hibernating'),
+]
+
+
+class CustomerStats(models.Model):
+    """
+    what a customer has bought so far, added onto as orders complete and invoices are paid
+    so lifetime value never needs a pass over the sales tables. The recency, frequency and
+    monetary scores (1 to 5, 5 best) and the segment are set by the nightly scoring job.
+    """
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, related_name='stats')
+    first_purchase = models.DateField(null=True, blank=True)
+    last_purchase = models.DateField(null=True, blank=True)
+    purchases_count = models.IntegerField(default=0)
+    total_spend = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    recency_score = models.PositiveSmallIntegerField(null=True, blank=True)
+    frequency_score = models.PositiveSmallIntegerField(null=True, blank=True)
+    monetary_score = models.PositiveSmallIntegerField(null=True, blank=True)
+    segment = models.CharField(max_length=20, choices=SEGMENTS, blank=True)
+    tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # a segment's customers a page at a time, as the cursor pagination reads them
+            models.Index(fields=['segment', '-id']),
+        ]
+
+    def __str__(self):
+        return f'Stats for customer {self.customer_id}'
+
+    @property
+    def average_basket(self):
+        if self.purchases_count > 0:
+            return self.total_spend / self.purchases_count
+        return 0
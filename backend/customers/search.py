@@ -0,0 +1,59 @@
+"""
+Customer lookup for the till.
+
+The query decides which index answers it, so every lookup is an index scan that stops
+after `limit` rows instead of a pass over the customer table:
+
+* digits (spaces, dashes and a leading + allowed) starting like a whole number (0..., 254...
+  or +...): prefix of the normalized phone number, on the phone_normalized pattern index;
+  any other run of digits (e.g. the middle of a number) is a fragment found anywhere in the
+  number through the phone_normalized pg_trgm GIN index, numbers starting with it first;
+* anything with an @: prefix of the email, on the UPPER(email) pattern index;
+* anything else: the name. Short queries match the start of the name (UPPER(full_name)
+  pattern index), longer ones match anywhere in it through the pg_trgm GIN index; names
+  starting with the query come first.
+"""
+import re
+
+from django.db.models import Case, IntegerField, Value, When
+
+from .models import Customer, normalize_phone
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 50
+MIN_PHONE_DIGITS = 3
+# pg_trgm needs three characters to narrow anything down
+MIN_TRIGRAM_LENGTH = 3
+RESULT_FIELDS = ['id', 'full_name', 'email', 'phone_number', 'membership_tier', 'is_active']
+
+
+def search_customers(query, limit=SEARCH_LIMIT):
+    query = (query or '').strip()
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    if not query:
+        return Customer.objects.none()
+
+    customers = Customer.objects.only(*RESULT_FIELDS)
+    if re.fullmatch(r'\+?[\d\s-]+', query):
+        digits = re.sub(r'\D', '', query)
+        if len(digits) < MIN_PHONE_DIGITS:
+            return Customer.objects.none()
+        normalized = normalize_phone(query)
+        if query.startswith('+') or digits.startswith(('0', '254')) or normalized != digits:
+            return customers.filter(phone_normalized__startswith=normalized).order_by('phone_normalized')[:limit]
+        return (
+            customers.filter(phone_normalized__contains=digits)
+            .annotate(prefix=Case(When(phone_normalized__startswith=digits, then=Value(0)), default=Value(1),
+                                  output_field=IntegerField()))
+            .order_by('prefix', 'phone_normalized')[:limit]
+        )
+    if '@' in query:
+        return customers.filter(email__istartswith=query).order_by('email')[:limit]
+    if len(query) < MIN_TRIGRAM_LENGTH:
+        return customers.filter(full_name__istartswith=query).order_by('full_name')[:limit]
+    return (
+        customers.filter(full_name__icontains=query)
+        .annotate(prefix=Case(When(full_name__istartswith=query, then=Value(0)), default=Value(1),
+                              output_field=IntegerField()))
+        .order_by('prefix', 'full_name')[:limit]
+    )
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import *
+from .search import MAX_SEARCH_LIMIT, SEARCH_LIMIT
 
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -10,4 +11,40 @@ class CustomerSerializer(serializers.ModelSerializer):
         model = Customer
         fields = ['id','full_name','email','phone_number','address','membership_tier',
                   'member_since','last_visit','updated_at','tenant','is_active']
-        read_only_fields = ['tenant']
\ No newline at end of file
+        read_only_fields = ['tenant']
+
+
+class CustomerSearchResultSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Customer
+        fields = ['id','full_name','email','phone_number','membership_tier','is_active']
+        read_only_fields = fields
+
+
+class CustomerSearchSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=100)
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_SEARCH_LIMIT, default=SEARCH_LIMIT)
+
+
+class MembershipTierRunSerializer(serializers.Serializer):
+    as_of = serializers.DateTimeField(required=False)
+
+
+class CustomerImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+
+
+class CustomerStatsSerializer(serializers.ModelSerializer):
+    full_name = serializers.CharField(source='customer.full_name', read_only=True)
+    average_basket = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = CustomerStats
+        fields = ['customer','full_name','first_purchase','last_purchase','purchases_count','total_spend',
+                  'average_basket','recency_score','frequency_score','monetary_score','segment']
+        read_only_fields = fields
+
+
+class CustomerSegmentFilterSerializer(serializers.Serializer):
+    segment = serializers.ChoiceField(choices=SEGMENTS, required=False)
@@ -0,0 +1,165 @@
+"""
+Customer lifetime value and RFM (recency, frequency, monetary) segments.
+
+CustomerStats holds one row per customer who has bought anything: first and last purchase,
+number of purchases and total spend. It is added onto as sales happen, a completed order
+or a fully paid invoice being one purchase each, with one INSERT ... ON CONFLICT statement
+(`upsert_increment`), so lifetime value is always a single-row read.
+
+Scores are relative to the other customers, so they are recomputed for everyone by a
+nightly batch (`score_customers`): the stats are read into numpy arrays once, each measure
+is ranked into quintiles and the segment follows from the three scores, all as array
+operations. Only rows whose scores changed are written back. Listing a segment is then an
+indexed read on (segment, -id).
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.utils import timezone
+
+from erp.db import update_columns, upsert_increment
+from .models import CustomerStats
+
+STATS_COUNTERS = ['purchases_count', 'total_spend']
+BATCH_SIZE = 5000
+
+# (segment, test on the recency, frequency and monetary scores), the first match wins;
+# customers matching none need attention
+SEGMENT_RULES = [
+    ('champions', lambda r, f, m: (r >= 4) & (f >= 4)),
+    ('loyal', lambda r, f, m: (r >= 3) & (f >= 4)),
+    ('potential_loyalist', lambda r, f, m: (r >= 4) & (f >= 2)),
+    ('new', lambda r, f, m: r >= 4),
+    ('at_risk', lambda r, f, m: (r <= 2) & ((f >= 3) | (m >= 4))),
+    ('hibernating', lambda r, f, m: r <= 2),
+]
+
+
+def record_purchases(purchases, sign=1):
+    """
+    add (sign=1) or take off (sign=-1) purchases, given as (customer id, day, amount,
+    tenant id) tuples, from their customers' stats. Taking a purchase off leaves the first
+    and last purchase dates as they are.
+    """
+    rows = [{
+        'customer_id': customer_id,
+        'first_purchase': day if sign > 0 else None,
+        'last_purchase': day if sign > 0 else None,
+        'purchases_count': sign,
+        'total_spend': sign * amount,
+        'tenant_id': tenant_id,
+    } for customer_id, day, amount, tenant_id in purchases if customer_id]
+    return upsert_increment(CustomerStats, rows, keys=['customer_id'], add=STATS_COUNTERS,
+                            greatest=['last_purchase'], least=['first_purchase'])
+
+
+def record_paid_invoices(invoices, sign=1):
+    """
+    count invoices (dicts with customer_id, invoice_date, total_amount and tenant_id) that
+    have just been paid in full, or taken off again with sign=-1
+    """
+    today = timezone.localdate()
+    return record_purchases([
+        (invoice['customer_id'], invoice['invoice_date'] or today, invoice['total_amount'], invoice['tenant_id'])
+        for invoice in invoices
+    ], sign)
+
+
+def rebuild_customer_stats():
+    """
+    recompute every customer's stats from the completed orders and paid invoices, e.g.
+    after loading sales directly; scores are cleared until the next scoring run
+    """
+    from invoice.models import Invoice
+    from products.models import Order
+
+    sources = [
+        Order.objects.filter(status='completed', customer__isnull=False)
+        .values('customer_id', 'tenant_id')
+        .annotate(first=Min('timestamp__date'), last=Max('timestamp__date'), count=Count('id'),
+                  spend=Sum('total_amount')),
+        Invoice.objects.filter(outstanding=0, customer__isnull=False)
+        .values('customer_id', 'tenant_id')
+        .annotate(first=Min('invoice_date'), last=Max('invoice_date'), count=Count('id'),
+                  spend=Sum('total_amount')),
+    ]
+    with transaction.atomic():
+        CustomerStats.objects.all().delete()
+        for source in sources:
+            batch = []
+            for row in source.order_by().iterator(chunk_size=BATCH_SIZE):
+                batch.append({
+                    'customer_id': row['customer_id'], 'first_purchase': row['first'],
+                    'last_purchase': row['last'], 'purchases_count': row['count'],
+                    'total_spend': row['spend'] or 0, 'tenant_id': row['tenant_id'],
+                })
+                if len(batch) >= BATCH_SIZE:
+                    upsert_increment(CustomerStats, batch, keys=['customer_id'], add=STATS_COUNTERS,
+                                     greatest=['last_purchase'], least=['first_purchase'])
+                    batch = []
+            upsert_increment(CustomerStats, batch, keys=['customer_id'], add=STATS_COUNTERS,
+                             greatest=['last_purchase'], least=['first_purchase'])
+    return CustomerStats.objects.count()
+
+
+def quintiles(values):
+    """
+    score every value 1 to 5 by where it ranks among the others, higher values scoring
+    higher. Equal values share a score, taken at the middle of their rank range, so a
+    measure where most customers tie (one purchase each) does not push the ties up.
+    """
+    if not len(values):
+        return np.zeros(0, dtype=np.int16)
+    distinct, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    middle = (np.cumsum(counts) - counts / 2) / len(values)
+    return np.minimum(np.floor(middle * 5).astype(np.int16) + 1, 5)[inverse]
+
+
+def segments(recency, frequency, monetary):
+    names = [name for name, _ in SEGMENT_RULES]
+    tests = [test(recency, frequency, monetary) for _, test in SEGMENT_RULES]
+    return np.select(tests, names, default='need_attention')
+
+
+def score_customers(as_of=None):
+    """
+    recompute the RFM scores and segment of every customer with purchases, as of `as_of`
+    (today by default); returns the number of customers scored and of rows changed
+    """
+    as_of = as_of or timezone.localdate()
+    rows = list(
+        CustomerStats.objects.filter(purchases_count__gt=0, last_purchase__isnull=False)
+        .values_list('id', 'last_purchase', 'purchases_count', 'total_spend',
+                     'recency_score', 'frequency_score', 'monetary_score', 'segment')
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    with transaction.atomic():
+        # customers whose purchases were all taken off again drop out of the segments
+        cleared = CustomerStats.objects.filter(Q(purchases_count__lte=0) | Q(last_purchase__isnull=True)).exclude(
+            segment='',
+        ).update(recency_score=None, frequency_score=None, monetary_score=None, segment='')
+        if not rows:
+            return {'scored': 0, 'updated': cleared}
+
+        ids, last, count, spend, old_r, old_f, old_m, old_segment = zip(*rows)
+        ids = np.array(ids, dtype=np.int64)
+        days_since = as_of.toordinal() - np.array([day.toordinal() for day in last], dtype=np.int64)
+        recency = quintiles(-days_since)
+        frequency = quintiles(np.array(count, dtype=np.int64))
+        monetary = quintiles(np.array(spend, dtype=np.float64))
+        segment = segments(recency, frequency, monetary)
+
+        changed = (
+            (recency != np.array([score or 0 for score in old_r]))
+            | (frequency != np.array([score or 0 for score in old_f]))
+            | (monetary != np.array([score or 0 for score in old_m]))
+            | (segment != np.array(old_segment, dtype=object))
+        )
+        updated = update_columns(CustomerStats, 'id', {
+            'id': ids[changed].tolist(),
+            'recency_score': recency[changed].tolist(),
+            'frequency_score': frequency[changed].tolist(),
+            'monetary_score': monetary[changed].tolist(),
+            'segment': segment[changed].tolist(),
+        })
+    return {'scored': len(rows), 'updated': updated + cleared}
@@ -1,3 +1,283 @@
-from django.test import TestCase
+import io
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase
+from django_tenants.test.cases import TenantTestCase
+
+from invoice.models import Invoice
+from products.models import Order
+from .imports import CustomerImportError, import_customers, read_customers
+from .models import Customer, CustomerStats
+from .search import search_customers
+from .stats import quintiles, record_purchases, score_customers, segments
+from .tiers import tier_for, with_spend
+
+
+class TenantCase(TenantTestCase):
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Test Mart'
+        tenant.contact_person = 'Tester'
+        tenant.phone_number = '0700000000'
+
+    def customer(self, email='jane@example.com', **fields):
+        fields = {'full_name': 'Jane Doe', 'phone_number': '0712345678', 'address': 'Nairobi', **fields}
+        return Customer.objects.create(email=email, tenant=self.tenant, **fields)
+
+
+class CompleteOrderStatsTests(TenantCase):
+
+    def test_completing_an_order_adds_to_the_customers_stats(self):
+        customer = self.customer()
+        order = Order.objects.create(customer=customer, total_amount=Decimal('250.00'), tenant=self.tenant,
+                                     timestamp=datetime(2026, 3, 1, 9, tzinfo=dt_timezone.utc))
+        order.complete_order()
+
+        stats = CustomerStats.objects.get(customer=customer)
+        self.assertEqual(stats.purchases_count, 1)
+        self.assertEqual(stats.total_spend, Decimal('250.00'))
+        self.assertEqual((stats.first_purchase.isoformat(), stats.last_purchase.isoformat()),
+                         ('2026-03-01', '2026-03-01'))
+
+    def test_orders_without_a_customer_are_not_counted(self):
+        Order.objects.create(total_amount=Decimal('99.00'), tenant=self.tenant).complete_order()
+        self.assertFalse(CustomerStats.objects.exists())
+
+
+class QuintileTests(SimpleTestCase):
+
+    def test_distinct_values_are_spread_over_five_scores(self):
+        self.assertEqual(quintiles(np.arange(10)).tolist(), [1, 1, 2, 2, 3, 3, 4, 4, 5, 5])
+
+    def test_ties_share_the_score_at_the_middle_of_their_ranks(self):
+        # most customers bought once; they must not score as frequent buyers
+        values = np.array([1] * 60 + [2] * 20 + [3] * 10 + [5] * 10)
+        scores = quintiles(values)
+        self.assertEqual(set(scores[:60].tolist()), {2})
+        self.assertEqual(set(scores[60:80].tolist()), {4})
+        self.assertEqual(set(scores[80:].tolist()), {5})
+
+    def test_all_equal_values_score_in_the_middle(self):
+        self.assertEqual(quintiles(np.array([7, 7, 7])).tolist(), [3, 3, 3])
+
+    def test_order_of_the_input_is_kept(self):
+        self.assertEqual(quintiles(np.array([50, 10, 30, 20, 40])).tolist(), [5, 1, 3, 2, 4])
+
+    def test_no_values(self):
+        self.assertEqual(len(quintiles(np.array([]))), 0)
+
+
+class SegmentTests(SimpleTestCase):
+
+    def segment(self, r, f, m):
+        return segments(np.array([r]), np.array([f]), np.array([m]))[0]
+
+    def test_rules_are_applied_in_order(self):
+        cases = {
+            (5, 5, 1): 'champions',
+            (3, 5, 5): 'loyal',
+            (4, 3, 1): 'potential_loyalist',
+            (5, 1, 5): 'new',
+            (2, 3, 1): 'at_risk',
+            (1, 1, 4): 'at_risk',
+            (1, 1, 1): 'hibernating',
+            (3, 2, 5): 'need_attention',
+        }
+        for scores, segment in cases.items():
+            with self.subTest(scores=scores):
+                self.assertEqual(self.segment(*scores), segment)
+
+    def test_recent_frequent_buyers_are_champions_before_loyal(self):
+        # (4, 4) matches both the champions and the loyal rule; the first one wins
+        self.assertEqual(self.segment(4, 4, 1), 'champions')
+
+    def test_lapsed_big_spenders_are_at_risk_before_hibernating(self):
+        self.assertEqual(self.segment(2, 1, 5), 'at_risk')
+
+
+class RecordPurchasesTests(SimpleTestCase):
+
+    def rows(self, purchases, sign=1):
+        with mock.patch('customers.stats.upsert_increment') as upsert:
+            record_purchases(purchases, sign)
+        return upsert.call_args
+
+    def test_a_purchase_adds_one_and_its_amount(self):
+        args, kwargs = self.rows([(7, date(2026, 3, 1), Decimal('120.50'), 1)])
+        self.assertEqual(args[1], [{
+            'customer_id': 7, 'first_purchase': date(2026, 3, 1), 'last_purchase': date(2026, 3, 1),
+            'purchases_count': 1, 'total_spend': Decimal('120.50'), 'tenant_id': 1,
+        }])
+        self.assertEqual(kwargs['greatest'], ['last_purchase'])
+        self.assertEqual(kwargs['least'], ['first_purchase'])
+
+    def test_taking_a_purchase_off_subtracts_and_leaves_the_dates(self):
+        args, _ = self.rows([(7, date(2026, 3, 1), Decimal('120.50'), 1)], sign=-1)
+        row, = args[1]
+        self.assertEqual((row['purchases_count'], row['total_spend']), (-1, Decimal('-120.50')))
+        self.assertIsNone(row['first_purchase'])
+        self.assertIsNone(row['last_purchase'])
+
+    def test_purchases_without_a_customer_are_skipped(self):
+        args, _ = self.rows([(None, date(2026, 3, 1), Decimal('10'), 1)])
+        self.assertEqual(args[1], [])
+
+
+class ScoreCustomersTests(TenantCase):
+
+    def stats(self, email, **fields):
+        return CustomerStats.objects.create(customer=self.customer(email, phone_number=''), tenant=self.tenant, **fields)
+
+    def test_customers_are_scored_and_segmented(self):
+        for index in range(5):
+            self.stats(f'c{index}@example.com', first_purchase=date(2026, 1, 1),
+                       last_purchase=date(2026, 1, 1 + index * 5), purchases_count=index + 1,
+                       total_spend=Decimal(100 * (index + 1)))
+        result = score_customers(as_of=date(2026, 2, 1))
+        self.assertEqual(result, {'scored': 5, 'updated': 5})
+        best = CustomerStats.objects.get(customer__email='c4@example.com')
+        self.assertEqual((best.recency_score, best.frequency_score, best.monetary_score, best.segment),
+                         (5, 5, 5, 'champions'))
+        # nothing changed, nothing is written
+        self.assertEqual(score_customers(as_of=date(2026, 2, 1)), {'scored': 5, 'updated': 0})
+
+    def test_customers_whose_purchases_were_all_reversed_are_cleared(self):
+        self.stats('gone@example.com', last_purchase=date(2026, 1, 1), purchases_count=0, total_spend=0,
+                   recency_score=4, frequency_score=1, monetary_score=1, segment='new')
+        result = score_customers(as_of=date(2026, 2, 1))
+        self.assertEqual(result, {'scored': 0, 'updated': 1})
+        stats = CustomerStats.objects.get()
+        self.assertEqual((stats.segment, stats.recency_score), ('', None))
+
+    def test_a_reversed_purchase_is_taken_off(self):
+        customer = self.customer()
+        record_purchases([(customer.pk, date(2026, 1, 5), Decimal('80.00'), self.tenant.pk)])
+        record_purchases([(customer.pk, date(2026, 1, 9), Decimal('20.00'), self.tenant.pk)])
+        record_purchases([(customer.pk, date(2026, 1, 9), Decimal('20.00'), self.tenant.pk)], sign=-1)
+        stats = CustomerStats.objects.get(customer=customer)
+        self.assertEqual((stats.purchases_count, stats.total_spend), (1, Decimal('80.00')))
+        self.assertEqual((stats.first_purchase, stats.last_purchase), (date(2026, 1, 5), date(2026, 1, 9)))
+
+
+class ReadCustomersTests(SimpleTestCase):
+
+    def read(self, text):
+        return list(read_customers(io.StringIO(text)))
+
+    def test_headers_are_matched_by_alias_and_cells_normalized(self):
+        rows = self.read("Customer Name,E-mail,Mobile,Location,Tier\n"
+                         "  Jane   Doe ,JANE@Example.com ,0712 345 678,Nairobi,GOLD\n")
+        self.assertEqual(rows, [(2, {
+            'email': 'jane@example.com', 'full_name': 'Jane Doe', 'phone_number': '0712 345 678',
+            'phone_normalized': '254712345678', 'address': 'Nairobi', 'membership_tier': 'gold',
+        }, None)])
+
+    def test_invalid_rows_are_reported_with_their_row_number(self):
+        rows = self.read("email,name\nnot-an-email,A\n,B\n\nok@example.com,C\n")
+        self.assertEqual([(number, error) for number, _, error in rows],
+                         [(2, "Invalid email 'not-an-email'."), (3, "No email."), (5, None)])
+
+    def test_unknown_tiers_and_missing_columns_are_left_blank(self):
+        (_, row, _), = self.read("email\nok@example.com\n")
+        self.assertEqual((row['full_name'], row['phone_normalized'], row['membership_tier']), ('', '', ''))
+        (_, row, _), = self.read("email,tier\nok@example.com,diamond\n")
+        self.assertEqual(row['membership_tier'], '')
+
+    def test_a_file_without_an_email_column_is_rejected(self):
+        with self.assertRaises(CustomerImportError):
+            self.read("name,phone\nJane,0712345678\n")
+
+
+class ImportCustomersTests(TenantCase):
+
+    def run_import(self, text, **kwargs):
+        return import_customers(io.StringIO(text), self.tenant.pk, **kwargs)
+
+    def test_merge_report(self):
+        self.customer('Stored@Example.com', full_name='Stored Name', phone_number='0711000001', address='Kisumu')
+        self.customer('phone@example.com', full_name='Phone Owner', phone_number='0722000002', address='Mombasa')
+        report = self.run_import(
+            "name,email,phone,address\n"
+            "New Person,new@example.com,0733000003,Nakuru\n"
+            "Renamed,stored@example.com,,\n"               # updates on the email, blanks keep stored values
+            "Other Email,other@example.com,+254 722 000 002,\n"  # same phone as a stored customer
+            "Second Row,NEW@example.com,,\n"               # same email as row 2 of the file
+            "Same Phone,third@example.com,0733 000 003,\n"  # same phone as row 2 of the file
+            "Bad,not-an-email,,\n",
+            batch_size=2,
+        )
+        self.assertEqual(report, {
+            'rows': 6, 'created': 1, 'updated': 1, 'merged_by_phone': 1, 'duplicates': 2, 'invalid': 1,
+            'errors': [{'row': 7, 'error': "Invalid email 'not-an-email'."}],
+        })
+
+        self.assertEqual(Customer.objects.count(), 3)
+        stored = Customer.objects.get(email='Stored@Example.com')
+        self.assertEqual((stored.full_name, stored.phone_number, stored.address),
+                         ('Renamed', '0711000001', 'Kisumu'))
+        # a match on the phone alone keeps the stored email
+        merged = Customer.objects.get(phone_normalized='254722000002')
+        self.assertEqual((merged.email, merged.full_name, merged.address),
+                         ('phone@example.com', 'Other Email', 'Mombasa'))
+        self.assertEqual(Customer.objects.get(email='new@example.com').full_name, 'New Person')
+
+    def test_two_rows_reaching_one_stored_customer_count_once(self):
+        self.customer('jane@example.com', phone_number='0712345678')
+        # the first row matches on the email, the second on the stored customer's phone
+        report = self.run_import("name,email,phone\n"
+                                 "Jane,jane@example.com,\n"
+                                 "Janet,janet@example.com,0712 345 678\n")
+        self.assertEqual((report['updated'], report['merged_by_phone'], report['duplicates']), (1, 0, 1))
+        self.assertEqual(Customer.objects.get().full_name, 'Jane')
+
+
+class TierForTests(SimpleTestCase):
+
+    def test_the_highest_tier_reached_wins(self):
+        thresholds = [('gold', 150000), ('silver', 50000)]
+        self.assertEqual([tier_for(spend, thresholds) for spend in (49999, 50000, 200000)],
+                         ['regular', 'silver', 'gold'])
+
+    def test_no_thresholds_means_everyone_is_regular(self):
+        self.assertEqual(tier_for(10 ** 9, []), 'regular')
+
+
+class TierSpendTests(TenantCase):
+
+    def test_only_what_was_paid_on_invoices_counts(self):
+        customer = self.customer()
+        for total, paid in ((Decimal('900'), Decimal('900')), (Decimal('500'), Decimal('200')),
+                            (Decimal('10000'), Decimal('0'))):
+            Invoice.objects.create(invoice_number=f'INV-{total}', invoice_date=date(2026, 3, 1),
+                                   due_date=date(2026, 3, 31), customer=customer, customer_name='Jane Doe',
+                                   total_amount=total, amount_paid=paid, outstanding=total - paid,
+                                   tenant=self.tenant)
+        spend = with_spend(Customer.objects.filter(pk=customer.pk),
+                           as_of=datetime(2026, 4, 1, tzinfo=dt_timezone.utc)).get().spend
+        self.assertEqual(spend, Decimal('1100'))
+
+
+class SearchCustomersTests(SimpleTestCase):
+
+    def patterns(self, query):
+        # the LIKE patterns the lookup sends to the database
+        _, params = search_customers(query).query.sql_with_params()
+        return [param for param in params if isinstance(param, str)]
+
+    def test_numbers_typed_from_the_start_match_the_normalized_prefix(self):
+        cases = {'0712 345': '254712345%', '+254 712': '254712%', '254712': '254712%',
+                 '712345678': '254712345678%'}
+        for query, pattern in cases.items():
+            with self.subTest(query=query):
+                self.assertEqual(self.patterns(query), [pattern])
+
+    def test_a_fragment_from_the_middle_matches_anywhere_in_the_number(self):
+        # numbers starting with the fragment are listed first
+        self.assertEqual(self.patterns('345 678'), ['345678%', '%345678%'])
+
+    def test_too_few_digits_find_nothing(self):
+        self.assertFalse(search_customers('07').exists())
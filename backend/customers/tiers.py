@@ -0,0 +1,94 @@
+"""
+Membership tiers from what customers actually spend.
+
+A customer's tier follows their spend over the last 12 months: completed till orders plus
+what has been paid on their invoices (amount_paid, so unpaid and written-off invoices add
+nothing), against the MEMBERSHIP_TIER_THRESHOLDS setting. Payments are not added on top,
+since every payment settles an order or an invoice that is already counted.
+
+The recompute is meant to run nightly over the whole customer table, so it walks the
+customers in primary-key chunks. For each chunk one query sums both kinds of spend per
+customer (correlated sums on the (customer, timestamp) order index and the customer
+invoice index); only the customers whose tier changed are written back, with
+`bulk_update`. Memory and transaction size stay
+bounded by the chunk, however many customers there are.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from invoice.models import Invoice
+from products.models import Order
+from .models import Customer, TIERS
+
+SPEND_WINDOW = timedelta(days=365)
+CHUNK_SIZE = 10000
+UPDATE_BATCH_SIZE = 1000
+
+
+def tier_thresholds():
+    """
+    (tier, least spend) pairs from the highest tier down
+    """
+    thresholds = settings.MEMBERSHIP_TIER_THRESHOLDS
+    return [(tier, thresholds[tier]) for tier, _ in reversed(TIERS) if tier in thresholds]
+
+
+def tier_for(spend, thresholds=None):
+    if thresholds is None:
+        thresholds = tier_thresholds()
+    return next((tier for tier, least in thresholds if spend >= least), 'regular')
+
+
+def _spend(queryset, amount='total_amount'):
+    total = queryset.filter(customer=OuterRef('pk')).order_by().values('customer').annotate(total=Sum(amount))
+    return Coalesce(Subquery(total.values('total')), Value(0),
+                    output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def with_spend(customers, as_of=None):
+    """
+    annotate `customers` with their `spend` over the 12 months up to `as_of`
+    """
+    as_of = as_of or timezone.now()
+    since = as_of - SPEND_WINDOW
+    orders = Order.objects.filter(status='completed', timestamp__gt=since, timestamp__lte=as_of)
+    invoices = Invoice.objects.filter(invoice_date__gt=since.date(), invoice_date__lte=as_of.date(), amount_paid__gt=0)
+    return customers.annotate(spend=_spend(orders) + _spend(invoices, 'amount_paid'))
+
+
+def recompute_membership_tiers(as_of=None, chunk_size=CHUNK_SIZE):
+    """
+    bring every customer's membership tier in line with their spend; returns the number of
+    customers checked and the number whose tier changed
+    """
+    as_of = as_of or timezone.now()
+    thresholds = tier_thresholds()
+    checked = updated = 0
+    last_pk = 0
+    while True:
+        ids = list(Customer.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            break
+        chunk = Customer.objects.filter(pk__gte=ids[0], pk__lte=ids[-1]).only('pk', 'membership_tier')
+        with transaction.atomic():
+            changed = []
+            for customer in with_spend(chunk, as_of):
+                tier = tier_for(customer.spend, thresholds)
+                if customer.membership_tier != tier:
+                    customer.membership_tier = tier
+                    changed.append(customer)
+            Customer.objects.bulk_update(changed, ['membership_tier'], batch_size=UPDATE_BATCH_SIZE)
+        checked += len(ids)
+        updated += len(changed)
+        last_pk = ids[-1]
+    return {'checked': checked, 'updated': updated}
+
+
+def tier_counts():
+    counts = dict(Customer.objects.order_by().values_list('membership_tier').annotate(count=Count('pk')))
+    return {tier: counts.get(tier, 0) for tier, _ in TIERS} | {'unassigned': counts.get(None, 0)}
@@ -5,5 +5,10 @@ from .views import *
 
 urlpatterns = [
     path("customers/", CustomerListCreateAPIView.as_view()),
-    path("customers/<int:pk>/", CustomerRetrieveUpdateDestroyAPIView.as_view())
+    path("customers/search/", CustomerSearchAPIView.as_view()),
+    path("customers/import/", CustomerImportAPIView.as_view()),
+    path("customers/membership_tiers/", MembershipTierAPIView.as_view()),
+    path("customers/segments/", CustomerSegmentAPIView.as_view()),
+    path("customers/<int:pk>/", CustomerRetrieveUpdateDestroyAPIView.as_view()),
+    path("customers/<int:pk>/stats/", CustomerStatsAPIView.as_view()),
 ]
\ No newline at end of file
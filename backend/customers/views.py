@@ -1,4 +1,8 @@
 from django.shortcuts import render
+import csv
+import io
+from django.db import transaction
+from django.db.models import Count, Sum
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -6,28 +10,34 @@ from .serializers import *
 from django.shortcuts import get_object_or_404
 from .models import *
 from tenants.models import *
+from erp.pagination import IdCursorPagination
+from .search import search_customers
+from .imports import CustomerImportError, import_customers
+from .stats import score_customers
+from .tiers import recompute_membership_tiers, tier_counts, tier_thresholds
+
 class CustomerListCreateAPIView(APIView):
     serializer_class = CustomerSerializer
+    pagination_class = IdCursorPagination
     """
-        GET METHOD: method to get all cstomers 
+        GET METHOD: method to get the customers a page at a time, newest first; use
+        customers/search/ to look one up
     """
     
     def get(self, request):
-        customers = Customer.objects.all()
-        serializer = self.serializer_class(customers,many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(Customer.objects.all(), request, view=self)
+        serializer = self.serializer_class(page,many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     
     """
         POST METHOD: To create a new customer
     """
     def post(self, request):
-        data = request.data 
-        print('DATATAT;',data)
-        full_name = data.get('full_name')
+        full_name = request.data.get('full_name')
         serializer = self.serializer_class(data = request.data)
         if serializer.is_valid():
-            print("VALIDATED:", serializer.validated_data)
             serializer.save(tenant=request.user.tenant)
             ActivityLogs.objects.create(
                         tenant=request.user.tenant,
@@ -39,6 +49,49 @@ class CustomerListCreateAPIView(APIView):
         
         
         
+class CustomerSearchAPIView(APIView):
+    serializer_class = CustomerSearchResultSerializer
+    """
+    GET METHOD: To look a customer up by phone number, email or name as it is typed, e.g.
+    ?q=0712 or ?q=jane; at most `limit` (20 by default, 50 at most) matches come back
+    """
+    
+    def get(self, request):
+        serializer = CustomerSearchSerializer(data = request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        customers = search_customers(data['q'], data['limit'])
+        return Response(self.serializer_class(customers, many=True).data, status=status.HTTP_200_OK)
+
+
+class CustomerImportAPIView(APIView):
+    serializer_class = CustomerImportSerializer
+    """
+    POST METHOD: To load a customer list (CSV with at least an email column; name, phone,
+    address and tier are picked up when present). Customers already on file with the same
+    email or phone are updated rather than added again; the merge report comes back
+    """
+    def post(self, request):
+        serializer = self.serializer_class(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        upload = serializer.validated_data['file']
+        handle = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        try:
+            with transaction.atomic():
+                report = import_customers(handle, request.user.tenant_id)
+                ActivityLogs.objects.create(
+                    tenant=request.user.tenant,
+                    action_type='customer_added',
+                    message=f'{report["created"]} customers were imported from "{upload.name}", '
+                            f'{report["updated"] + report["merged_by_phone"]} existing customers updated.'
+                )
+        except (CustomerImportError, UnicodeDecodeError, csv.Error) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_200_OK)
+
+
 class CustomerRetrieveUpdateDestroyAPIView(APIView):
     serializer_class = CustomerSerializer
     """
@@ -80,5 +133,63 @@ class CustomerRetrieveUpdateDestroyAPIView(APIView):
 
 
 class MembershipTierAPIView(APIView):
+    serializer_class = MembershipTierRunSerializer
+    """
+    GET METHOD: To get the spend thresholds for each tier and how many customers are on it
+    """
+    def get(self, request):
+        return Response({
+            'thresholds': dict(tier_thresholds()),
+            'counts': tier_counts(),
+        }, status=status.HTTP_200_OK)
+
+    """
+    POST METHOD: To recompute every customer's tier from their spend over the last 12
+    months (as of `as_of`, now by default); the nightly job does the same
+    """
+    def post(self, request):
+        serializer = self.serializer_class(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        result = recompute_membership_tiers(serializer.validated_data.get('as_of'))
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class CustomerStatsAPIView(APIView):
+    serializer_class = CustomerStatsSerializer
+    """
+    GET METHOD: To get a customer's lifetime value: first and last purchase, purchases,
+    total spend, average basket and their RFM scores and segment
+    """
+    def get(self, request, pk):
+        stats = get_object_or_404(CustomerStats.objects.select_related('customer'), customer_id=pk)
+        serializer = self.serializer_class(stats)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class CustomerSegmentAPIView(APIView):
+    serializer_class = CustomerStatsSerializer
+    pagination_class = IdCursorPagination
+    """
+    GET METHOD: To get how many customers are in each RFM segment and what they have spent,
+    or with ?segment=<segment> the customers in it a page at a time
+    """
     def get(self, request):
-        pass
\ No newline at end of file
+        filters = CustomerSegmentFilterSerializer(data = request.query_params)
+        if not filters.is_valid():
+            return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
+        segment = filters.validated_data.get('segment')
+        if segment is None:
+            summary = (CustomerStats.objects.exclude(segment='').values('segment')
+                       .annotate(customers=Count('id'), total_spend=Sum('total_spend')).order_by('segment'))
+            return Response(list(summary), status=status.HTTP_200_OK)
+        paginator = self.pagination_class()
+        stats = CustomerStats.objects.filter(segment=segment).select_related('customer')
+        page = paginator.paginate_queryset(stats, request, view=self)
+        return paginator.get_paginated_response(self.serializer_class(page, many=True).data)
+
+    """
+    POST METHOD: To score every customer again now; the nightly job does the same
+    """
+    def post(self, request):
+        return Response(score_customers(), status=status.HTTP_200_OK)
@@ -0,0 +1,45 @@
+"""
+Helpers shared by receivables (invoice app) and payables (billing app).
+
+Both keep a running `amount_paid` / `outstanding` pair on each document and age the open
+balances into the same buckets.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, Q, Sum, Value, When
+
+ZERO = Decimal('0.00')
+# (bucket, fewest days past due, most days past due); documents not yet due count as 0–30
+AGING_BUCKETS = [
+    ('0_30', None, 30),
+    ('31_60', 31, 60),
+    ('61_90', 61, 90),
+    ('90_plus', 91, None),
+]
+
+
+def aging_buckets(as_of, field='outstanding'):
+    """
+    one filtered Sum of `field` per aging bucket, for .annotate() / .aggregate()
+    """
+    buckets = {}
+    for name, fewest, most in AGING_BUCKETS:
+        # days past due between fewest and most means a due date between these two dates
+        condition = Q()
+        if most is not None:
+            condition &= Q(due_date__gte=as_of - timedelta(days=most)) | Q(due_date__isnull=True)
+        if fewest is not None:
+            condition &= Q(due_date__lte=as_of - timedelta(days=fewest))
+        buckets[name] = Sum(field, filter=condition, default=ZERO)
+    return buckets
+
+
+def amount_by_pk(amounts, sign=1):
+    """
+    {pk: amount} as a CASE expression, so one UPDATE can move many documents' balances
+    """
+    return Case(
+        *[When(pk=pk, then=Value(sign * amount)) for pk, amount in amounts.items()],
+        default=Value(ZERO), output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
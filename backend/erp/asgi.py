@@ -7,10 +7,37 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'erp.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    """
+    Django for HTTP; the ASGI lifespan runs the payments dispatcher next to the app when
+    PAYMENTS_DISPATCH_IN_ASGI is on, so no separate worker process is needed.
+    """
+    if scope['type'] != 'lifespan':
+        return await django_application(scope, receive, send)
+
+    from django.conf import settings
+    from payments.dispatcher import run_dispatcher
+
+    stop, dispatcher = asyncio.Event(), None
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if settings.PAYMENTS_DISPATCH_IN_ASGI:
+                dispatcher = asyncio.create_task(run_dispatcher(stop))
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            stop.set()
+            if dispatcher is not None:
+                await dispatcher
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -0,0 +1,146 @@
+"""
+Database helpers shared by the apps.
+"""
+from django.db import connection
+
+
+def _pick(pick, current, new):
+    # NULL never wins, as with GREATEST and LEAST in the database
+    return new if current is None else current if new is None else pick(current, new)
+
+
+def upsert_increment(model, rows, keys, add=(), replace=(), greatest=(), least=()):
+    """
+    Add the `add` columns of each row onto the existing row with the same `keys`, inserting
+    it when it does not exist yet, in a single INSERT ... ON CONFLICT DO UPDATE statement.
+    Columns listed in `replace` are overwritten instead of added to, and columns listed in
+    `greatest` / `least` keep the larger / smaller of the stored and new values (e.g. last
+    and first seen dates); a None there leaves the stored value alone.
+
+    `rows` are dicts keyed by column name and must carry every NOT NULL column needed on
+    insert; `keys` must be covered by a unique constraint on the table. Rows sharing the
+    same keys are merged first and all rows are written in key order, so concurrent
+    callers touching the same counters lock them in the same order.
+    """
+    merged = {}
+    for row in rows:
+        key = tuple(row[column] for column in keys)
+        if key in merged:
+            current = merged[key]
+            for column in add:
+                current[column] = current[column] + row[column]
+            for column in replace:
+                current[column] = row[column]
+            for column in greatest:
+                current[column] = _pick(max, current[column], row[column])
+            for column in least:
+                current[column] = _pick(min, current[column], row[column])
+        else:
+            merged[key] = dict(row)
+    if not merged:
+        return 0
+
+    columns = list(next(iter(merged.values())))
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    assignments = [f"{quote(c)} = {table}.{quote(c)} + EXCLUDED.{quote(c)}" for c in add]
+    assignments += [f"{quote(c)} = EXCLUDED.{quote(c)}" for c in replace]
+    assignments += [f"{quote(c)} = GREATEST({table}.{quote(c)}, EXCLUDED.{quote(c)})" for c in greatest]
+    assignments += [f"{quote(c)} = LEAST({table}.{quote(c)}, EXCLUDED.{quote(c)})" for c in least]
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+
+    params = []
+    for key in sorted(merged):
+        params.extend(merged[key][column] for column in columns)
+    sql = (
+        f"INSERT INTO {table} ({', '.join(quote(c) for c in columns)}) "
+        f"VALUES {', '.join([placeholders] * len(merged))} "
+        f"ON CONFLICT ({', '.join(quote(c) for c in keys)}) DO UPDATE SET {', '.join(assignments)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def sync_line_items(model, parent_field, parent, items, fields, batch_size=500, prepare=None, prepared_fields=()):
+    """
+    Make the `model` rows hanging off `parent` (through the `parent_field` foreign key)
+    match `items`, a list of dicts as validated by the line serializer, in a few
+    set-wise queries: new lines (no `id`) are bulk created, lines whose `fields` changed
+    are bulk updated and existing lines missing from `items` are deleted. Lines left
+    unchanged are not written at all.
+
+    `prepare`, when given, is called on every new or changed line before it is written, to
+    fill in derived columns (listed in `prepared_fields`) such as stored line totals.
+
+    Raises ValueError when an item carries an id that is not one of the parent's lines.
+    Returns the (created, updated, deleted) counts.
+    """
+    existing = {line.pk: line for line in model.objects.filter(**{parent_field: parent})}
+    # foreign keys are compared and set by id so unchanged lines never load their relations
+    attnames = {field: model._meta.get_field(field).attname for field in fields}
+    created, updated, kept, changed_fields = [], [], set(), set()
+    for item in items:
+        item = dict(item)
+        pk = item.pop('id', None)
+        if pk is None:
+            line = model(**{parent_field: parent}, **item)
+            if prepare is not None:
+                prepare(line)
+            created.append(line)
+            continue
+        line = existing.get(pk)
+        if line is None or pk in kept:
+            raise ValueError(f"Line {pk} does not belong to this document.")
+        kept.add(pk)
+        changed = False
+        for field, attname in attnames.items():
+            if field not in item:
+                continue
+            value = item[field]
+            if attname != field:
+                value = getattr(value, 'pk', value)
+            if getattr(line, attname) != value:
+                setattr(line, attname, value)
+                changed_fields.add(field)
+                changed = True
+        if changed:
+            updated.append(line)
+            if prepare is not None:
+                prepare(line)
+                changed_fields.update(prepared_fields)
+
+    deleted = [pk for pk in existing if pk not in kept]
+    if deleted:
+        model.objects.filter(pk__in=deleted).delete()
+    if updated:
+        model.objects.bulk_update(updated, sorted(changed_fields), batch_size=batch_size)
+    if created:
+        model.objects.bulk_create(created, batch_size=batch_size)
+    return len(created), len(updated), len(deleted)
+
+
+def update_columns(model, key, columns, batch_size=50000):
+    """
+    Write per-row values back in UPDATE ... FROM unnest(...) statements of `batch_size` rows,
+    for batch jobs that rewrite a few columns on many rows (bulk_update builds a CASE per
+    column per row instead). `columns` maps the key column and every column to update to
+    equally long sequences of values. Returns the number of rows updated.
+    """
+    names = [key] + [column for column in columns if column != key]
+    fields = {name: model._meta.get_field(name) for name in names}
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    arrays = ", ".join(f"%s::{fields[name].db_type(connection)}[]" for name in names)
+    sql = (
+        f"UPDATE {table} SET {', '.join(f'{quote(fields[n].column)} = v.{quote(n)}' for n in names[1:])} "
+        f"FROM unnest({arrays}) AS v({', '.join(quote(n) for n in names)}) "
+        f"WHERE {table}.{quote(fields[key].column)} = v.{quote(key)}"
+    )
+    total = len(columns[key])
+    updated = 0
+    with connection.cursor() as cursor:
+        for start in range(0, total, batch_size):
+            cursor.execute(sql, [list(columns[name][start:start + batch_size]) for name in names])
+            updated += cursor.rowcount
+    return updated
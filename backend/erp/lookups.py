@@ -0,0 +1,95 @@
+"""
+Cached name -> id resolution for serializer fields that take human-readable references
+(a branch by its name, a cashier by their username).
+
+Entries live in the default cache under the current tenant schema, so two tenants with a
+branch called "Main" never share an entry. Every model served here is registered with
+`register_lookup()` from its app's ready(); any save or delete of one of its rows bumps
+the model's generation for that schema, which retires all of its cached names at once.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from rest_framework import serializers
+from rest_framework.relations import PKOnlyObject
+
+LOOKUP_CACHE_TIMEOUT = getattr(settings, 'LOOKUP_CACHE_TIMEOUT', 300)
+
+
+def _prefix(model):
+    return f"lookup:{getattr(connection, 'schema_name', 'public')}:{model._meta.label_lower}"
+
+
+def _generation(model):
+    key = f"{_prefix(model)}:generation"
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, 1, None)
+        generation = cache.get(key, 1)
+    return generation
+
+
+def invalidate_lookups(sender, **kwargs):
+    key = f"{_prefix(sender)}:generation"
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def register_lookup(model):
+    """
+    keep the cached lookups of `model` in step with its rows
+    """
+    uid = f"erp.lookups:{model._meta.label_lower}"
+    post_save.connect(invalidate_lookups, sender=model, dispatch_uid=uid)
+    post_delete.connect(invalidate_lookups, sender=model, dispatch_uid=uid)
+
+
+def _key(model, kind, field, value):
+    return f"{_prefix(model)}:{_generation(model)}:{kind}:{field}:{value}"
+
+
+class CachedSlugRelatedField(serializers.SlugRelatedField):
+    """
+    SlugRelatedField that remembers which id a name resolves to and which name an id has,
+    so writes fetch the related row by primary key and reads do not load it at all.
+    """
+
+    def use_pk_only_optimization(self):
+        return True
+
+    def _related_model(self):
+        if self.queryset is not None:
+            return self.queryset.model
+        model = self.parent.Meta.model
+        for attr in self.source_attrs:
+            model = model._meta.get_field(attr).related_model
+        return model
+
+    def to_internal_value(self, data):
+        queryset = self.get_queryset()
+        model = queryset.model
+        key = _key(model, 'id', self.slug_field, data)
+        pk = cache.get(key)
+        if pk is not None:
+            obj = queryset.filter(pk=pk).first()
+            # the entry may predate a rename or delete made in another process
+            if obj is not None and str(getattr(obj, self.slug_field)) == str(data):
+                return obj
+            cache.delete(key)
+        obj = super().to_internal_value(data)
+        cache.set(key, obj.pk, LOOKUP_CACHE_TIMEOUT)
+        return obj
+
+    def to_representation(self, obj):
+        if not isinstance(obj, PKOnlyObject):
+            return super().to_representation(obj)
+        model = self._related_model()
+        key = _key(model, 'name', self.slug_field, obj.pk)
+        value = cache.get(key)
+        if value is None:
+            value = model._default_manager.filter(pk=obj.pk).values_list(self.slug_field, flat=True).first()
+            cache.set(key, value, LOOKUP_CACHE_TIMEOUT)
+        return value
@@ -0,0 +1,16 @@
+"""
+Pagination shared by the apps' list endpoints.
+"""
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination, newest first. Each page is a `WHERE id < cursor ORDER BY id DESC
+    LIMIT n` range scan on the primary key, so page 2000 costs what page 1 does and rows
+    added meanwhile never shift the pages. ?page_size=... picks the page length.
+    """
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
@@ -0,0 +1,272 @@
+"""
+Server-side rendering of invoices and bills to PDF and HTML.
+
+A document is first reduced to a plain dict (see `Invoice.document_data` and
+`Bill.document_data`). Everything below works on those dicts only and never touches the
+database, so rendering can run in a pool of worker processes:
+
+* every output is cached on disk under DOCUMENT_CACHE_DIR, keyed by a hash of the
+  document's content and the output format, so downloading an unchanged document again
+  only reads a file, and an edited document gets a new key instead of a stale file;
+* `render_documents` renders whatever is not cached yet, spread over a process pool when
+  there is more than one document to do;
+* `zip_documents` packs a whole run (e.g. month-end statements) into one archive.
+
+PDFs are written by a small built-in writer using the standard Helvetica fonts, so no
+rendering library is needed.
+"""
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+import re
+import textwrap
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified
+
+# bump when the layout changes so cached files are rendered again
+RENDER_VERSION = '1'
+FORMATS = {'pdf': 'application/pdf', 'html': 'text/html; charset=utf-8'}
+
+
+def money(value):
+    return f"{value or 0:,.2f}"
+
+
+def document_key(data, output):
+    content = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{RENDER_VERSION}:{output}:{content}".encode()).hexdigest()
+
+
+def cache_path(data, output):
+    key = document_key(data, output)
+    return Path(settings.DOCUMENT_CACHE_DIR) / key[:2] / f"{key}.{output}"
+
+
+def file_name(data, output):
+    number = re.sub(r'[^\w.-]+', '_', str(data['number'])) or 'document'
+    return f"{data['kind'].lower()}-{number}.{output}"
+
+
+def render_html(data):
+    e = html.escape
+    party = '<br>'.join(e(line) for line in data['party'])
+    lines = ''.join(
+        f"<tr><td>{e(description)}</td><td class=n>{e(quantity)}</td><td class=n>{e(rate)}</td>"
+        f"<td class=n>{e(tax)}</td><td class=n>{e(amount)}</td></tr>"
+        for description, quantity, rate, tax, amount in data['lines']
+    )
+    totals = ''.join(f"<tr><th colspan=4 class=n>{e(label)}</th><td class=n>{e(value)}</td></tr>"
+                     for label, value in data['totals'])
+    notes = f"<p>{e(data['notes'])}</p>" if data.get('notes') else ''
+    return (
+        "<!DOCTYPE html><html><head><meta charset=utf-8>"
+        f"<title>{e(data['kind'])} {e(str(data['number']))}</title>"
+        "<style>body{font-family:Helvetica,Arial,sans-serif;font-size:13px;margin:40px}"
+        "table{border-collapse:collapse;width:100%}td,th{padding:4px 6px;border-bottom:1px solid #ddd;text-align:left}"
+        ".n{text-align:right}</style></head><body>"
+        f"<h1>{e(data['kind'])} #{e(str(data['number']))}</h1>"
+        f"<p><strong>{e(data['issuer'])}</strong></p>"
+        f"<p>Date: {e(data['issued'])}<br>Due: {e(data['due'])}</p>"
+        f"<p><strong>{e(data['party_label'])}</strong><br>{party}</p>"
+        "<table><tr><th>Description</th><th class=n>Qty</th><th class=n>Rate</th><th class=n>Tax</th>"
+        f"<th class=n>Amount</th></tr>{lines}{totals}</table>{notes}</body></html>"
+    ).encode()
+
+
+# Helvetica advance widths (per 1000 em) for the characters that appear in numbers, used
+# to right-align the amount columns; other characters are taken at an average width
+_WIDTHS = dict.fromkeys('0123456789', 556) | {'.': 278, ',': 278, '-': 333, '%': 889, ' ': 278}
+PAGE_WIDTH, PAGE_HEIGHT, MARGIN = 595, 842, 50
+
+
+def _pdf_text(value):
+    value = str(value).encode('latin-1', 'replace').decode('latin-1')
+    return value.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+class _PdfPages:
+
+    def __init__(self):
+        self.pages = []
+        self.new_page()
+
+    def new_page(self):
+        self.ops = []
+        self.pages.append(self.ops)
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def text(self, x, value, size=10, bold=False, right=False):
+        if right:
+            x -= sum(_WIDTHS.get(char, 556) for char in str(value)) * size / 1000
+        font = 'F2' if bold else 'F1'
+        self.ops.append(f"BT /{font} {size} Tf {x:.2f} {self.y:.2f} Td ({_pdf_text(value)}) Tj ET")
+
+    def line(self):
+        self.ops.append(f"{MARGIN} {self.y - 4:.2f} m {PAGE_WIDTH - MARGIN} {self.y - 4:.2f} l 0.5 w S")
+
+    def down(self, step):
+        self.y -= step
+
+
+def render_pdf(data):
+    columns = (MARGIN, 360, 430, 480, PAGE_WIDTH - MARGIN)
+    pdf = _PdfPages()
+    pdf.text(MARGIN, f"{data['kind']} #{data['number']}", size=18, bold=True)
+    pdf.down(26)
+    pdf.text(MARGIN, data['issuer'], bold=True)
+    pdf.text(columns[-1], f"Date: {data['issued']}", right=True)
+    pdf.down(14)
+    pdf.text(columns[-1], f"Due: {data['due']}", right=True)
+    pdf.down(24)
+    pdf.text(MARGIN, data['party_label'], bold=True)
+    for line in data['party']:
+        pdf.down(14)
+        pdf.text(MARGIN, line)
+    pdf.down(30)
+
+    def table_header():
+        for x, label in zip(columns, ('Description', 'Qty', 'Rate', 'Tax', 'Amount')):
+            pdf.text(x, label, bold=True, right=x != MARGIN)
+        pdf.line()
+        pdf.down(18)
+
+    table_header()
+    for description, quantity, rate, tax, amount in data['lines']:
+        wrapped = textwrap.wrap(str(description), 52) or ['']
+        if pdf.y - 14 * len(wrapped) < MARGIN + 20:
+            pdf.new_page()
+            table_header()
+        for x, value in zip(columns[1:], (quantity, rate, tax, amount)):
+            pdf.text(x, value, right=True)
+        for part in wrapped:
+            pdf.text(MARGIN, part)
+            pdf.down(14)
+        pdf.down(2)
+
+    if pdf.y < MARGIN + 20 * (len(data['totals']) + 1):
+        pdf.new_page()
+    pdf.down(8)
+    for label, value in data['totals']:
+        pdf.text(columns[3], label, bold=True, right=True)
+        pdf.text(columns[-1], value, bold=True, right=True)
+        pdf.down(16)
+    for line in textwrap.wrap(data.get('notes') or '', 95):
+        pdf.down(14)
+        pdf.text(MARGIN, line, size=9)
+    return _write_pdf(pdf.pages)
+
+
+def _write_pdf(pages):
+    """
+    serialise page content streams into a PDF file: catalog, page tree, two base fonts,
+    then a page and a compressed content stream per page
+    """
+    page_ids = [5 + 2 * index for index in range(len(pages))]
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        2: f"<< /Type /Pages /Kids [{' '.join(f'{pid} 0 R' for pid in page_ids)}] /Count {len(pages)} >>".encode(),
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        4: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    }
+    for page_id, ops in zip(page_ids, pages):
+        stream = zlib.compress('\n'.join(ops).encode('latin-1'))
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {page_id + 1} 0 R >>"
+        ).encode()
+        objects[page_id + 1] = f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode() + stream + b"\nendstream"
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number in range(1, len(objects) + 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + objects[number] + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b''.join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+RENDERERS = {'pdf': render_pdf, 'html': render_html}
+
+
+def _render_to_file(data, output, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    temporary.write_bytes(RENDERERS[output](data))
+    # the rename is atomic, so concurrent renders of one document never expose half a file
+    os.replace(temporary, path)
+
+
+def render_documents(documents, output='pdf', workers=None):
+    """
+    make sure every document dict is rendered to `output` and return the cached file paths
+    in the same order. Missing files are rendered in a process pool of `workers` processes
+    (DOCUMENT_RENDER_WORKERS, or one per core, by default).
+    """
+    paths = [cache_path(data, output) for data in documents]
+    missing = {}
+    for data, path in zip(documents, paths):
+        if not path.exists():
+            missing.setdefault(path, data)
+    workers = workers or settings.DOCUMENT_RENDER_WORKERS or os.cpu_count() or 1
+    if len(missing) > 1 and workers > 1:
+        # spawned workers start clean instead of inheriting the parent's database connections
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            chunksize = max(1, len(missing) // (workers * 4))
+            list(pool.map(_render_to_file, missing.values(), repeat(output), map(str, missing), chunksize=chunksize))
+    else:
+        for path, data in missing.items():
+            _render_to_file(data, output, path)
+    return paths
+
+
+def render_document(data, output='pdf'):
+    """
+    render one document in the calling process unless it is cached; returns (path, key)
+    """
+    path, = render_documents([data], output, workers=1)
+    return path, path.stem
+
+
+def document_response(request, data, output='pdf', download=False):
+    """
+    the rendered document as a file response with the content key as its ETag, so a
+    browser that already holds this version gets a 304
+    """
+    path, key = render_document(data, output)
+    etag = f'"{key}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=FORMATS[output], as_attachment=download,
+                                filename=file_name(data, output))
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def zip_documents(documents, archive, output='pdf', workers=None):
+    """
+    render a run of documents and write them all into the zip file `archive`
+    """
+    paths = render_documents(documents, output, workers)
+    names = set()
+    with zipfile.ZipFile(archive, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+        for data, path in zip(documents, paths):
+            name = file_name(data, output)
+            if name in names:
+                name = f"{Path(name).stem}-{document_key(data, output)[:8]}.{output}"
+            names.add(name)
+            bundle.write(path, name)
+    return len(names)
@@ -231,3 +231,47 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Cache
+# The M-Pesa access token (payments.mpesa) and the name lookups (erp.lookups) are shared
+# between web and dispatcher processes through the default cache, so anything running more
+# than one process needs REDIS_URL (e.g. redis://127.0.0.1:6379/1). Without it every process
+# keeps its own in-memory cache, which only suits a single development server; the
+# payments.W001 check warns about it and `check --deploy` fails on it (payments.E001).
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+# M-Pesa (Daraja)
+
+MPESA_BASE_URL = os.getenv('MPESA_BASE_URL', 'https://sandbox.safaricom.co.ke')
+MPESA_CONSUMER_KEY = os.getenv('MPESA_CONSUMER_KEY')
+MPESA_CONSUMER_SECRET = os.getenv('MPESA_CONSUMER_SECRET')
+MPESA_BUSINESS_SHORT_CODE = os.getenv('MPESA_BUSINESS_SHORT_CODE')
+MPESA_PASS_KEY = os.getenv('MPESA_PASS_KEY')
+# {domain} is replaced with the tenant's primary domain, so each tenant's callbacks land in its own schema
+MPESA_CALLBACK_URL = os.getenv('MPESA_CALLBACK_URL', 'https://{domain}/api/v1/payments/mpesa/callback/')
+
+# STK pushes are sent by the payments dispatcher (`manage.py dispatch_payments`), or by the
+# ASGI server itself when this is on
+PAYMENTS_DISPATCH_IN_ASGI = os.getenv('PAYMENTS_DISPATCH_IN_ASGI', '') == '1'
+PAYMENTS_DISPATCH_CONCURRENCY = int(os.getenv('PAYMENTS_DISPATCH_CONCURRENCY', '20'))
+# seconds an intent may stay claimed before another dispatcher takes it over; well above the
+# gateway timeouts so a slow push is never sent twice
+PAYMENTS_DISPATCH_LEASE = int(os.getenv('PAYMENTS_DISPATCH_LEASE', '300'))
+
+# Rendered invoice and bill PDFs/HTML, cached by content hash
+DOCUMENT_CACHE_DIR = os.getenv('DOCUMENT_CACHE_DIR', str(BASE_DIR / 'document_cache'))
+# worker processes for batch rendering; 0 means one per core
+DOCUMENT_RENDER_WORKERS = int(os.getenv('DOCUMENT_RENDER_WORKERS', '0'))
+
+# Membership tiers: the least rolling 12-month spend for each tier above regular
+MEMBERSHIP_TIER_THRESHOLDS = {
+    'silver': int(os.getenv('MEMBERSHIP_SILVER_SPEND', '50000')),
+    'gold': int(os.getenv('MEMBERSHIP_GOLD_SPEND', '150000')),
+    'platinum': int(os.getenv('MEMBERSHIP_PLATINUM_SPEND', '500000')),
+}
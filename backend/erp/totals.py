@@ -0,0 +1,71 @@
+"""
+Stored line and header totals for documents made of lines (invoices, bills, invoice
+templates).
+
+Each line stores its net (quantity x rate), tax (net x tax_rate / 100) and gross amounts,
+each rounded to the cent, so reports sum stored columns instead of recomputing every
+line. A header's subtotal, total_tax and total_amount are the sums of its lines and are
+refreshed by `refresh_totals` in one UPDATE after its lines change.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+LINE_TOTAL_FIELDS = ['line_net', 'line_tax', 'line_gross']
+
+
+def line_amounts(quantity, rate, tax_rate):
+    """
+    (net, tax, gross) of one line; tax_rate is a percentage
+    """
+    net = (Decimal(quantity) * Decimal(rate)).quantize(CENT, ROUND_HALF_UP)
+    tax = (net * Decimal(tax_rate) / 100).quantize(CENT, ROUND_HALF_UP)
+    return net, tax, net + tax
+
+
+class LineTotals(models.Model):
+    """
+    the stored amounts of a document line; they are set on save(), and code writing lines
+    with bulk_create/bulk_update calls set_totals() first
+    """
+    line_net = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    line_tax = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    line_gross = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        abstract = True
+
+    def set_totals(self):
+        self.line_net, self.line_tax, self.line_gross = line_amounts(self.quantity, self.rate, self.tax_rate)
+        return self
+
+    def save(self, *args, **kwargs):
+        self.set_totals()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *LINE_TOTAL_FIELDS}
+        super().save(*args, **kwargs)
+
+
+def refresh_totals(header_model, line_model, parent_field, pks):
+    """
+    set subtotal, total_tax and total_amount of the `header_model` rows in `pks` to the sums
+    of their lines in a single UPDATE; headers that track an outstanding balance get it
+    moved along with the total
+    """
+    lines = line_model.objects.filter(**{parent_field: OuterRef('pk')}).order_by().values(parent_field)
+
+    def total(column):
+        return Coalesce(
+            Subquery(lines.annotate(total=Sum(column)).values('total')),
+            Value(ZERO), output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+
+    updates = {'subtotal': total('line_net'), 'total_tax': total('line_tax'), 'total_amount': total('line_gross')}
+    if any(field.name == 'outstanding' for field in header_model._meta.fields):
+        updates['outstanding'] = total('line_gross') - F('amount_paid')
+    return header_model.objects.filter(pk__in=pks).update(**updates)
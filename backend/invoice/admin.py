@@ -1,3 +1,7 @@
 from django.contrib import admin
+from .models import *
 
 # Register your models here.
+admin.site.register(Invoice)
+admin.site.register(InvoicePayment)
+admin.site.register(InvoiceTemplate)
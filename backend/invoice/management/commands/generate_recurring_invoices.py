@@ -0,0 +1,22 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from invoice.recurring import generate_due_invoices
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate every recurring invoice due on or before a date (today by default). Safe to "
+        "run repeatedly. Run per tenant, e.g. from cron: "
+        "`manage.py tenant_command generate_recurring_invoices --schema=<tenant>`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help="Run date (YYYY-MM-DD).")
+
+    def handle(self, *args, **options):
+        run_date = options['date'] or timezone.localdate()
+        created = generate_due_invoices(run_date)
+        self.stdout.write(self.style.SUCCESS(f"Generated {created} recurring invoices for {run_date}."))
@@ -0,0 +1,37 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from billing.models import Bill
+from erp.rendering import FORMATS, zip_documents
+from invoice.models import Invoice
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Render a run of invoices (or bills) to PDF or HTML in a process pool and zip them. "
+        "Documents already rendered are taken from the cache. Run per tenant, e.g. "
+        "`manage.py tenant_command render_documents statements.zip --start 2025-05-01 --end 2025-05-31 --schema=<tenant>`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archive', help="Path of the zip file to write.")
+        parser.add_argument('--bills', action='store_true', help="Render bills instead of invoices.")
+        parser.add_argument('--start', type=date.fromisoformat, help="First document date (YYYY-MM-DD).")
+        parser.add_argument('--end', type=date.fromisoformat, help="Last document date (YYYY-MM-DD).")
+        parser.add_argument('--output', choices=list(FORMATS), default='pdf')
+        parser.add_argument('--workers', type=int, help="Worker processes; one per core by default.")
+
+    def handle(self, *args, **options):
+        model, date_field = (Bill, 'bill_date') if options['bills'] else (Invoice, 'invoice_date')
+        documents = model.objects.select_related('tenant').prefetch_related('items').order_by('pk')
+        if options['start']:
+            documents = documents.filter(**{f'{date_field}__gte': options['start']})
+        if options['end']:
+            documents = documents.filter(**{f'{date_field}__lte': options['end']})
+
+        data = [document.document_data() for document in documents.iterator(chunk_size=BATCH_SIZE)]
+        count = zip_documents(data, options['archive'], options['output'], options['workers'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} documents to {options['archive']}."))
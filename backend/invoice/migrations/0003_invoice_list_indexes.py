@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0002_alter_customer_membership_tier_delete_membershiptier'),
+        ('invoice', '0002_initial'),
+        ('tenants', '0007_alter_activitylogs_action_type'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['customer', '-id'], name='invoice_inv_custome_587495_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['invoice_date'], name='invoice_inv_invoice_54f3c0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['due_date'], name='invoice_inv_due_dat_b8a0e0_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:49
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def open_existing_invoices(apps, schema_editor):
+    """
+    nothing has been recorded as paid yet, so every existing invoice is owed in full
+    """
+    Invoice = apps.get_model('invoice', 'Invoice')
+    Invoice.objects.update(outstanding=F('total_amount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0002_alter_customer_membership_tier_delete_membershiptier'),
+        ('invoice', '0003_invoice_list_indexes'),
+        ('tenants', '0007_alter_activitylogs_action_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoicePayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('paid_on', models.DateField(default=django.utils.timezone.localdate)),
+                ('method', models.CharField(blank=True, max_length=50)),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('recorded_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-paid_on', '-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='amount_paid',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='outstanding',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='total_amount less amount_paid, kept up to date as payments are applied', max_digits=10),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('outstanding__gt', 0)), fields=['tenant', 'due_date'], name='invoice_open_due_idx'),
+        ),
+        migrations.AddField(
+            model_name='invoicepayment',
+            name='invoice',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipts', to='invoice.invoice'),
+        ),
+        migrations.AddField(
+            model_name='invoicepayment',
+            name='tenant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='tenants.tenant'),
+        ),
+        migrations.RunPython(open_existing_invoices, migrations.RunPython.noop),
+    ]
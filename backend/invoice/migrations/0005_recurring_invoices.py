@@ -0,0 +1,73 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0002_alter_customer_membership_tier_delete_membershiptier'),
+        ('invoice', '0004_receivables'),
+        ('products', '0011_order_branch_reorderrequest'),
+        ('tenants', '0008_alter_activitylogs_action_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceTemplateItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description', models.TextField()),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('tax_rate', models.DecimalField(decimal_places=2, default=0.18, max_digits=5)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InvoiceTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('customer_name', models.CharField(max_length=255)),
+                ('customer_email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('customer_phone', models.CharField(blank=True, max_length=20, null=True)),
+                ('customer_address', models.CharField(blank=True, max_length=255, null=True)),
+                ('notes', models.TextField(blank=True)),
+                ('frequency', models.CharField(choices=[('weekly', 'Weekly'), ('monthly', 'Monthly'), ('quarterly', 'Quarterly'), ('yearly', 'Yearly')], default='monthly', max_length=20)),
+                ('start_date', models.DateField(help_text='Date of the first invoice; later ones fall on the same day of the period')),
+                ('end_date', models.DateField(blank=True, help_text='No invoices are dated after this day', null=True)),
+                ('payment_terms_days', models.PositiveIntegerField(default=30)),
+                ('periods_generated', models.PositiveIntegerField(default=0)),
+                ('next_run_date', models.DateField(help_text='Date of the next invoice to generate')),
+                ('last_generated_on', models.DateField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='customers.customer')),
+                ('tenant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='tenants.tenant')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='template',
+            field=models.ForeignKey(blank=True, help_text='The recurring template this invoice was generated from', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoices', to='invoice.invoicetemplate'),
+        ),
+        migrations.AddConstraint(
+            model_name='invoice',
+            constraint=models.UniqueConstraint(fields=('template', 'invoice_date'), name='unique_invoice_per_template_period'),
+        ),
+        migrations.AddField(
+            model_name='invoicetemplateitem',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='products.product'),
+        ),
+        migrations.AddField(
+            model_name='invoicetemplateitem',
+            name='template',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='invoice.invoicetemplate'),
+        ),
+        migrations.AddIndex(
+            model_name='invoicetemplate',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['next_run_date'], name='invoice_template_due_idx'),
+        ),
+    ]
@@ -1,4 +1,7 @@
 from django.db import models
+from django.utils import timezone
+from erp.rendering import money
+from erp.totals import LineTotals
 
 class Invoice(models.Model):
    
@@ -17,13 +20,57 @@ class Invoice(models.Model):
     subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total_tax = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    outstanding = models.DecimalField(max_digits=10, decimal_places=2, default=0,
+                                      help_text="total_amount less amount_paid, kept up to date as payments are applied")
     tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE,null=True, blank=True)
+    template = models.ForeignKey('InvoiceTemplate', on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='invoices', help_text="The recurring template this invoice was generated from")
+
+    class Meta:
+        constraints = [
+            # a template bills each period once, however often the generator runs
+            models.UniqueConstraint(fields=['template', 'invoice_date'], name='unique_invoice_per_template_period'),
+        ]
+        indexes = [
+            models.Index(fields=['customer', '-id']),
+            models.Index(fields=['invoice_date']),
+            models.Index(fields=['due_date']),
+            # open invoices only: the receivables and aging queries never look at paid ones
+            models.Index(fields=['tenant', 'due_date'], condition=models.Q(outstanding__gt=0),
+                         name='invoice_open_due_idx'),
+        ]
 
     def __str__(self):
         return f"Invoice #{self.invoice_number}"
 
+    def document_data(self):
+        """
+        the invoice as a plain dict for erp.rendering; prefetch `items` and select
+        `tenant` when rendering many
+        """
+        return {
+            'kind': 'Invoice',
+            'number': self.invoice_number,
+            'issued': str(self.invoice_date or ''),
+            'due': str(self.due_date or ''),
+            'issuer': self.tenant.name if self.tenant_id else '',
+            'party_label': 'Bill to',
+            'party': [value for value in (self.customer_name, self.customer_address,
+                                          self.customer_email, self.customer_phone) if value],
+            'lines': [
+                # the stored, rounded line amounts, so the lines add up to the header totals
+                [item.description, f"{item.quantity:g}", money(item.rate), money(item.line_tax),
+                 money(item.line_net)]
+                for item in self.items.all()
+            ],
+            'totals': [['Subtotal', money(self.subtotal)], ['Tax', money(self.total_tax)],
+                       ['Total', money(self.total_amount)]],
+            'notes': self.notes,
+        }
+
 
-class InvoiceItem(models.Model):
+class InvoiceItem(LineTotals):
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey('products.Product', on_delete=models.SET_NULL, null=True) # Optional link to a product
     description = models.TextField()
@@ -32,4 +79,76 @@ class InvoiceItem(models.Model):
     tax_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0.18) # 18% as default example
     
     def __str__(self):
-        return self.description
\ No newline at end of file
+        return self.description
+
+
+FREQUENCIES = [
+    ('weekly', 'Weekly'),
+    ('monthly', 'Monthly'),
+    ('quarterly', 'Quarterly'),
+    ('yearly', 'Yearly'),
+]
+
+
+class InvoiceTemplate(models.Model):
+    """
+    an invoice sent again every period, e.g. a wholesale customer's monthly supply; the
+    generator in invoice.recurring turns due templates into invoices
+    """
+    name = models.CharField(max_length=255)
+    customer = models.ForeignKey('customers.Customer', on_delete=models.SET_NULL, null=True, blank=True)
+    customer_name = models.CharField(max_length=255)
+    customer_email = models.EmailField(null=True, blank=True)
+    customer_phone = models.CharField(max_length=20, null=True, blank=True)
+    customer_address = models.CharField(max_length=255, null=True, blank=True)
+    notes = models.TextField(blank=True)
+
+    frequency = models.CharField(max_length=20, choices=FREQUENCIES, default='monthly')
+    start_date = models.DateField(help_text="Date of the first invoice; later ones fall on the same day of the period")
+    end_date = models.DateField(null=True, blank=True, help_text="No invoices are dated after this day")
+    payment_terms_days = models.PositiveIntegerField(default=30)
+    periods_generated = models.PositiveIntegerField(default=0)
+    next_run_date = models.DateField(help_text="Date of the next invoice to generate")
+    last_generated_on = models.DateField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_run_date'], condition=models.Q(is_active=True), name='invoice_template_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.frequency})"
+
+
+class InvoiceTemplateItem(LineTotals):
+    template = models.ForeignKey(InvoiceTemplate, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey('products.Product', on_delete=models.SET_NULL, null=True, blank=True)
+    description = models.TextField()
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    rate = models.DecimalField(max_digits=10, decimal_places=2)
+    tax_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0.18)
+
+    def __str__(self):
+        return self.description
+
+
+class InvoicePayment(models.Model):
+    """
+    money received against an invoice; see invoice.receivables for applying and reversing
+    """
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='receipts')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    paid_on = models.DateField(default=timezone.localdate)
+    method = models.CharField(max_length=50, blank=True)
+    reference = models.CharField(max_length=100, blank=True)
+    recorded_at = models.DateTimeField(auto_now_add=True)
+    tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE, null=True, blank=True)
+
+    class Meta:
+        ordering = ['-paid_on', '-id']
+
+    def __str__(self):
+        return f"{self.amount} against invoice #{self.invoice_id}"
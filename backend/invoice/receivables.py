@@ -0,0 +1,87 @@
+"""
+Accounts receivable.
+
+Every invoice carries `amount_paid` and `outstanding`. Payments are applied with a single
+UPDATE that adds to one and takes off the other in the database, so balances never have
+to be recomputed from the payment history and concurrent payments cannot overwrite each
+other. Open invoices are found through the partial (tenant, due_date) index on
+outstanding > 0, and the aging report is one grouped query over it. An invoice counts as
+a purchase in its customer's stats once it is paid in full.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from customers.stats import record_paid_invoices
+from erp.aging import aging_buckets, amount_by_pk
+from .models import Invoice, InvoicePayment
+
+
+class ReceivablesError(Exception):
+    """
+    raised when a payment cannot be applied
+    """
+
+
+def apply_payments(payments):
+    """
+    save unsaved InvoicePayment instances and move their invoices' balances in one UPDATE.
+    Raises ReceivablesError, saving nothing, when a payment is not positive or would take
+    an invoice below zero.
+    """
+    amounts = {}
+    for payment in payments:
+        if payment.amount <= 0:
+            raise ReceivablesError("Payment amounts must be positive.")
+        amounts[payment.invoice_id] = amounts.get(payment.invoice_id, 0) + payment.amount
+    if not amounts:
+        return []
+
+    with transaction.atomic():
+        change = amount_by_pk(amounts)
+        # an invoice whose outstanding balance is smaller than what is applied is left out
+        # of the update, which the row count gives away
+        covered = Q()
+        for invoice_id, amount in amounts.items():
+            covered |= Q(pk=invoice_id, outstanding__gte=amount)
+        updated = Invoice.objects.filter(covered).update(
+            amount_paid=F('amount_paid') + change,
+            outstanding=F('outstanding') - change,
+        )
+        if updated != len(amounts):
+            raise ReceivablesError("A payment is larger than the invoice's outstanding balance.")
+        # every payment is positive, so an invoice at zero now was settled by this call
+        record_paid_invoices(Invoice.objects.filter(pk__in=amounts, outstanding=0)
+                             .values('customer_id', 'invoice_date', 'total_amount', 'tenant_id'))
+        return InvoicePayment.objects.bulk_create(payments)
+
+
+def reverse_payment(payment):
+    """
+    delete a recorded payment and put its amount back on the invoice
+    """
+    with transaction.atomic():
+        settled = list(Invoice.objects.select_for_update().filter(pk=payment.invoice_id, outstanding=0)
+                       .values('customer_id', 'invoice_date', 'total_amount', 'tenant_id'))
+        record_paid_invoices(settled, sign=-1)
+        Invoice.objects.filter(pk=payment.invoice_id).update(
+            amount_paid=F('amount_paid') - payment.amount,
+            outstanding=F('outstanding') + payment.amount,
+        )
+        payment.delete()
+
+
+def aging_report(as_of=None, tenant=None):
+    """
+    outstanding balances per customer split into 0–30, 31–60, 61–90 and 90+ days past due
+    at `as_of` (today by default), largest balance first, from one grouped query
+    """
+    as_of = as_of or timezone.localdate()
+    invoices = Invoice.objects.filter(outstanding__gt=0)
+    if tenant is not None:
+        invoices = invoices.filter(tenant=tenant)
+    return list(
+        invoices.values('customer_id', 'customer_name')
+        .annotate(total=Sum('outstanding'), invoices=Count('id'), **aging_buckets(as_of))
+        .order_by('-total', 'customer_name')
+    )
@@ -0,0 +1,185 @@
+"""
+Recurring invoices.
+
+An InvoiceTemplate holds the header and lines of an invoice that is sent every week,
+month, quarter or year. `generate_due_invoices` turns every template due on a date into
+invoices, a chunk of templates at a time:
+
+* the chunk's templates are locked with SKIP LOCKED, so two runs never bill the same
+  template, and the (template, invoice_date) unique constraint backs that up;
+* each template's subtotal and tax come from one grouped query over the stored totals
+  of the chunk's items, so they always equal the sum of the generated lines;
+* headers, lines and the templates' schedules are written with bulk_create/bulk_update.
+
+A template that missed periods (the generator did not run for a while) gets one invoice
+per missed period, each dated on its own period. Periods that already have an invoice are
+skipped, and should a template's invoices still clash with existing ones, that template
+is left for the next run (and logged) while the rest of its chunk is billed.
+"""
+import calendar
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Invoice, InvoiceItem, InvoiceTemplate, InvoiceTemplateItem
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+ZERO = Decimal('0.00')
+MONTHS = {'monthly': 1, 'quarterly': 3, 'yearly': 12}
+
+
+def period_date(start, frequency, period):
+    """
+    date of the `period`-th invoice (0 is the first) of a schedule starting on `start`;
+    monthly schedules keep their day, falling back to the month's last day when it is short
+    """
+    if frequency == 'weekly':
+        return start + timedelta(weeks=period)
+    months = start.month - 1 + MONTHS[frequency] * period
+    year, month = start.year + months // 12, months % 12 + 1
+    return start.replace(year=year, month=month, day=min(start.day, calendar.monthrange(year, month)[1]))
+
+
+def first_period_from(start, frequency, day):
+    """
+    the first period of a schedule starting on `start` that falls on or after `day`
+    """
+    if day <= start:
+        return 0
+    if frequency == 'weekly':
+        return -(-(day - start).days // 7)
+    period = ((day.year - start.year) * 12 + day.month - start.month) // MONTHS[frequency]
+    while period_date(start, frequency, period) < day:
+        period += 1
+    return period
+
+
+def reschedule(template, today=None):
+    """
+    move `template` (not saved) onto its current start date and frequency, from the first
+    period after its last invoice and no earlier than today, so an edit never bills a
+    period twice or backfills the past. periods_generated is the position in the schedule.
+    """
+    since = today or timezone.localdate()
+    if template.last_generated_on is not None:
+        since = max(since, template.last_generated_on + timedelta(days=1))
+    template.periods_generated = first_period_from(template.start_date, template.frequency, since)
+    template.next_run_date = period_date(template.start_date, template.frequency, template.periods_generated)
+
+
+def template_totals(template_ids):
+    """
+    {template id: (subtotal, tax)} summed over the templates' items in one grouped query
+    """
+    rows = (
+        InvoiceTemplateItem.objects.filter(template_id__in=template_ids)
+        .values('template_id')
+        .annotate(subtotal=Sum('line_net'), total_tax=Sum('line_tax'))
+    )
+    return {row['template_id']: (row['subtotal'], row['total_tax']) for row in rows}
+
+
+def _advance(template, run_date):
+    """
+    the invoice dates `template` owes up to `run_date`, moving its schedule past them
+    """
+    dates = []
+    while template.next_run_date <= run_date and (template.end_date is None or template.next_run_date <= template.end_date):
+        dates.append(template.next_run_date)
+        template.last_generated_on = template.next_run_date
+        template.periods_generated += 1
+        template.next_run_date = period_date(template.start_date, template.frequency, template.periods_generated)
+    if template.end_date is not None and template.next_run_date > template.end_date:
+        template.is_active = False
+    return dates
+
+
+def _invoice(template, day, subtotal, tax):
+    return Invoice(
+        invoice_number=f"REC-{template.pk}-{day:%Y%m%d}",
+        invoice_date=day,
+        due_date=day + timedelta(days=template.payment_terms_days),
+        customer_id=template.customer_id,
+        customer_name=template.customer_name,
+        customer_email=template.customer_email,
+        customer_phone=template.customer_phone,
+        customer_address=template.customer_address,
+        notes=template.notes,
+        subtotal=subtotal,
+        total_tax=tax,
+        total_amount=subtotal + tax,
+        outstanding=subtotal + tax,
+        template_id=template.pk,
+        tenant_id=template.tenant_id,
+    )
+
+
+def _write(invoices, chunk_size):
+    """
+    insert (invoice, template) pairs with their lines, in a savepoint
+    """
+    for invoice, _ in invoices:
+        # ids handed out by a rolled back attempt
+        invoice.pk = None
+    with transaction.atomic():
+        Invoice.objects.bulk_create([invoice for invoice, _ in invoices], batch_size=chunk_size)
+        InvoiceItem.objects.bulk_create([
+            InvoiceItem(invoice=invoice, product_id=item.product_id, description=item.description,
+                        quantity=item.quantity, rate=item.rate, tax_rate=item.tax_rate,
+                        line_net=item.line_net, line_tax=item.line_tax, line_gross=item.line_gross)
+            for invoice, template in invoices
+            for item in template.items.all()
+        ], batch_size=5000)
+    return len(invoices)
+
+
+def generate_due_invoices(run_date=None, chunk_size=CHUNK_SIZE):
+    """
+    create the invoices of every active template due on or before `run_date` (today by
+    default); returns how many invoices were created
+    """
+    run_date = run_date or timezone.localdate()
+    due = InvoiceTemplate.objects.filter(is_active=True, next_run_date__lte=run_date)
+    template_ids = list(due.order_by('pk').values_list('pk', flat=True))
+    created = 0
+    for start in range(0, len(template_ids), chunk_size):
+        with transaction.atomic():
+            templates = list(
+                due.filter(pk__in=template_ids[start:start + chunk_size])
+                .select_for_update(skip_locked=True).order_by('pk').prefetch_related('items')
+            )
+            totals = template_totals([template.pk for template in templates])
+            owed = {template: _advance(template, run_date) for template in templates}
+            billed = set(
+                Invoice.objects.filter(template_id__in=[template.pk for template in templates],
+                                       invoice_date__in={day for days in owed.values() for day in days})
+                .values_list('template_id', 'invoice_date')
+            )
+            invoices = {
+                template: [_invoice(template, day, *totals.get(template.pk, (ZERO, ZERO)))
+                           for day in days if (template.pk, day) not in billed]
+                for template, days in owed.items()
+            }
+
+            try:
+                created += _write([(invoice, template) for template in templates for invoice in invoices[template]],
+                                  chunk_size)
+            except IntegrityError:
+                # one template's clash must not hold up the others: bill them one by one
+                for template in list(templates):
+                    try:
+                        created += _write([(invoice, template) for invoice in invoices[template]], chunk_size)
+                    except IntegrityError:
+                        logger.exception("Recurring invoice template %s clashes with existing invoices", template.pk)
+                        templates.remove(template)
+            InvoiceTemplate.objects.bulk_update(
+                templates, ['periods_generated', 'next_run_date', 'last_generated_on', 'is_active'],
+                batch_size=chunk_size,
+            )
+    return created
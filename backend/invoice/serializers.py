@@ -1,13 +1,23 @@
 from datetime import timezone
+from decimal import Decimal
+from django.db import transaction
 from rest_framework import serializers
+from erp.db import sync_line_items
+from erp.totals import LINE_TOTAL_FIELDS, refresh_totals
+from .recurring import reschedule
 from customers.models import *
 from .models import *
 
+LINE_FIELDS = ['product', 'description', 'quantity', 'rate', 'tax_rate']
+
 class InvoiceItemSerializer(serializers.ModelSerializer):
+    # sent back on update to keep a line; lines without an id are added
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = InvoiceItem
-        fields = ['id', 'product', 'description', 'quantity', 'rate', 'tax_rate']
-        extra_kwargs = {"id": {"read_only": True}}
+        fields = ['id', 'product', 'description', 'quantity', 'rate', 'tax_rate', 'line_net', 'line_tax', 'line_gross']
+        read_only_fields = LINE_TOTAL_FIELDS
 
 class InvoiceSerializer(serializers.ModelSerializer):
     
@@ -17,27 +27,28 @@ class InvoiceSerializer(serializers.ModelSerializer):
         model = Invoice
        
         fields = [
-            'id', 'invoice_number', 'invoice_date', 'due_date',
+            'id', 'invoice_number', 'invoice_date', 'due_date', 'customer',
             'customer_name', 'customer_email', 'customer_address',
             'customer_phone', 'notes',
-            'subtotal', 'total_tax', 'total_amount', 'tenant', 'items'
+            'subtotal', 'total_tax', 'total_amount', 'amount_paid', 'outstanding', 'tenant', 'items'
         ]
-        read_only_fields = ['tenant', 'total_tax']
+        read_only_fields = ['tenant', 'subtotal', 'total_tax', 'total_amount', 'amount_paid', 'outstanding']
+        # walk-in invoices have no customer on file
+        extra_kwargs = {'customer': {'required': False}}
         
+    @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop('items', [])
-        subtotal = sum(item['quantity'] * item['rate'] for item in items_data)
-        total_tax = sum(item['quantity'] * item['rate'] * (item['tax_rate'] / 100) for item in items_data)
-        total_amount = subtotal + total_tax
-        validated_data['subtotal'] = subtotal
-        validated_data['total_tax'] = total_tax
-        validated_data['total_amount'] = total_amount
         invoice = Invoice.objects.create(**validated_data)
         for item in items_data:
-            InvoiceItem.objects.create(invoice=invoice, **item)
-            
+            item.pop('id', None)
+        InvoiceItem.objects.bulk_create([InvoiceItem(invoice=invoice, **item).set_totals() for item in items_data])
+        refresh_totals(Invoice, InvoiceItem, 'invoice', [invoice.pk])
+        invoice.refresh_from_db(fields=['subtotal', 'total_tax', 'total_amount', 'outstanding'])
+
         return invoice
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         items_data = validated_data.pop('items', None)
         for attr, value in validated_data.items():
@@ -45,8 +56,116 @@ class InvoiceSerializer(serializers.ModelSerializer):
         instance.save()
 
         if items_data is not None:
-            instance.items.all().delete()
-            for item_data in items_data:
-                InvoiceItem.objects.create(invoice=instance, **item_data)
+            try:
+                sync_line_items(InvoiceItem, 'invoice', instance, items_data, LINE_FIELDS,
+                                prepare=InvoiceItem.set_totals, prepared_fields=LINE_TOTAL_FIELDS)
+            except ValueError as e:
+                raise serializers.ValidationError({'items': [str(e)]})
+            refresh_totals(Invoice, InvoiceItem, 'invoice', [instance.pk])
+            instance.refresh_from_db(fields=['subtotal', 'total_tax', 'total_amount', 'outstanding'])
+
+        return instance
+
+
+class InvoiceSummarySerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Invoice
+        fields = ['id', 'invoice_number', 'invoice_date', 'due_date', 'customer', 'customer_name',
+                  'subtotal', 'total_tax', 'total_amount', 'amount_paid', 'outstanding']
+        read_only_fields = fields
+
+
+class InvoiceListFilterSerializer(serializers.Serializer):
+    customer = serializers.IntegerField(required=False)
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    status = serializers.ChoiceField(choices=['due', 'overdue', 'paid'], required=False)
+    summary = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if attrs.get('start') and attrs.get('end') and attrs['start'] > attrs['end']:
+            raise serializers.ValidationError("The start date must not be after the end date.")
+        return attrs
+
+
+class InvoicePaymentSerializer(serializers.ModelSerializer):
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+
+    class Meta:
+        model = InvoicePayment
+        fields = ['id', 'invoice', 'amount', 'paid_on', 'method', 'reference', 'recorded_at']
+        read_only_fields = ['invoice', 'recorded_at']
+
+
+class AgingSerializer(serializers.Serializer):
+    as_of = serializers.DateField(required=False)
+
+
+class InvoiceTemplateItemSerializer(serializers.ModelSerializer):
+    # sent back on update to keep a line; lines without an id are added
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = InvoiceTemplateItem
+        fields = ['id', 'product', 'description', 'quantity', 'rate', 'tax_rate', 'line_net', 'line_tax', 'line_gross']
+        read_only_fields = LINE_TOTAL_FIELDS
+
+
+class InvoiceTemplateSerializer(serializers.ModelSerializer):
+
+    items = InvoiceTemplateItemSerializer(many=True)
+
+    class Meta:
+        model = InvoiceTemplate
+        fields = [
+            'id', 'name', 'customer', 'customer_name', 'customer_email', 'customer_phone',
+            'customer_address', 'notes', 'frequency', 'start_date', 'end_date', 'payment_terms_days',
+            'periods_generated', 'next_run_date', 'last_generated_on', 'is_active', 'tenant', 'items'
+        ]
+        read_only_fields = ['periods_generated', 'next_run_date', 'last_generated_on', 'tenant']
+
+    def validate(self, attrs):
+        start_date = attrs.get('start_date', getattr(self.instance, 'start_date', None))
+        end_date = attrs.get('end_date', getattr(self.instance, 'end_date', None))
+        if start_date and end_date and end_date < start_date:
+            raise serializers.ValidationError("The end date must not be before the start date.")
+        return attrs
+
+    @transaction.atomic
+    def create(self, validated_data):
+        items_data = validated_data.pop('items', [])
+        validated_data['next_run_date'] = validated_data['start_date']
+        template = InvoiceTemplate.objects.create(**validated_data)
+        for item in items_data:
+            item.pop('id', None)
+        InvoiceTemplateItem.objects.bulk_create(
+            [InvoiceTemplateItem(template=template, **item).set_totals() for item in items_data]
+        )
+        return template
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        items_data = validated_data.pop('items', None)
+        rescheduled = any(
+            field in validated_data and validated_data[field] != getattr(instance, field)
+            for field in ('start_date', 'frequency')
+        )
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        if rescheduled:
+            # a new start date or frequency moves the rest of the schedule with it
+            reschedule(instance)
+        instance.save()
+
+        if items_data is not None:
+            try:
+                sync_line_items(InvoiceTemplateItem, 'template', instance, items_data, LINE_FIELDS,
+                                prepare=InvoiceTemplateItem.set_totals, prepared_fields=LINE_TOTAL_FIELDS)
+            except ValueError as e:
+                raise serializers.ValidationError({'items': [str(e)]})
+        return instance
+
 
-        return instance
\ No newline at end of file
+class RecurringRunSerializer(serializers.Serializer):
+    run_date = serializers.DateField(required=False)
@@ -1,3 +1,41 @@
-from django.test import TestCase
+from datetime import date
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from .models import InvoiceTemplate
+from .recurring import first_period_from, period_date, reschedule
+
+
+class FirstPeriodFromTests(SimpleTestCase):
+
+    def test_periods_on_or_after_a_day(self):
+        cases = [
+            (date(2026, 1, 31), 'monthly', date(2026, 3, 1), 2),   # Feb 28 is before, Mar 31 is not
+            (date(2026, 1, 31), 'monthly', date(2026, 2, 28), 1),
+            (date(2026, 1, 5), 'weekly', date(2026, 1, 19), 2),
+            (date(2026, 1, 5), 'weekly', date(2026, 1, 20), 3),
+            (date(2026, 1, 15), 'quarterly', date(2026, 5, 1), 2),
+            (date(2026, 1, 15), 'yearly', date(2025, 6, 1), 0),
+        ]
+        for start, frequency, day, period in cases:
+            with self.subTest(start=start, frequency=frequency, day=day):
+                self.assertEqual(first_period_from(start, frequency, day), period)
+                self.assertGreaterEqual(period_date(start, frequency, period), day)
+
+
+class RescheduleTests(SimpleTestCase):
+
+    def template(self, **fields):
+        return InvoiceTemplate(**{'start_date': date(2026, 1, 10), 'frequency': 'monthly', **fields})
+
+    def test_a_new_schedule_starts_after_the_last_invoice(self):
+        template = self.template(frequency='weekly', periods_generated=3, last_generated_on=date(2026, 3, 10))
+        reschedule(template, today=date(2026, 3, 1))
+        self.assertEqual(template.next_run_date, date(2026, 3, 14))
+
+    def test_a_new_schedule_never_reaches_back_before_today(self):
+        # moving the start back a year must not bill the months in between
+        template = self.template(start_date=date(2025, 1, 10), periods_generated=2,
+                                 last_generated_on=date(2026, 2, 10))
+        reschedule(template, today=date(2026, 6, 2))
+        self.assertEqual((template.next_run_date, template.periods_generated), (date(2026, 6, 10), 17))
@@ -3,5 +3,12 @@ from .views import *
 
 urlpatterns = [
     path('quick_invoices/', InvoiceListCreateAPIView.as_view()),
-    path('quick_invoices/<int:pk>', InvoiceRetrieveUpdateDestroyAPIView.as_view())
+    path('quick_invoices/<int:pk>', InvoiceRetrieveUpdateDestroyAPIView.as_view()),
+    path('quick_invoices/<int:pk>/document/', InvoiceDocumentAPIView.as_view()),
+    path('quick_invoices/<int:pk>/payments/', InvoicePaymentListCreateAPIView.as_view()),
+    path('quick_invoices/<int:pk>/payments/<int:payment_pk>/', InvoicePaymentDestroyAPIView.as_view()),
+    path('receivables/aging/', ReceivablesAgingAPIView.as_view()),
+    path('invoice_templates/', InvoiceTemplateListCreateAPIView.as_view()),
+    path('invoice_templates/<int:pk>/', InvoiceTemplateRetrieveUpdateDestroyAPIView.as_view()),
+    path('invoice_templates/generate/', RecurringInvoiceRunAPIView.as_view())
 ]
\ No newline at end of file
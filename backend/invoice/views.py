@@ -7,17 +7,50 @@ from django.shortcuts import get_object_or_404
 from .models import *
 from tenants.models import *
 from django.db import transaction
+from django.utils import timezone
+from erp.pagination import IdCursorPagination
+from erp.rendering import FORMATS, document_response
+from .recurring import generate_due_invoices
+from .receivables import ReceivablesError, aging_report, apply_payments, reverse_payment
 
 class InvoiceListCreateAPIView(APIView):
     serializer_class = InvoiceSerializer
+    pagination_class = IdCursorPagination
     """
-    GET METHOD: To get all invoices in our schema
+    GET METHOD: To get the invoices in our schema a page at a time, newest first. Filters:
+    ?customer=<id>, ?start=/?end= on the invoice date, ?status=due|overdue|paid; ?summary=true
+    returns the header fields only. Follow `next` for the following page.
     """
     
     def get(self, request):
+        filters = InvoiceListFilterSerializer(data = request.query_params)
+        if not filters.is_valid():
+            return Response(filters.errors, status = status.HTTP_400_BAD_REQUEST)
+        params = filters.validated_data
         invoices = Invoice.objects.all()
-        serializer = InvoiceSerializer(invoices, many=True)
-        return Response(serializer.data, status = status.HTTP_200_OK)
+        if 'customer' in params:
+            invoices = invoices.filter(customer_id=params['customer'])
+        if 'start' in params:
+            invoices = invoices.filter(invoice_date__gte=params['start'])
+        if 'end' in params:
+            invoices = invoices.filter(invoice_date__lte=params['end'])
+        if params.get('status') == 'due':
+            invoices = invoices.filter(outstanding__gt=0, due_date__gte=timezone.localdate())
+        elif params.get('status') == 'overdue':
+            invoices = invoices.filter(outstanding__gt=0, due_date__lt=timezone.localdate())
+        elif params.get('status') == 'paid':
+            invoices = invoices.filter(outstanding__lte=0)
+
+        if params['summary']:
+            serializer_class = InvoiceSummarySerializer
+            invoices = invoices.only(*InvoiceSummarySerializer.Meta.fields)
+        else:
+            serializer_class = self.serializer_class
+            invoices = invoices.prefetch_related('items')
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(invoices, request, view=self)
+        serializer = serializer_class(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     """
     POST METHOD: To create an Invoice
@@ -76,5 +109,157 @@ class InvoiceRetrieveUpdateDestroyAPIView(APIView):
         invoice = self.get_object(pk)
         invoice.delete()
         return Response(status = status.HTTP_204_NO_CONTENT)
+
+
+class InvoiceDocumentAPIView(APIView):
+    """
+    GET METHOD: To get an invoice as a PDF (default) or HTML page, rendered on the server and
+    cached until the invoice changes, e.g. ?output=html; ?download=true sends it as an attachment
+    """
+    def get(self, request, pk):
+        output = request.query_params.get('output', 'pdf')
+        if output not in FORMATS:
+            return Response({'error': f"output must be one of {', '.join(FORMATS)}"}, status = status.HTTP_400_BAD_REQUEST)
+        invoice = get_object_or_404(Invoice.objects.select_related('tenant').prefetch_related('items'), pk=pk)
+        download = request.query_params.get('download', '').lower() in ('1', 'true')
+        return document_response(request, invoice.document_data(), output, download)
+
+
+class InvoicePaymentListCreateAPIView(APIView):
+    serializer_class = InvoicePaymentSerializer
+    """
+    GET METHOD: To get the payments received against an invoice
+    """
+    
+    def get(self, request, pk):
+        invoice = get_object_or_404(Invoice, pk=pk)
+        serializer = self.serializer_class(invoice.receipts.all(), many=True)
+        return Response(serializer.data, status = status.HTTP_200_OK)
+    
+    """
+    POST METHOD: To record a payment against an invoice; its outstanding balance goes down
+    by the amount paid
+    """
+    
+    def post(self, request, pk):
+        invoice = get_object_or_404(Invoice, pk=pk)
+        serializer = self.serializer_class(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
+        payment = InvoicePayment(invoice=invoice, tenant=request.user.tenant, **serializer.validated_data)
+        try:
+            with transaction.atomic():
+                apply_payments([payment])
+                ActivityLogs.objects.create(
+                    tenant=request.user.tenant,
+                    action_type='payment_received',
+                    message=f'A payment of {payment.amount} was received against invoice "{invoice.invoice_number}".'
+                )
+        except ReceivablesError as e:
+            return Response({'error': str(e)}, status = status.HTTP_400_BAD_REQUEST)
+        return Response(self.serializer_class(payment).data, status = status.HTTP_201_CREATED)
+
+
+class InvoicePaymentDestroyAPIView(APIView):
+    """
+    DELETE METHOD: To reverse a payment recorded against an invoice by mistake
+    """
+    
+    def delete(self, request, pk, payment_pk):
+        payment = get_object_or_404(InvoicePayment, pk=payment_pk, invoice_id=pk)
+        reverse_payment(payment)
+        return Response(status = status.HTTP_204_NO_CONTENT)
+
+
+class ReceivablesAgingAPIView(APIView):
+    serializer_class = AgingSerializer
+    """
+    GET METHOD: To get what each customer owes, split into 0-30, 31-60, 61-90 and 90+ days
+    past due, e.g. ?as_of=2025-06-30 (today by default)
+    """
     
+    def get(self, request):
+        serializer = self.serializer_class(data = request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
+        as_of = serializer.validated_data.get('as_of') or timezone.localdate()
+        report = aging_report(as_of, tenant=request.user.tenant)
+        return Response({'as_of': as_of, 'customers': report}, status = status.HTTP_200_OK)
+
+
+class InvoiceTemplateListCreateAPIView(APIView):
+    serializer_class = InvoiceTemplateSerializer
+    """
+    GET METHOD: To get the recurring invoice templates
+    """
     
+    def get(self, request):
+        templates = InvoiceTemplate.objects.prefetch_related('items').order_by('next_run_date', 'id')
+        serializer = self.serializer_class(templates, many=True)
+        return Response(serializer.data, status = status.HTTP_200_OK)
+    
+    """
+    POST METHOD: To set up an invoice that is generated every week, month, quarter or year
+    """
+    
+    def post(self, request):
+        serializer = self.serializer_class(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
+        serializer.save(tenant = request.user.tenant)
+        return Response(serializer.data, status = status.HTTP_201_CREATED)
+
+
+class InvoiceTemplateRetrieveUpdateDestroyAPIView(APIView):
+    serializer_class = InvoiceTemplateSerializer
+    
+    def get_object(self, pk):
+        return get_object_or_404(InvoiceTemplate, pk=pk)
+    
+    """
+    GET METHOD: To get a recurring invoice template
+    """
+    
+    def get(self, request, pk):
+        serializer = self.serializer_class(self.get_object(pk))
+        return Response(serializer.data, status = status.HTTP_200_OK)
+    
+    """
+    PUT METHOD: To edit a template; invoices already generated are left as they are
+    """
+    
+    def put(self, request, pk):
+        serializer = self.serializer_class(self.get_object(pk), data = request.data, partial = True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
+        serializer.save()
+        return Response(serializer.data, status = status.HTTP_200_OK)
+    
+    """
+    DELETE METHOD: To delete a template; its invoices are kept
+    """
+    
+    def delete(self, request, pk):
+        self.get_object(pk).delete()
+        return Response(status = status.HTTP_204_NO_CONTENT)
+
+
+class RecurringInvoiceRunAPIView(APIView):
+    serializer_class = RecurringRunSerializer
+    """
+    POST METHOD: To generate every recurring invoice due on or before a date (today by default)
+    """
+    
+    def post(self, request):
+        serializer = self.serializer_class(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
+        run_date = serializer.validated_data.get('run_date') or timezone.localdate()
+        created = generate_due_invoices(run_date)
+        if created:
+            ActivityLogs.objects.create(
+                tenant=request.user.tenant,
+                action_type='invoice_created',
+                message=f'{created} recurring invoices were generated for {run_date}.'
+            )
+        return Response({'run_date': run_date, 'invoices_created': created}, status = status.HTTP_200_OK)
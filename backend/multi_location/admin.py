@@ -2,4 +2,8 @@ from django.contrib import admin
 from .models import *
 # Register your models here.
 admin.site.register(Branch)
-admin.site.register(StockTransfer)
\ No newline at end of file
+admin.site.register(StockTransfer)
+admin.site.register(StockTransferItem)
+admin.site.register(BranchStock)
+admin.site.register(BranchMetrics)
+admin.site.register(BranchDailyMetrics)
\ No newline at end of file
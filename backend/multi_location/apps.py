@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class MultiLocationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'multi_location'
+
+    def ready(self):
+        from erp.lookups import register_lookup
+        from .models import Branch
+        register_lookup(Branch)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from multi_location.rebalancing import rebalance_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Suggest inter-branch stock transfers and save them as pending transfers. "
+        "Run per tenant, e.g. `manage.py tenant_command rebalance_stock --schema=<tenant>`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cover-days', type=int, default=14,
+                            help="Days of sales each branch should be able to cover.")
+        parser.add_argument('--velocity-days', type=int, default=28,
+                            help="Days of completed orders used to measure sales velocity.")
+        parser.add_argument('--budget', type=float, default=None,
+                            help="Maximum stock value (at cost) to move in this run.")
+        parser.add_argument('--min-quantity', type=int, default=1,
+                            help="Smallest quantity worth putting on a transfer line.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Work out the suggestions without saving any transfer.")
+
+    def handle(self, *args, **options):
+        summary = rebalance_stock(
+            tenant_id=connection.tenant.pk,
+            cover_days=options['cover_days'],
+            velocity_days=options['velocity_days'],
+            budget=options['budget'],
+            min_quantity=options['min_quantity'],
+            dry_run=options['dry_run'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['positions']} stock positions checked: {summary['lines']} lines, "
+            f"{summary['units']} units worth {summary['value']:.2f} suggested "
+            f"in {summary['transfers']} transfers."
+        ))
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_transfer_lines(apps, schema_editor):
+    StockTransfer = apps.get_model('multi_location', 'StockTransfer')
+    StockTransferItem = apps.get_model('multi_location', 'StockTransferItem')
+    StockTransferItem.objects.bulk_create(
+        [
+            StockTransferItem(transfer_id=transfer_id, product_id=product_id, quantity=quantity)
+            for transfer_id, product_id, quantity in
+            StockTransfer.objects.values_list('id', 'product_id', 'quantity').iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('multi_location', '0003_stocktransfer_dispatched_at_and_more'),
+        ('products', '0010_product_branch'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stocktransfer',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='legacy_stock_transfers', to='products.product'),
+        ),
+        migrations.CreateModel(
+            name='StockTransferItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_transfers', to='products.product')),
+                ('transfer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='multi_location.stocktransfer')),
+            ],
+            options={
+                'unique_together': {('transfer', 'product')},
+            },
+        ),
+        migrations.RunPython(copy_transfer_lines, migrations.RunPython.noop),
+    ]
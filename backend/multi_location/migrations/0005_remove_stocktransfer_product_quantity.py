@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:22
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('multi_location', '0004_stocktransferitem'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='stocktransfer',
+            name='product',
+        ),
+        migrations.RemoveField(
+            model_name='stocktransfer',
+            name='quantity',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('multi_location', '0005_remove_stocktransfer_product_quantity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='branchstock',
+            name='max_level',
+            field=models.PositiveIntegerField(default=0, help_text='0 means no upper limit is set for this branch.'),
+        ),
+        migrations.AddField(
+            model_name='branchstock',
+            name='min_level',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
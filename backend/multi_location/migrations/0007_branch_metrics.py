@@ -0,0 +1,74 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def seed_home_branch_stock(apps, schema_editor):
+    """
+    give every product that belongs to a branch its BranchStock row, so the low-stock
+    counters start from the whole catalogue rather than only from transferred products
+    """
+    BranchStock = apps.get_model('multi_location', 'BranchStock')
+    Product = apps.get_model('products', 'Product')
+    BranchStock.objects.bulk_create(
+        [
+            BranchStock(
+                branch_id=product.branch_id,
+                product_id=product.pk,
+                quantity=product.current_stock,
+                min_level=product.minimum_stock_level,
+                tenant_id=product.branch.tenant_id,
+            )
+            for product in Product.objects.filter(branch__isnull=False).select_related('branch').iterator()
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('multi_location', '0006_branchstock_max_level_branchstock_min_level'),
+        ('products', '0011_order_branch_reorderrequest'),
+        ('tenants', '0007_alter_activitylogs_action_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BranchMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('open_drawers', models.IntegerField(default=0)),
+                ('open_drawer_balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('pending_transfers_in', models.IntegerField(default=0)),
+                ('pending_transfers_out', models.IntegerField(default=0)),
+                ('low_stock_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('branch', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='metrics', to='multi_location.branch')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tenants.tenant')),
+            ],
+            options={
+                'verbose_name_plural': 'branch metrics',
+            },
+        ),
+        migrations.CreateModel(
+            name='BranchDailyMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('sales_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('orders_count', models.IntegerField(default=0)),
+                ('expense_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('expense_count', models.IntegerField(default=0)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_metrics', to='multi_location.branch')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tenants.tenant')),
+            ],
+            options={
+                'verbose_name_plural': 'branch daily metrics',
+                'unique_together': {('branch', 'date')},
+            },
+        ),
+        migrations.RunPython(seed_home_branch_stock, migrations.RunPython.noop),
+    ]
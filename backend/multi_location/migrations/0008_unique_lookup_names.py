@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('multi_location', '0007_branch_metrics'),
+        ('tenants', '0007_alter_activitylogs_action_type'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='branch',
+            constraint=models.UniqueConstraint(fields=('branch_name', 'tenant'), name='unique_branch_name_per_tenant'),
+        ),
+    ]
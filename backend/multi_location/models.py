@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from erp.db import upsert_increment
 from django_tenants.models import TenantMixin
 from products.models import *
 
@@ -60,6 +61,9 @@ STATUS_CHOICES = [
         ('in_transit', 'In Transit'),
         ('received', 'Received'),
     ]
+# transfers still counted as pending on the branch dashboard
+PENDING_TRANSFER_STATUSES = ('pending', 'approved', 'in_transit')
+
 class Branch(models.Model):
     branch_name = models.CharField(max_length=100)
     manager = models.CharField(max_length=100)
@@ -70,6 +74,11 @@ class Branch(models.Model):
     operating_hours = models.CharField(max_length=100)
     is_active = models.BooleanField(default = True)
     tenant = models.ForeignKey('tenants.Tenant',on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['branch_name', 'tenant'], name='unique_branch_name_per_tenant'),
+        ]
     
     def __str__(self):
         return self.branch_name
@@ -91,12 +100,6 @@ class Branch(models.Model):
 class StockTransfer(models.Model):
     from_branch = models.ForeignKey('Branch', on_delete=models.CASCADE, related_name='outgoing_transfers')
     to_branch = models.ForeignKey(Branch,on_delete=models.CASCADE, related_name = 'incoming_transfers')
-    product = models.ForeignKey(
-        'products.Product',
-        on_delete=models.CASCADE,
-        related_name='stock_transfers'
-    )
-    quantity = models.PositiveIntegerField()
     reason = models.TextField(blank=True)
     status = models.CharField(
         max_length=20,
@@ -106,7 +109,351 @@ class StockTransfer(models.Model):
     requested_at = models.DateTimeField(auto_now_add=True)
     approved_at = models.DateTimeField(null=True, blank=True)
     rejected_at = models.DateTimeField(null=True, blank=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    received_at = models.DateTimeField(null=True, blank=True)
+    tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE)
+
+    def __str__(self):
+        return f"Transfer #{self.pk} from {self.from_branch} to {self.to_branch}"
+
+    def dispatch(self):
+        """
+        debit the sending branch and move every line into the receiving branch's in-transit bucket.
+        """
+        return dispatch_transfers([self.pk])[0]
+
+    def receive(self):
+        """
+        move every in-transit line onto the receiving branch's shelf.
+        """
+        return receive_transfers([self.pk])[0]
+
+
+class StockTransferItem(models.Model):
+    transfer = models.ForeignKey(StockTransfer, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(
+        'products.Product',
+        on_delete=models.CASCADE,
+        related_name='stock_transfers'
+    )
+    quantity = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('transfer', 'product')
+
+    def __str__(self):
+        return f"{self.product.name} x {self.quantity}"
+
+
+class BranchStock(models.Model):
+    """
+    stock position of a catalog product at a branch. `quantity` is what is on the shelf,
+    `in_transit` is what has been dispatched towards this branch and not yet received.
+    """
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='stock_levels')
+    product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='branch_stock')
+    quantity = models.PositiveIntegerField(default=0)
+    in_transit = models.PositiveIntegerField(default=0)
+    min_level = models.PositiveIntegerField(default=0)
+    max_level = models.PositiveIntegerField(default=0, help_text="0 means no upper limit is set for this branch.")
     tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE)
 
+    class Meta:
+        unique_together = ('branch', 'product')
+        verbose_name_plural = 'branch stock'
+
+    def __str__(self):
+        return f"{self.product.name} at {self.branch.branch_name}: {self.quantity} (+{self.in_transit} in transit)"
+
+    @property
+    def is_low(self):
+        return self.quantity <= self.min_level
+
+
+class BranchMetrics(models.Model):
+    """
+    running counters behind the branch dashboard. They are adjusted by the code paths that
+    change the underlying records, so reading a dashboard never aggregates live tables.
+    `manage.py rebuild_branch_metrics` recomputes them from scratch.
+    """
+    branch = models.OneToOneField(Branch, on_delete=models.CASCADE, related_name='metrics')
+    open_drawers = models.IntegerField(default=0)
+    open_drawer_balance = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pending_transfers_in = models.IntegerField(default=0)
+    pending_transfers_out = models.IntegerField(default=0)
+    low_stock_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE)
+
+    class Meta:
+        verbose_name_plural = 'branch metrics'
+
     def __str__(self):
-        return f"Transfer of {self.quantity} units of {self.product.name} to {self.to_branch}"
\ No newline at end of file
+        return f"Metrics for {self.branch}"
+
+
+class BranchDailyMetrics(models.Model):
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='daily_metrics')
+    date = models.DateField()
+    sales_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders_count = models.IntegerField(default=0)
+    expense_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    expense_count = models.IntegerField(default=0)
+    tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('branch', 'date')
+        verbose_name_plural = 'branch daily metrics'
+
+    def __str__(self):
+        return f"{self.branch} on {self.date}"
+
+
+BRANCH_COUNTERS = ['open_drawers', 'open_drawer_balance', 'pending_transfers_in',
+                   'pending_transfers_out', 'low_stock_count']
+DAILY_COUNTERS = ['sales_total', 'orders_count', 'expense_total', 'expense_count']
+
+
+def adjust_branch_metrics(deltas):
+    """
+    add counter deltas onto BranchMetrics in one statement.
+    `deltas` is a list of dicts holding `branch_id`, `tenant_id` and any BRANCH_COUNTERS.
+    """
+    rows = []
+    for delta in deltas:
+        row = {counter: delta.get(counter, 0) for counter in BRANCH_COUNTERS}
+        if not any(row.values()):
+            continue
+        row.update(branch_id=delta['branch_id'], tenant_id=delta['tenant_id'], updated_at=timezone.now())
+        rows.append(row)
+    return upsert_increment(BranchMetrics, rows, keys=['branch_id'], add=BRANCH_COUNTERS, replace=['updated_at'])
+
+
+def adjust_daily_metrics(deltas):
+    """
+    add counter deltas onto the BranchDailyMetrics row of each (`branch_id`, `date`).
+    """
+    rows = []
+    for delta in deltas:
+        row = {counter: delta.get(counter, 0) for counter in DAILY_COUNTERS}
+        if not any(row.values()):
+            continue
+        row.update(branch_id=delta['branch_id'], date=delta['date'], tenant_id=delta['tenant_id'])
+        rows.append(row)
+    return upsert_increment(BranchDailyMetrics, rows, keys=['branch_id', 'date'], add=DAILY_COUNTERS)
+
+
+def count_open_transfers(transfers, sign=1):
+    """
+    adjust the pending in/out counters for transfers entering (sign=1) or leaving (sign=-1)
+    the open statuses
+    """
+    deltas = []
+    for transfer in transfers:
+        deltas.append({'branch_id': transfer.from_branch_id, 'tenant_id': transfer.tenant_id,
+                       'pending_transfers_out': sign})
+        deltas.append({'branch_id': transfer.to_branch_id, 'tenant_id': transfer.tenant_id,
+                       'pending_transfers_in': sign})
+    adjust_branch_metrics(deltas)
+
+
+class StockTransferError(Exception):
+    """
+    raised when a transfer cannot move through the requested status change
+    """
+
+
+def lock_branch_stock(pairs):
+    """
+    lock the BranchStock rows for the given (branch_id, product_id) pairs, creating any
+    missing row first. A product's home branch is seeded from `Product.current_stock`
+    and `Product.minimum_stock_level`.
+
+    Rows are always locked in (branch_id, product_id) order, so two transactions touching
+    the same branches in opposite directions queue up instead of deadlocking.
+    Must be called inside transaction.atomic().
+    """
+    pairs = sorted(set(pairs))
+    if not pairs:
+        return {}
+    branch_ids = {branch_id for branch_id, _ in pairs}
+    product_ids = {product_id for _, product_id in pairs}
+    existing = set(
+        BranchStock.objects.filter(branch_id__in=branch_ids, product_id__in=product_ids)
+        .values_list('branch_id', 'product_id')
+    )
+    missing = [pair for pair in pairs if pair not in existing]
+    if missing:
+        products = Product.objects.in_bulk({product_id for _, product_id in missing})
+        tenants = dict(Branch.objects.filter(pk__in={branch_id for branch_id, _ in missing}).values_list('pk', 'tenant_id'))
+        BranchStock.objects.bulk_create(
+            [
+                BranchStock(
+                    branch_id=branch_id,
+                    product_id=product_id,
+                    quantity=products[product_id].current_stock if products[product_id].branch_id == branch_id else 0,
+                    min_level=products[product_id].minimum_stock_level if products[product_id].branch_id == branch_id else 0,
+                    tenant_id=tenants[branch_id],
+                )
+                for branch_id, product_id in missing
+            ],
+            ignore_conflicts=True,
+        )
+
+    rows = (
+        BranchStock.objects.select_for_update()
+        .filter(branch_id__in=branch_ids, product_id__in=product_ids)
+        .order_by('branch_id', 'product_id')
+    )
+    wanted = set(pairs)
+    locked = {}
+    for row in rows:
+        pair = (row.branch_id, row.product_id)
+        if pair in wanted:
+            # rows created above have not been counted on the dashboard yet
+            row._counted_low = row.is_low if pair in existing else False
+            locked[pair] = row
+    return locked
+
+
+def save_branch_stock(rows):
+    """
+    write locked BranchStock rows back in one statement, keep `Product.current_stock` in
+    step for rows that sit at the product's home branch and move the low-stock counters.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    BranchStock.objects.bulk_update(rows, ['quantity', 'in_transit', 'min_level', 'max_level'])
+    products = Product.objects.in_bulk({row.product_id for row in rows})
+    home_products = []
+    low_stock = []
+    for row in rows:
+        product = products[row.product_id]
+        if product.branch_id == row.branch_id and product.current_stock != row.quantity:
+            product.current_stock = row.quantity
+            home_products.append(product)
+        was_low = getattr(row, '_counted_low', row.is_low)
+        if row.is_low != was_low:
+            low_stock.append({'branch_id': row.branch_id, 'tenant_id': row.tenant_id,
+                              'low_stock_count': 1 if row.is_low else -1})
+        row._counted_low = row.is_low
+    if home_products:
+        Product.objects.bulk_update(home_products, ['current_stock'])
+    adjust_branch_metrics(low_stock)
+
+
+def sync_home_stock(product):
+    """
+    carry a product's own `current_stock` and `minimum_stock_level` over to the BranchStock
+    row of its home branch after the product was created or edited directly
+    """
+    if not product.branch_id:
+        return
+    with transaction.atomic():
+        row = lock_branch_stock([(product.branch_id, product.pk)])[(product.branch_id, product.pk)]
+        row.quantity = product.current_stock
+        row.min_level = product.minimum_stock_level
+        save_branch_stock([row])
+
+
+def _lock_transfers(transfer_ids, expected_status):
+    transfers = list(
+        StockTransfer.objects.select_for_update()
+        .filter(pk__in=transfer_ids)
+        .order_by('pk')
+    )
+    found = {transfer.pk for transfer in transfers}
+    missing = sorted(set(transfer_ids) - found)
+    if missing:
+        raise StockTransferError(f"Stock transfers {missing} do not exist.")
+    wrong_status = [transfer.pk for transfer in transfers if transfer.status != expected_status]
+    if wrong_status:
+        raise StockTransferError(f"Stock transfers {wrong_status} are not {expected_status}.")
+    return transfers
+
+
+def approve_transfers(queryset):
+    """
+    approve every pending transfer in the queryset with a single UPDATE.
+    Returns the number of transfers approved.
+    """
+    return queryset.filter(status='pending').update(status='approved', approved_at=timezone.now())
+
+
+def _transfer_lines(transfers):
+    lines = {transfer.pk: [] for transfer in transfers}
+    for item in StockTransferItem.objects.filter(transfer_id__in=lines).order_by('transfer_id', 'product_id'):
+        lines[item.transfer_id].append(item)
+    return lines
+
+
+def dispatch_transfers(transfer_ids):
+    """
+    dispatch approved transfers in one transaction: debit each sending branch and credit the
+    receiving branch's in-transit bucket for every line. Either every transfer goes out or none does.
+    """
+    with transaction.atomic():
+        transfers = _lock_transfers(transfer_ids, 'approved')
+        if not transfers:
+            return []
+        lines = _transfer_lines(transfers)
+        pairs = []
+        for transfer in transfers:
+            for item in lines[transfer.pk]:
+                pairs.append((transfer.from_branch_id, item.product_id))
+                pairs.append((transfer.to_branch_id, item.product_id))
+        rows = lock_branch_stock(pairs)
+
+        shortages = []
+        for transfer in transfers:
+            for item in lines[transfer.pk]:
+                source = rows[(transfer.from_branch_id, item.product_id)]
+                destination = rows[(transfer.to_branch_id, item.product_id)]
+                if source.quantity < item.quantity:
+                    shortages.append(
+                        f"transfer {transfer.pk} needs {item.quantity} of product {item.product_id}, "
+                        f"{source.quantity} available"
+                    )
+                    continue
+                source.quantity -= item.quantity
+                destination.in_transit += item.quantity
+        if shortages:
+            raise StockTransferError("Insufficient stock at the sending branch: " + "; ".join(shortages) + ".")
+        save_branch_stock(rows.values())
+
+        now = timezone.now()
+        StockTransfer.objects.filter(pk__in=[t.pk for t in transfers]).update(status='in_transit', dispatched_at=now)
+        for transfer in transfers:
+            transfer.status = 'in_transit'
+            transfer.dispatched_at = now
+        return transfers
+
+
+def receive_transfers(transfer_ids):
+    """
+    receive in-transit transfers in one transaction: move every line from the receiving
+    branch's in-transit bucket onto its shelf.
+    """
+    with transaction.atomic():
+        transfers = _lock_transfers(transfer_ids, 'in_transit')
+        if not transfers:
+            return []
+        lines = _transfer_lines(transfers)
+        rows = lock_branch_stock(
+            [(transfer.to_branch_id, item.product_id) for transfer in transfers for item in lines[transfer.pk]]
+        )
+        for transfer in transfers:
+            for item in lines[transfer.pk]:
+                destination = rows[(transfer.to_branch_id, item.product_id)]
+                destination.in_transit -= item.quantity
+                destination.quantity += item.quantity
+        save_branch_stock(rows.values())
+
+        now = timezone.now()
+        StockTransfer.objects.filter(pk__in=[t.pk for t in transfers]).update(status='received', received_at=now)
+        for transfer in transfers:
+            transfer.status = 'received'
+            transfer.received_at = now
+        count_open_transfers(transfers, sign=-1)
+        return transfers
@@ -0,0 +1,259 @@
+"""
+Inter-branch stock rebalancing.
+
+Reads every BranchStock row together with its sales velocity into flat numpy arrays,
+works out which branches hold more of a product than they need and which are heading
+for a stockout, and pairs them up per product without any Python loop over rows.
+The resulting suggestions are written as pending StockTransfer documents, one per
+(from_branch, to_branch) pair, for a manager to approve the next morning.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from products.models import OrderItem, Product
+from .models import BranchStock, StockTransfer, StockTransferItem, count_open_transfers
+
+OPEN_TRANSFER_STATUSES = ('pending', 'approved')
+
+STOCK_DTYPE = [
+    ('branch', 'i8'), ('product', 'i8'), ('quantity', 'i8'),
+    ('in_transit', 'i8'), ('min_level', 'i8'), ('max_level', 'i8'),
+]
+
+
+def _keys(branch, product):
+    return (np.asarray(branch, dtype=np.int64) << 32) | np.asarray(product, dtype=np.int64)
+
+
+def _join(keys, other_keys, other_values, dtype):
+    """
+    look up `other_values` for each of `keys` (which must be sorted) by matching `other_keys`
+    """
+    out = np.zeros(len(keys), dtype=dtype)
+    if not len(other_keys) or not len(keys):
+        return out
+    idx = np.searchsorted(keys, other_keys)
+    idx = np.clip(idx, 0, len(keys) - 1)
+    hit = keys[idx] == other_keys
+    np.add.at(out, idx[hit], np.asarray(other_values, dtype=dtype)[hit])
+    return out
+
+
+def load_positions(velocity_days=28):
+    """
+    read stock, levels, sales velocity, open transfer commitments and unit cost for every
+    BranchStock row into a dict of equally long arrays sorted by (branch, product).
+    """
+    stock = np.fromiter(
+        BranchStock.objects.values_list(
+            'branch_id', 'product_id', 'quantity', 'in_transit', 'min_level', 'max_level'
+        ).iterator(chunk_size=20000),
+        dtype=STOCK_DTYPE,
+    )
+    keys = _keys(stock['branch'], stock['product'])
+    order = np.argsort(keys, kind='stable')
+    stock, keys = stock[order], keys[order]
+
+    since = timezone.now() - timedelta(days=velocity_days)
+    sold = np.fromiter(
+        OrderItem.objects.filter(order__status='completed', order__timestamp__gte=since)
+        .annotate(sold_at=Coalesce('order__branch_id', 'product__branch_id'))
+        .filter(sold_at__isnull=False)
+        .values('sold_at', 'product_id')
+        .annotate(units=Sum('quantity'))
+        .values_list('sold_at', 'product_id', 'units')
+        .iterator(chunk_size=20000),
+        dtype=[('branch', 'i8'), ('product', 'i8'), ('units', 'f8')],
+    )
+
+    open_items = StockTransferItem.objects.filter(transfer__status__in=OPEN_TRANSFER_STATUSES)
+    outgoing = np.fromiter(
+        open_items.values('transfer__from_branch_id', 'product_id')
+        .annotate(units=Sum('quantity'))
+        .values_list('transfer__from_branch_id', 'product_id', 'units'),
+        dtype=[('branch', 'i8'), ('product', 'i8'), ('units', 'i8')],
+    )
+    incoming = np.fromiter(
+        open_items.values('transfer__to_branch_id', 'product_id')
+        .annotate(units=Sum('quantity'))
+        .values_list('transfer__to_branch_id', 'product_id', 'units'),
+        dtype=[('branch', 'i8'), ('product', 'i8'), ('units', 'i8')],
+    )
+
+    product_ids = np.unique(stock['product'])
+    costs = np.fromiter(
+        Product.objects.filter(pk__in=product_ids.tolist()).values_list('id', 'cost_price'),
+        dtype=[('product', 'i8'), ('cost', 'f8')],
+    )
+    costs.sort(order='product')
+    cost_idx = np.clip(np.searchsorted(costs['product'], stock['product']), 0, max(len(costs) - 1, 0))
+    unit_cost = costs['cost'][cost_idx] if len(costs) else np.zeros(len(stock))
+
+    return {
+        'branch': stock['branch'],
+        'product': stock['product'],
+        'quantity': stock['quantity'],
+        'in_transit': stock['in_transit'],
+        'min_level': stock['min_level'],
+        'max_level': stock['max_level'],
+        'velocity': _join(keys, _keys(sold['branch'], sold['product']), sold['units'], np.float64) / velocity_days,
+        'reserved': _join(keys, _keys(outgoing['branch'], outgoing['product']), outgoing['units'], np.int64),
+        'on_order': _join(keys, _keys(incoming['branch'], incoming['product']), incoming['units'], np.int64),
+        'unit_cost': unit_cost,
+    }
+
+
+def _within_group_start(group, amounts):
+    """
+    running total of `amounts` that restarts at every change of `group` (arrays already sorted by group)
+    """
+    ends = np.cumsum(amounts)
+    starts = ends - amounts
+    first = np.r_[True, group[1:] != group[:-1]] if len(group) else np.zeros(0, dtype=bool)
+    group_offset = np.maximum.accumulate(np.where(first, starts, 0))
+    return starts - group_offset
+
+
+def suggest_transfers(positions, cover_days=14, budget=None, min_quantity=1):
+    """
+    pair surplus with shortfall per product.
+
+    A branch needs `max(min_level, velocity * cover_days)` units counting stock already on its
+    way; anything on the shelf above that (or above `max_level` where one is set) and not
+    already promised to another transfer can be given away. Branches with the highest
+    expected lost sales are served first, and when a `budget` (stock value at cost) is given
+    the lowest-priority moves are dropped until the plan fits.
+
+    Returns a dict of arrays: product, from_branch, to_branch, quantity, value.
+    """
+    quantity = positions['quantity']
+    velocity = positions['velocity']
+    target = np.maximum(positions['min_level'], np.ceil(velocity * cover_days)).astype(np.int64)
+
+    available = quantity + positions['in_transit'] + positions['on_order']
+    deficit = np.maximum(target - available, 0)
+    keep = np.where(positions['max_level'] > 0, np.maximum(positions['max_level'], target), target)
+    surplus = np.maximum(quantity - positions['reserved'] - keep, 0)
+    priority = (velocity + 0.01) * deficit / np.maximum(target, 1)
+
+    _, sku = np.unique(positions['product'], return_inverse=True)
+    n_sku = int(sku.max()) + 1 if len(sku) else 0
+
+    donors = np.flatnonzero(surplus > 0)
+    donors = donors[np.lexsort((-surplus[donors], sku[donors]))]
+    receivers = np.flatnonzero(deficit > 0)
+    receivers = receivers[np.lexsort((-priority[receivers], sku[receivers]))]
+
+    matched = np.minimum(
+        np.bincount(sku[donors], weights=surplus[donors], minlength=n_sku),
+        np.bincount(sku[receivers], weights=deficit[receivers], minlength=n_sku),
+    ).astype(np.int64)
+    base = np.cumsum(matched) - matched
+
+    def place(rows, amounts):
+        # lay each row's share out on one line where every product owns [base, base + matched)
+        start = _within_group_start(sku[rows], amounts)
+        cap = matched[sku[rows]]
+        return base[sku[rows]] + np.minimum(start + amounts, cap)
+
+    donor_end = place(donors, surplus[donors])
+    receiver_end = place(receivers, deficit[receivers])
+
+    points = np.unique(np.concatenate([[0], donor_end, receiver_end]))
+    seg_start, seg_end = points[:-1], points[1:]
+    donor_row = donors[np.searchsorted(donor_end, seg_start, side='right')] if len(seg_start) else donors[:0]
+    receiver_row = receivers[np.searchsorted(receiver_end, seg_start, side='right')] if len(seg_start) else receivers[:0]
+    moved = seg_end - seg_start
+
+    keep_seg = moved >= min_quantity
+    donor_row, receiver_row, moved = donor_row[keep_seg], receiver_row[keep_seg], moved[keep_seg]
+
+    order = np.argsort(-priority[receiver_row], kind='stable')
+    donor_row, receiver_row, moved = donor_row[order], receiver_row[order], moved[order]
+    unit_cost = positions['unit_cost'][donor_row]
+    value = moved * unit_cost
+
+    if budget is not None:
+        planned = moved
+        spent_before = np.cumsum(value) - value
+        affordable = np.where(
+            unit_cost > 0,
+            np.floor(np.maximum(budget - spent_before, 0) / np.where(unit_cost > 0, unit_cost, 1)),
+            planned,
+        ).astype(np.int64)
+        moved = np.minimum(planned, affordable)
+        # once a move has been cut short the budget is spent, so nothing after it goes
+        cut = np.flatnonzero(moved < planned)
+        if len(cut):
+            moved[cut[0] + 1:] = 0
+        fits = moved >= min_quantity
+        donor_row, receiver_row, moved = donor_row[fits], receiver_row[fits], moved[fits]
+        value = moved * positions['unit_cost'][donor_row]
+
+    return {
+        'product': positions['product'][donor_row],
+        'from_branch': positions['branch'][donor_row],
+        'to_branch': positions['branch'][receiver_row],
+        'quantity': moved,
+        'value': value,
+    }
+
+
+def create_draft_transfers(suggestions, tenant_id, reason='', batch_size=5000):
+    """
+    write the suggestions as pending StockTransfer documents, one per branch pair.
+    """
+    if not len(suggestions['quantity']):
+        return []
+    pair_keys = _keys(suggestions['from_branch'], suggestions['to_branch'])
+    pairs, pair_of_line = np.unique(pair_keys, return_inverse=True)
+
+    with transaction.atomic():
+        transfers = StockTransfer.objects.bulk_create(
+            [
+                StockTransfer(
+                    from_branch_id=int(key >> 32),
+                    to_branch_id=int(key & 0xFFFFFFFF),
+                    reason=reason,
+                    tenant_id=tenant_id,
+                )
+                for key in pairs.tolist()
+            ],
+            batch_size=batch_size,
+        )
+        transfer_ids = [transfer.pk for transfer in transfers]
+        StockTransferItem.objects.bulk_create(
+            (
+                StockTransferItem(transfer_id=transfer_ids[pair], product_id=product, quantity=quantity)
+                for pair, product, quantity in zip(
+                    pair_of_line.tolist(), suggestions['product'].tolist(), suggestions['quantity'].tolist()
+                )
+            ),
+            batch_size=batch_size,
+        )
+        count_open_transfers(transfers)
+    return transfers
+
+
+def rebalance_stock(tenant_id, cover_days=14, velocity_days=28, budget=None, min_quantity=1, dry_run=False):
+    """
+    run the whole nightly pass and return a short summary of what was suggested.
+    """
+    positions = load_positions(velocity_days=velocity_days)
+    suggestions = suggest_transfers(positions, cover_days=cover_days, budget=budget, min_quantity=min_quantity)
+    transfers = []
+    if not dry_run:
+        reason = f"Suggested by stock rebalancing on {timezone.localdate():%Y-%m-%d}."
+        transfers = create_draft_transfers(suggestions, tenant_id, reason=reason)
+    return {
+        'positions': len(positions['product']),
+        'lines': len(suggestions['quantity']),
+        'units': int(suggestions['quantity'].sum()),
+        'value': float(suggestions['value'].sum()),
+        'transfers': len(transfers),
+    }
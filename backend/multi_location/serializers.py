@@ -1,3 +1,5 @@
+from collections import Counter
+
 from rest_framework import serializers
 from .models import *
 
@@ -11,11 +13,96 @@ class BranchSerializer(serializers.ModelSerializer):
                   'county','phone_number','operating_hours','is_active','tenant']
         read_only_fields = ['tenant']
         
+class StockTransferItemSerializer(serializers.ModelSerializer):
+    product = serializers.IntegerField(source='product_id')
+
+    class Meta:
+        model = StockTransferItem
+        fields = ['id','product','quantity']
+        extra_kwargs = {"id": {"read_only": True}, "quantity": {"min_value": 1}}
+
+
 class StockTransferSerializer(serializers.ModelSerializer):
-    
+    items = StockTransferItemSerializer(many=True, required=False)
+    # single-line shorthand kept for clients that post one product at a time
+    product = serializers.IntegerField(write_only=True, required=False)
+    quantity = serializers.IntegerField(write_only=True, required=False, min_value=1)
+
     class Meta:
         model = StockTransfer
-        fields = ['id','from_branch','to_branch','product','quantity','reason',
-                  'status','requested_at','approved_at','rejected_at','tenant']
+        fields = ['id','from_branch','to_branch','product','quantity','items','reason',
+                  'status','requested_at','approved_at','rejected_at',
+                  'dispatched_at','received_at','tenant']
         read_only_fields = ['tenant','reason',
-                  'status','requested_at','approved_at','rejected_at',]
\ No newline at end of file
+                  'status','requested_at','approved_at','rejected_at',
+                  'dispatched_at','received_at']
+
+    def validate(self, attrs):
+        from_branch = attrs.get('from_branch', getattr(self.instance, 'from_branch', None))
+        to_branch = attrs.get('to_branch', getattr(self.instance, 'to_branch', None))
+        if from_branch is not None and from_branch == to_branch:
+            raise serializers.ValidationError("A stock transfer needs two different branches.")
+
+        product = attrs.pop('product', None)
+        quantity = attrs.pop('quantity', None)
+        if 'items' not in attrs and product is not None:
+            attrs['items'] = [{'product_id': product, 'quantity': quantity or 1}]
+        if 'items' not in attrs:
+            if self.instance is None:
+                raise serializers.ValidationError({'items': "A stock transfer needs at least one line."})
+            return attrs
+
+        items = attrs['items']
+        if not items:
+            raise serializers.ValidationError({'items': "A stock transfer needs at least one line."})
+        product_ids = [item['product_id'] for item in items]
+        duplicates = sorted(pk for pk, lines in Counter(product_ids).items() if lines > 1)
+        if duplicates:
+            raise serializers.ValidationError({'items': f"Products {duplicates} appear on more than one line."})
+        unknown = sorted(set(product_ids) - set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True)))
+        if unknown:
+            raise serializers.ValidationError({'items': f"Products {unknown} do not exist."})
+        return attrs
+
+    def create(self, validated_data):
+        items_data = validated_data.pop('items')
+        stock_transfer = StockTransfer.objects.create(**validated_data)
+        StockTransferItem.objects.bulk_create(
+            [StockTransferItem(transfer=stock_transfer, **item) for item in items_data]
+        )
+        count_open_transfers([stock_transfer])
+        return stock_transfer
+
+    def update(self, instance, validated_data):
+        items_data = validated_data.pop('items', None)
+        previous = StockTransfer(from_branch_id=instance.from_branch_id, to_branch_id=instance.to_branch_id,
+                                 tenant_id=instance.tenant_id)
+        instance = super().update(instance, validated_data)
+        if (previous.from_branch_id, previous.to_branch_id) != (instance.from_branch_id, instance.to_branch_id):
+            count_open_transfers([previous], sign=-1)
+            count_open_transfers([instance])
+        if items_data is not None:
+            instance.items.all().delete()
+            StockTransferItem.objects.bulk_create(
+                [StockTransferItem(transfer=instance, **item) for item in items_data]
+            )
+        return instance
+
+
+class BranchStockSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = BranchStock
+        fields = ['id','branch','product','quantity','in_transit','min_level','max_level','tenant']
+        read_only_fields = ['branch','product','quantity','in_transit','tenant']
+
+
+class StockTransferBatchApproveSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    date = serializers.DateField(required=False)
+    dispatch = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if not attrs.get('ids') and not attrs.get('date'):
+            raise serializers.ValidationError("Provide either the transfer ids or a requested date.")
+        return attrs
\ No newline at end of file
@@ -1,3 +1,92 @@
-from django.test import TestCase
+from collections import defaultdict
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase
+
+from .rebalancing import suggest_transfers
+
+
+def positions(*rows, **columns):
+    """
+    stock positions from (branch, product, quantity, min_level) rows with no sales, nothing
+    in transit or promised, no max level and a unit cost of 10; `columns` overrides any array
+    """
+    branch, product, quantity, min_level = (np.array(column, dtype=np.int64) for column in zip(*rows))
+    zeros = np.zeros(len(rows), dtype=np.int64)
+    data = {
+        'branch': branch, 'product': product, 'quantity': quantity, 'min_level': min_level,
+        'in_transit': zeros, 'max_level': zeros, 'reserved': zeros, 'on_order': zeros,
+        'velocity': np.zeros(len(rows)), 'unit_cost': np.full(len(rows), 10.0),
+    }
+    data.update({name: np.asarray(values) for name, values in columns.items()})
+    return data
+
+
+def moves(suggestions):
+    return sorted(zip(*(suggestions[name].tolist() for name in ('product', 'from_branch', 'to_branch', 'quantity'))))
+
+
+class SuggestTransfersTests(SimpleTestCase):
+
+    def test_surplus_goes_to_the_branch_short_of_the_same_product(self):
+        plan = suggest_transfers(positions((1, 7, 30, 10), (2, 7, 2, 10)))
+        self.assertEqual(moves(plan), [(7, 1, 2, 8)])
+        self.assertEqual(plan['value'].tolist(), [80.0])
+
+    def test_a_move_is_capped_by_the_surplus(self):
+        # branch 1 can spare 3, branch 2 is 10 short
+        plan = suggest_transfers(positions((1, 7, 13, 10), (2, 7, 0, 10)))
+        self.assertEqual(moves(plan), [(7, 1, 2, 3)])
+
+    def test_a_move_is_capped_by_the_deficit(self):
+        # branch 1 can spare 40, branch 2 is 4 short
+        plan = suggest_transfers(positions((1, 7, 50, 10), (2, 7, 6, 10)))
+        self.assertEqual(moves(plan), [(7, 1, 2, 4)])
+
+    def test_products_are_never_mixed(self):
+        # product 7 has a surplus only, product 8 a shortfall only
+        plan = suggest_transfers(positions((1, 7, 50, 10), (2, 8, 0, 10), (3, 8, 10, 10)))
+        self.assertEqual(moves(plan), [])
+
+    def test_nothing_is_moved_without_a_shortfall(self):
+        plan = suggest_transfers(positions((1, 7, 50, 10), (2, 7, 10, 10)))
+        self.assertEqual(len(plan['quantity']), 0)
+
+    def test_many_branches_stay_within_every_surplus_and_deficit(self):
+        rows = [
+            (1, 7, 25, 10), (2, 7, 18, 10), (3, 7, 4, 10), (4, 7, 0, 10), (5, 7, 9, 10),
+            (1, 8, 0, 5), (2, 8, 20, 5), (3, 8, 1, 5), (4, 8, 12, 5),
+        ]
+        data = positions(*rows)
+        plan = suggest_transfers(data)
+        surplus = {(b, p): max(q - m, 0) for b, p, q, m in rows}
+        deficit = {(b, p): max(m - q, 0) for b, p, q, m in rows}
+
+        given, received = defaultdict(int), defaultdict(int)
+        for product, source, target, quantity in moves(plan):
+            self.assertNotEqual(source, target)
+            self.assertGreater(quantity, 0)
+            given[source, product] += quantity
+            received[target, product] += quantity
+        for key, quantity in given.items():
+            self.assertLessEqual(quantity, surplus[key])
+        for key, quantity in received.items():
+            self.assertLessEqual(quantity, deficit[key])
+        # everything that can be matched is matched, product by product
+        for product in (7, 8):
+            spare = sum(value for (_, p), value in surplus.items() if p == product)
+            short = sum(value for (_, p), value in deficit.items() if p == product)
+            moved = sum(quantity for (_, p), quantity in received.items() if p == product)
+            self.assertEqual(moved, min(spare, short))
+
+    def test_the_branch_losing_most_sales_is_served_first(self):
+        data = positions((1, 7, 15, 10), (2, 7, 0, 10), (3, 7, 0, 10), velocity=[0.0, 0.1, 2.0])
+        # the fast seller at branch 3 needs 28 units for 14 days of cover; only 5 are spare
+        plan = suggest_transfers(data)
+        self.assertEqual(moves(plan), [(7, 1, 3, 5)])
+
+    def test_a_budget_drops_the_lowest_priority_moves(self):
+        data = positions((1, 7, 30, 10), (2, 7, 5, 10), (3, 7, 0, 10), velocity=[0.0, 0.0, 1.0])
+        plan = suggest_transfers(data, budget=100)
+        self.assertEqual(moves(plan), [(7, 1, 3, 10)])
+        self.assertLessEqual(plan['value'].sum(), 100)
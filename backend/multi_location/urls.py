@@ -4,6 +4,12 @@ from .views import *
 urlpatterns = [
     path('branches/',BranchListCreateAPIView.as_view(), name='all branches'),
     path('branches/<int:pk>/', BranchRetrieveUpdateDestroyAPIView.as_view()),
+    path('branches/<int:pk>/dashboard/', BranchDashboardAPIView.as_view()),
     path('stock_transfers/', StockTransferListCreateAPIView.as_view()),
-    path('stock_transfers/<int:pk>/', StockTransferRetrieveUpdateDestroyAPIView.as_view())
+    path('stock_transfers/<int:pk>/', StockTransferRetrieveUpdateDestroyAPIView.as_view()),
+    path('stock_transfers/<int:pk>/dispatch/', StockTransferDispatchAPIView.as_view()),
+    path('stock_transfers/<int:pk>/receive/', StockTransferReceiveAPIView.as_view()),
+    path('stock_transfers/approve/', StockTransferBatchApproveAPIView.as_view()),
+    path('branch_stock/', BranchStockListAPIView.as_view()),
+    path('branch_stock/<int:pk>/', BranchStockRetrieveUpdateAPIView.as_view()),
 ]
\ No newline at end of file
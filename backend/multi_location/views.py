@@ -88,7 +88,7 @@ class StockTransferListCreateAPIView(APIView):
     GET METHOD:To fetch all instances of stock transfers
     """  
     def get(self, request):
-        stock_transfers = StockTransfer.objects.all()
+        stock_transfers = StockTransfer.objects.prefetch_related('items')
         serializer = StockTransferSerializer(stock_transfers, many= True)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
@@ -96,18 +96,14 @@ class StockTransferListCreateAPIView(APIView):
     POST METHOD:To create a new stock transfer
     """
     def post(self,request):
-        data = request.data
-        print('DTATA...', data)
-        product = data.get('product')
-        branch_destination = data.get('to_branch')
         serializer = self.serializer_class(data = request.data)
         with transaction.atomic():
             if serializer.is_valid():
-                serializer.save(tenant = request.user.tenant)
+                stock_transfer = serializer.save(tenant = request.user.tenant)
                 ActivityLogs.objects.create(
                                 tenant=request.user.tenant,
                                 action_type='stock_transfer_initiated',
-                                message=f'A stock transfer of  {product} to {branch_destination} has been initiated.'
+                                message=f'A stock transfer of {len(serializer.validated_data["items"])} products to {stock_transfer.to_branch} has been initiated.'
                         )
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status= status.HTTP_400_BAD_REQUEST)
@@ -135,18 +131,169 @@ class StockTransferRetrieveUpdateDestroyAPIView(APIView):
     
     def put(self, request, pk):
         stock_transfer = self.get_object(pk)
+        if stock_transfer.status != 'pending':
+            return Response({'error': 'Only pending stock transfers can be edited.'}, status=status.HTTP_400_BAD_REQUEST)
         serializer = self.serializer_class(stock_transfer, data = request.data, partial = True)
         if serializer.is_valid():
+            serializer.save()
             return Response(serializer.data, status = status.HTTP_200_OK)
-        return Response(serializer.errors)
+        return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
     
     """
     DELETE METHOD: To delete a single instance of a stock transfer
     """
     def delete(self, request,pk):
         stock_transfer = self.get_object(pk)
-        if stock_transfer:
+        if stock_transfer.status == 'in_transit':
+            return Response({'error': 'A stock transfer in transit cannot be deleted.'}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            if stock_transfer.status in PENDING_TRANSFER_STATUSES:
+                count_open_transfers([stock_transfer], sign=-1)
             stock_transfer.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response("Stock Transfer does not exist", status=status.HTTP_404_NOT_FOUND)
-        
\ No newline at end of file
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class StockTransferDispatchAPIView(APIView):
+    serializer_class = StockTransferSerializer
+    """
+    POST METHOD: To dispatch an approved stock transfer, debiting the sending branch
+    and crediting the receiving branch's in-transit stock
+    """
+    def post(self, request, pk):
+        stock_transfer = get_object_or_404(StockTransfer, pk=pk)
+        try:
+            with transaction.atomic():
+                stock_transfer.dispatch()
+                ActivityLogs.objects.create(
+                                tenant=request.user.tenant,
+                                action_type='stock_transfer_dispatched',
+                                message=f'Stock transfer #{stock_transfer.pk} has been dispatched to {stock_transfer.to_branch}.'
+                        )
+        except StockTransferError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        stock_transfer.refresh_from_db()
+        serializer = self.serializer_class(stock_transfer)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class StockTransferReceiveAPIView(APIView):
+    serializer_class = StockTransferSerializer
+    """
+    POST METHOD: To receive an in-transit stock transfer onto the receiving branch's shelf
+    """
+    def post(self, request, pk):
+        stock_transfer = get_object_or_404(StockTransfer, pk=pk)
+        try:
+            with transaction.atomic():
+                stock_transfer.receive()
+                ActivityLogs.objects.create(
+                                tenant=request.user.tenant,
+                                action_type='stock_transfer_received',
+                                message=f'Stock transfer #{stock_transfer.pk} has been received at {stock_transfer.to_branch}.'
+                        )
+        except StockTransferError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        stock_transfer.refresh_from_db()
+        serializer = self.serializer_class(stock_transfer)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class StockTransferBatchApproveAPIView(APIView):
+    serializer_class = StockTransferBatchApproveSerializer
+    """
+    POST METHOD: To approve pending stock transfers in bulk, either by ID or by the day they
+    were requested, and optionally dispatch them in the same transaction
+    """
+    def post(self, request):
+        serializer = self.serializer_class(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        stock_transfers = StockTransfer.objects.all()
+        if data.get('ids'):
+            stock_transfers = stock_transfers.filter(pk__in=data['ids'])
+        if data.get('date'):
+            stock_transfers = stock_transfers.filter(requested_at__date=data['date'])
+        try:
+            with transaction.atomic():
+                approved_ids = list(stock_transfers.filter(status='pending').values_list('pk', flat=True))
+                approved = approve_transfers(StockTransfer.objects.filter(pk__in=approved_ids))
+                dispatched = dispatch_transfers(approved_ids) if data['dispatch'] else []
+                if approved:
+                    ActivityLogs.objects.create(
+                                    tenant=request.user.tenant,
+                                    action_type='stock_transfer_approved',
+                                    message=f'{approved} stock transfers have been approved'
+                                            f'{" and dispatched" if dispatched else ""}.'
+                            )
+        except StockTransferError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'approved': approved, 'dispatched': len(dispatched)}, status=status.HTTP_200_OK)
+
+
+class BranchStockListAPIView(APIView):
+    serializer_class = BranchStockSerializer
+    """
+    GET METHOD: To list stock positions, optionally for a single branch (?branch=<id>)
+    """
+    def get(self, request):
+        stock_levels = BranchStock.objects.all().order_by('branch_id', 'product_id')
+        branch = request.query_params.get('branch')
+        if branch:
+            stock_levels = stock_levels.filter(branch_id=branch)
+        serializer = self.serializer_class(stock_levels, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class BranchStockRetrieveUpdateAPIView(APIView):
+    serializer_class = BranchStockSerializer
+    """
+    GET METHOD: To retrieve a stock position
+    """
+    def get(self, request, pk):
+        stock_level = get_object_or_404(BranchStock, pk=pk)
+        serializer = self.serializer_class(stock_level)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    """
+    PUT METHOD: To set the min/max levels the rebalancing run works towards
+    """
+    def put(self, request, pk):
+        stock_level = get_object_or_404(BranchStock, pk=pk)
+        serializer = self.serializer_class(stock_level, data=request.data, partial=True)
+        if serializer.is_valid():
+            with transaction.atomic():
+                # go through the stock lock so the low-stock counter follows min_level changes
+                pair = (stock_level.branch_id, stock_level.product_id)
+                stock_level = lock_branch_stock([pair])[pair]
+                for attr, value in serializer.validated_data.items():
+                    setattr(stock_level, attr, value)
+                save_branch_stock([stock_level])
+            return Response(self.serializer_class(stock_level).data, status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class BranchDashboardAPIView(APIView):
+    """
+    GET METHOD: To read a branch's dashboard from its precomputed counters
+    """
+    def get(self, request, pk):
+        branch = get_object_or_404(Branch, pk=pk)
+        today = timezone.localdate()
+        metrics = BranchMetrics.objects.filter(branch=branch).first() or BranchMetrics(branch=branch)
+        daily = BranchDailyMetrics.objects.filter(branch=branch, date=today).first() or BranchDailyMetrics(branch=branch, date=today)
+        return Response({
+            'branch': branch.pk,
+            'branch_name': branch.branch_name,
+            'date': today,
+            'sales_today': daily.sales_total,
+            'orders_today': daily.orders_count,
+            'expenses_today': daily.expense_total,
+            'expense_count_today': daily.expense_count,
+            'open_drawers': metrics.open_drawers,
+            'open_drawer_balance': metrics.open_drawer_balance,
+            'pending_transfers_in': metrics.pending_transfers_in,
+            'pending_transfers_out': metrics.pending_transfers_out,
+            'low_stock_count': metrics.low_stock_count,
+            'updated_at': metrics.updated_at,
+        }, status=status.HTTP_200_OK)
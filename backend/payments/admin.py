@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import *
 
 # Register your models here.
+admin.site.register(Payments)
+admin.site.register(PaymentDailyRollup)
+admin.site.register(PaymentIntent)
+admin.site.register(MpesaCallback)
+admin.site.register(StatementReconciliation)
@@ -0,0 +1,52 @@
+"""
+Payment takings summaries.
+
+Totals are read from PaymentDailyRollup, which holds one row per day, payment type, branch
+and cashier, so month-to-date takings cost a handful of rows whatever the number of
+payments. Drill-down into the payments themselves goes through the (tenant, timestamp)
+index on Payments.
+"""
+from django.db.models import Sum
+
+from multi_location.models import Branch
+from authentication.models import User
+from .models import PaymentDailyRollup
+
+GROUPS = {
+    'payment_type': 'payment_type',
+    'day': 'date',
+    'branch': 'branch_key',
+    'cashier': 'cashier_key',
+}
+
+
+def payment_summary(start, end, group_by=('payment_type',)):
+    """
+    takings between `start` and `end` (inclusive) grouped by any of payment_type, day,
+    branch and cashier; branches and cashiers come back with their names
+    """
+    columns = [GROUPS[group] for group in GROUPS if group in group_by]
+    rows = list(
+        PaymentDailyRollup.objects.filter(date__gte=start, date__lte=end)
+        .values(*columns)
+        .annotate(total_amount=Sum('total_amount'), amount_paid=Sum('amount_paid'), payments=Sum('payments_count'))
+        .order_by(*columns)
+    )
+
+    branches = cashiers = {}
+    if 'branch' in group_by:
+        branches = dict(Branch.objects.filter(pk__in={row['branch_key'] for row in rows})
+                        .values_list('pk', 'branch_name'))
+    if 'cashier' in group_by:
+        cashiers = dict(User.objects.filter(pk__in={row['cashier_key'] for row in rows})
+                        .values_list('pk', 'username'))
+    for row in rows:
+        if 'date' in row:
+            row['day'] = row.pop('date')
+        if 'branch_key' in row:
+            key = row.pop('branch_key')
+            row['branch'] = {'id': key, 'name': branches.get(key)} if key else None
+        if 'cashier_key' in row:
+            key = row.pop('cashier_key')
+            row['cashier'] = {'id': key, 'username': cashiers.get(key)} if key else None
+    return rows
@@ -0,0 +1,168 @@
+"""
+Applying M-Pesa callbacks.
+
+The callback endpoint only stores what Safaricom posts. apply_callbacks() later takes a
+batch of stored callbacks, settles their payment intents, records a Payments row for
+every successful push made against an order and completes the orders that are now paid
+in full, all in one transaction per batch. A callback is marked applied only once its
+result has been used: one that matches no intent yet stays unapplied and is tried again
+later with a growing delay, and a successful result for an intent that had already failed
+(e.g. one given up on while its outcome was unknown) still completes it and records the
+payment.
+
+An intent left 'unknown' because Daraja's answer to its push was lost has no
+CheckoutRequestID to match on; a successful callback for the same phone and amount
+settles it instead. Intents the dispatcher settled through an STK status query are
+already completed when their callback comes in; the callback then only adds the receipt.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from products.models import Order
+from .models import MpesaCallback, PaymentIntent, Payments, rollup_payments
+
+# seconds before an unmatched callback is tried again, doubling up to a day
+CALLBACK_RETRY = 30
+CALLBACK_RETRY_MAX = 86400
+SETTLED_FIELDS = ['status', 'checkout_request_id', 'result_code', 'response_description', 'mpesa_receipt_number',
+                  'error', 'updated_at']
+
+
+def _settle(intent, result_code, result_desc, now, amount=None, phone_number='', receipt=''):
+    """
+    apply one push result to `intent` (not saved); returns the payment to record for it, if any
+    """
+    intent.result_code = result_code
+    intent.updated_at = now
+    intent.response_description = result_desc
+    if result_code != 0:
+        intent.status = 'failed'
+        intent.error = result_desc
+        return None
+    intent.status = 'completed'
+    intent.error = ''
+    intent.mpesa_receipt_number = receipt or ''
+    if not intent.order_id:
+        return None
+    return Payments(
+        customer_phone=phone_number or intent.phone_number,
+        payment_type='mpesa',
+        total_amount=intent.order.total_amount,
+        amount_paid=amount if amount is not None else intent.amount,
+        transaction_id=intent.checkout_request_id,
+        mpesa_reference=intent.mpesa_receipt_number,
+        order_id=intent.order_id,
+        tenant_id=intent.tenant_id,
+    )
+
+
+def _record_payments(payments):
+    Payments.objects.bulk_create(payments, batch_size=500)
+    rollup_payments(payments)
+    # orders are completed one by one: completion moves stock and dashboard counters
+    paid_orders = (
+        Order.objects.filter(pk__in={payment.order_id for payment in payments}, status='pending')
+        .annotate(paid=Sum('payments__amount_paid'))
+    )
+    for order in paid_orders:
+        if order.paid >= order.total_amount:
+            order.complete_order()
+
+
+def _unknown_intents(callbacks):
+    """
+    'unknown' intents without a CheckoutRequestID, oldest first per (phone, amount), that
+    the successful callbacks among `callbacks` could belong to
+    """
+    phones = {callback.phone_number for callback in callbacks if callback.result_code == 0 and callback.phone_number}
+    waiting = defaultdict(list)
+    if phones:
+        for intent in (
+            PaymentIntent.objects.select_for_update(of=('self',)).select_related('order')
+            .filter(status='unknown', checkout_request_id__isnull=True, phone_number__in=phones)
+            .order_by('created_at', 'id')
+        ):
+            waiting[intent.phone_number, intent.amount].append(intent)
+    return waiting
+
+
+def apply_callbacks(limit=500):
+    """
+    apply up to `limit` due stored callbacks of the current schema; returns how many were
+    applied
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        callbacks = list(
+            MpesaCallback.objects.select_for_update(skip_locked=True)
+            .filter(applied_at__isnull=True, next_attempt_at__lte=now).order_by('next_attempt_at', 'id')[:limit]
+        )
+        if not callbacks:
+            return 0
+        intents = (
+            PaymentIntent.objects.select_for_update(of=('self',)).select_related('order')
+            .in_bulk([callback.checkout_request_id for callback in callbacks], field_name='checkout_request_id')
+        )
+        unknown = _unknown_intents([callback for callback in callbacks if callback.checkout_request_id not in intents])
+
+        settled, payments, receipts, applied, deferred = [], [], [], [], []
+        for callback in callbacks:
+            intent = intents.get(callback.checkout_request_id)
+            if intent is None and unknown[callback.phone_number, callback.amount]:
+                intent = unknown[callback.phone_number, callback.amount].pop(0)
+                intent.checkout_request_id = callback.checkout_request_id
+            if intent is not None and intent.status == 'completed':
+                # completed from a status query, which carries no receipt number
+                if callback.result_code == 0 and not intent.mpesa_receipt_number and callback.mpesa_receipt_number:
+                    intent.mpesa_receipt_number = callback.mpesa_receipt_number
+                    receipts.append(intent)
+                applied.append(callback.pk)
+                continue
+            if intent is None:
+                # the push may not be saved yet; otherwise the money needs matching by hand
+                callback.next_attempt_at = now + timedelta(seconds=min(CALLBACK_RETRY * 2 ** callback.attempts,
+                                                                       CALLBACK_RETRY_MAX))
+                callback.attempts += 1
+                deferred.append(callback)
+                continue
+            applied.append(callback.pk)
+            if intent.status == 'failed' and callback.result_code != 0:
+                continue
+            payment = _settle(intent, callback.result_code, callback.result_desc, now, amount=callback.amount,
+                              phone_number=callback.phone_number, receipt=callback.mpesa_receipt_number)
+            if payment is not None:
+                payments.append(payment)
+            settled.append(intent)
+
+        PaymentIntent.objects.bulk_update(settled, SETTLED_FIELDS, batch_size=500)
+        PaymentIntent.objects.bulk_update(receipts, ['mpesa_receipt_number'], batch_size=500)
+        for intent in receipts:
+            Payments.objects.filter(transaction_id=intent.checkout_request_id, mpesa_reference='').update(
+                mpesa_reference=intent.mpesa_receipt_number,
+            )
+        MpesaCallback.objects.filter(pk__in=applied).update(applied_at=now)
+        MpesaCallback.objects.bulk_update(deferred, ['attempts', 'next_attempt_at'], batch_size=500)
+        _record_payments(payments)
+    return len(applied)
+
+
+def apply_query_result(intent_id, result_code, result_desc):
+    """
+    settle an 'unknown' intent with the result an STK status query returned; returns 1 if
+    it was settled, 0 if a callback settled it first
+    """
+    with transaction.atomic():
+        intent = (
+            PaymentIntent.objects.select_for_update(of=('self',)).select_related('order')
+            .filter(pk=intent_id, status='unknown').first()
+        )
+        if intent is None:
+            return 0
+        payment = _settle(intent, result_code, result_desc, timezone.now())
+        intent.save(update_fields=SETTLED_FIELDS)
+        _record_payments([payment] if payment is not None else [])
+    return 1
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+# backends that keep their entries inside one process
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+MESSAGE = (
+    "The default cache ({backend}) is not shared between processes, so every worker fetches its "
+    "own M-Pesa token and cached lookups are not invalidated across workers."
+)
+HINT = "Set REDIS_URL so the default cache is Redis."
+
+
+def _local_backend():
+    backend = settings.CACHES.get('default', {}).get('BACKEND', PROCESS_LOCAL_CACHES[0])
+    return backend.rsplit('.', 1)[-1] if backend in PROCESS_LOCAL_CACHES else None
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    the M-Pesa token is refreshed single-flight and shared through the default cache, which
+    only works across worker processes when that cache is shared too
+    """
+    backend = _local_backend()
+    return [Warning(MESSAGE.format(backend=backend), hint=HINT, id='payments.W001')] if backend else []
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache_deploy(app_configs, **kwargs):
+    backend = _local_backend()
+    return [Error(MESSAGE.format(backend=backend), hint=HINT, id='payments.E001')] if backend else []
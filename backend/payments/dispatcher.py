@@ -0,0 +1,302 @@
+"""
+Background dispatch of STK pushes.
+
+Web requests only queue a PaymentIntent. The dispatcher runs in its own asyncio loop (the
+`dispatch_payments` command, or inside the ASGI server when PAYMENTS_DISPATCH_IN_ASGI is
+on), claims queued intents tenant by tenant with SELECT ... FOR UPDATE SKIP LOCKED so
+several dispatchers never send the same push, and sends up to `concurrency` pushes at
+a time. Each push runs in a worker thread on the pooled gateway client, so a slow
+gateway only delays the dispatcher and never a web worker. Every round also applies the
+M-Pesa callbacks that arrived since the last one.
+
+A push is only sent again when it certainly never reached Daraja (the connection was
+refused, the circuit is open, the token request failed, or Daraja answered 401/429).
+When it may have got there (a read timeout, a 5xx or unreadable answer, a send that raised
+unexpectedly, or a claim left dispatching for longer than PAYMENTS_DISPATCH_LEASE seconds
+because its dispatcher died) the intent becomes 'unknown' instead, and is settled by an
+STK status query or its callback; a second push could prompt and charge the customer
+twice.
+"""
+import asyncio
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django_tenants.utils import get_public_schema_name, get_tenant_domain_model, get_tenant_model, schema_context
+
+from .gateway import GatewayUnavailable, GatewayUnreached, MpesaError, get_gateway
+from .callbacks import apply_callbacks, apply_query_result
+from .models import PaymentIntent
+from .mpesa import get_token_manager, stk_push_payload, stk_query_payload
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 15
+# seconds between status queries of an 'unknown' intent Daraja accepted
+QUERY_INTERVAL = 60
+# seconds an 'unknown' intent without a CheckoutRequestID waits for its callback
+UNKNOWN_TIMEOUT = 900
+
+
+def claim_intents(limit):
+    """
+    mark up to `limit` due intents of the current schema as dispatching and return them.
+    Intents whose lease ran out may have reached Daraja before their dispatcher died, so
+    they become 'unknown' rather than due again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        PaymentIntent.objects.filter(
+            status='dispatching', updated_at__lt=now - timedelta(seconds=settings.PAYMENTS_DISPATCH_LEASE),
+        ).update(status='unknown', error="The dispatcher stopped while sending this push.",
+                 next_attempt_at=now + timedelta(seconds=UNKNOWN_TIMEOUT), updated_at=now)
+        ids = list(
+            PaymentIntent.objects.select_for_update(skip_locked=True)
+            .filter(status='queued', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        # updated_at starts the lease; update() does not touch auto_now fields by itself
+        PaymentIntent.objects.filter(pk__in=ids).update(status='dispatching', attempts=F('attempts') + 1, updated_at=now)
+    return list(PaymentIntent.objects.filter(pk__in=ids))
+
+
+def send_intent(schema_name, callback_url, intent):
+    """
+    push one claimed intent to the gateway and record the outcome
+    """
+    close_old_connections()
+    try:
+        with schema_context(schema_name):
+            _send(intent, callback_url)
+    finally:
+        close_old_connections()
+
+
+def _send(intent, callback_url):
+    now = timezone.now()
+    try:
+        payload = stk_push_payload(intent.phone_number, intent.amount, intent.account_reference,
+                                   intent.description, callback_url)
+        manager = get_token_manager()
+        token = manager.get_token()
+    except GatewayUnavailable as e:
+        return _retry_or_fail(intent, str(e))
+    except MpesaError as e:
+        return _fail(intent, str(e))
+
+    try:
+        response = get_gateway().stk_push(token, payload)
+    except GatewayUnreached as e:
+        return _retry_or_fail(intent, str(e))
+    except GatewayUnavailable as e:
+        # the push may have reached Daraja before the answer was lost
+        return _mark_unknown(intent, str(e))
+    if response.status_code == 401:
+        manager.invalidate()
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+
+    if response.status_code == 200 and body.get('ResponseCode') == '0':
+        intent.status = 'pending'
+        intent.checkout_request_id = body.get('CheckoutRequestID')
+        intent.merchant_request_id = body.get('MerchantRequestID', '')
+        intent.response_description = body.get('ResponseDescription', '')[:255]
+        intent.dispatched_at = now
+        intent.save(update_fields=['status', 'checkout_request_id', 'merchant_request_id',
+                                   'response_description', 'dispatched_at', 'updated_at'])
+    elif response.status_code in (401, 429):
+        # refused before the push was processed
+        _retry_or_fail(intent, body.get('errorMessage') or f"HTTP {response.status_code}")
+    elif response.status_code >= 500 or not body:
+        _mark_unknown(intent, body.get('errorMessage') or f"HTTP {response.status_code}")
+    else:
+        _fail(intent, body.get('errorMessage') or body.get('ResponseDescription') or f"HTTP {response.status_code}")
+
+
+def _retry_or_fail(intent, error):
+    """
+    queue an intent whose push certainly never reached Daraja for another attempt
+    """
+    if intent.attempts >= MAX_ATTEMPTS:
+        return _fail(intent, error)
+    intent.status = 'queued'
+    intent.error = error
+    intent.next_attempt_at = timezone.now() + timedelta(seconds=RETRY_BACKOFF * 2 ** (intent.attempts - 1))
+    intent.save(update_fields=['status', 'error', 'next_attempt_at', 'updated_at'])
+
+
+def _fail(intent, error):
+    intent.status = 'failed'
+    intent.error = error
+    intent.save(update_fields=['status', 'error', 'updated_at'])
+
+
+def _mark_unknown(intent, error):
+    """
+    leave a dispatching intent whose push may have reached Daraja to `settle_unknown_intents`;
+    it is never sent again
+    """
+    now = timezone.now()
+    wait = QUERY_INTERVAL if intent.checkout_request_id else UNKNOWN_TIMEOUT
+    return PaymentIntent.objects.filter(pk=intent.pk, status='dispatching').update(
+        status='unknown', error=error, next_attempt_at=now + timedelta(seconds=wait), updated_at=now,
+        checkout_request_id=intent.checkout_request_id, merchant_request_id=intent.merchant_request_id,
+        dispatched_at=intent.dispatched_at,
+    )
+
+
+def release_intent(schema_name, intent, error):
+    """
+    settle an intent whose send raised unexpectedly as 'unknown' instead of leaving it
+    dispatching: the push may have gone out before the error
+    """
+    close_old_connections()
+    try:
+        with schema_context(schema_name):
+            _mark_unknown(intent, error)
+    finally:
+        close_old_connections()
+
+
+def query_intent(intent):
+    """
+    (result code, description) of an accepted push from an STK status query, or None while
+    Daraja cannot say yet
+    """
+    try:
+        manager = get_token_manager()
+        response = get_gateway().stk_query(manager.get_token(), stk_query_payload(intent.checkout_request_id))
+        if response.status_code == 401:
+            manager.invalidate()
+        body = response.json()
+    except (MpesaError, ValueError) as e:
+        logger.warning("Querying payment intent %s failed: %s", intent.handle, e)
+        return None
+    # 'The transaction is being processed' comes back as an error without a ResultCode
+    if response.status_code != 200 or body.get('ResultCode') in (None, ''):
+        return None
+    return int(body['ResultCode']), str(body.get('ResultDesc', ''))[:255]
+
+
+def settle_unknown_intents(limit=100):
+    """
+    settle the 'unknown' intents of the current schema that are due, without sending them
+    again: those with a CheckoutRequestID by a status query, the others (Daraja's answer,
+    and so the ID to query, was lost) fail once UNKNOWN_TIMEOUT passes without a callback
+    for their phone and amount. Returns how many were settled.
+    """
+    now = timezone.now()
+    settled = 0
+    intents = PaymentIntent.objects.filter(status='unknown', next_attempt_at__lte=now).order_by('next_attempt_at', 'id')
+    for intent in list(intents[:limit]):
+        if not intent.checkout_request_id:
+            settled += PaymentIntent.objects.filter(pk=intent.pk, status='unknown').update(
+                status='failed', updated_at=now,
+                error=f"{intent.error} M-Pesa sent no result, and the push was not sent again.".strip(),
+            )
+            continue
+        result = query_intent(intent)
+        if result is None:
+            PaymentIntent.objects.filter(pk=intent.pk, status='unknown').update(
+                next_attempt_at=timezone.now() + timedelta(seconds=QUERY_INTERVAL),
+            )
+        else:
+            settled += apply_query_result(intent.pk, *result)
+    return settled
+
+
+def _tenant_callback_urls():
+    """
+    (schema name, callback URL) for every tenant, the URL pointing at its primary domain
+    """
+    domains = dict(
+        get_tenant_domain_model().objects.filter(is_primary=True)
+        .values_list('tenant__schema_name', 'domain')
+    )
+    schemas = get_tenant_model().objects.exclude(schema_name=get_public_schema_name()).values_list('schema_name', flat=True)
+    return [
+        (schema_name, settings.MPESA_CALLBACK_URL.format(domain=domains[schema_name]))
+        for schema_name in schemas if schema_name in domains
+    ]
+
+
+def _claim(schema_name, limit):
+    close_old_connections()
+    with schema_context(schema_name):
+        return claim_intents(limit)
+
+
+def _apply(schema_name):
+    close_old_connections()
+    with schema_context(schema_name):
+        return apply_callbacks()
+
+
+def _settle_unknown(schema_name):
+    close_old_connections()
+    with schema_context(schema_name):
+        return settle_unknown_intents()
+
+
+async def dispatch_once(concurrency=None):
+    """
+    send every intent that is due now and apply waiting callbacks across all tenants;
+    returns how many intents and callbacks were handled
+    """
+    concurrency = concurrency or settings.PAYMENTS_DISPATCH_CONCURRENCY
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(schema_name, callback_url, intent):
+        async with semaphore:
+            try:
+                await asyncio.to_thread(send_intent, schema_name, callback_url, intent)
+            except Exception as e:
+                logger.exception("Dispatching payment intent %s failed", intent.handle)
+                try:
+                    await asyncio.to_thread(release_intent, schema_name, intent, f"Dispatch error: {e}")
+                except Exception:
+                    # the lease turns it 'unknown' once PAYMENTS_DISPATCH_LEASE has passed
+                    logger.exception("Releasing payment intent %s failed", intent.handle)
+
+    sent = 0
+    for schema_name, callback_url in await sync_to_async(_tenant_callback_urls)():
+        while True:
+            intents = await sync_to_async(_claim)(schema_name, concurrency * 4)
+            if not intents:
+                break
+            await asyncio.gather(*(send(schema_name, callback_url, intent) for intent in intents))
+            sent += len(intents)
+        # results that came back through the callback endpoint since the last round
+        while True:
+            applied = await sync_to_async(_apply)(schema_name)
+            if not applied:
+                break
+            sent += applied
+        # pushes that may have reached Daraja are settled without sending them again
+        sent += await sync_to_async(_settle_unknown)(schema_name)
+    return sent
+
+
+async def run_dispatcher(stop, poll_interval=0.5, concurrency=None):
+    """
+    keep dispatching until the `stop` event is set
+    """
+    while not stop.is_set():
+        try:
+            sent = await dispatch_once(concurrency)
+        except Exception:
+            logger.exception("Payment dispatch round failed")
+            sent = 0
+        if not sent:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,121 @@
+"""
+A local stand-in for the Daraja API, for tests and for trying payments without the sandbox.
+
+FakeDaraja serves the OAuth, STK push and STK query endpoints from a background thread on
+127.0.0.1. Its behaviour is scripted: `delay` slows every answer down, `fail(path, *statuses)`
+makes the next calls to a path answer with the given HTTP statuses, `calls` counts
+the requests each path received and `connections` records the client sockets used.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+OAUTH_PATH = '/oauth/v1/generate'
+STK_PUSH_PATH = '/mpesa/stkpush/v1/processrequest'
+STK_QUERY_PATH = '/mpesa/stkpushquery/v1/query'
+
+
+class FakeDaraja:
+
+    def __init__(self, expires_in=3599, delay=0.0):
+        self.expires_in = expires_in
+        self.delay = delay
+        self.calls = Counter()
+        self.requests = []
+        self.connections = set()
+        self.tokens_issued = 0
+        self._failures = defaultdict(deque)
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                fake._handle(self)
+
+            def do_POST(self):
+                fake._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fail(self, path, *statuses):
+        """
+        answer the next calls to `path` with these HTTP statuses, one per call
+        """
+        with self._lock:
+            self._failures[path].extend(statuses)
+
+    def _handle(self, handler):
+        path = urlsplit(handler.path).path
+        length = int(handler.headers.get('Content-Length') or 0)
+        payload = json.loads(handler.rfile.read(length) or b'null') if length else None
+        with self._lock:
+            self.calls[path] += 1
+            self.connections.add(handler.client_address)
+            self.requests.append((handler.command, path, payload))
+            failure = self._failures[path].popleft() if self._failures[path] else None
+        if self.delay:
+            time.sleep(self.delay)
+
+        if failure is not None:
+            status, body = failure, {'errorCode': str(failure), 'errorMessage': 'Scripted failure'}
+        elif path == OAUTH_PATH:
+            status, body = self._token(handler)
+        elif path == STK_PUSH_PATH:
+            status, body = 200, {
+                'MerchantRequestID': uuid.uuid4().hex,
+                'CheckoutRequestID': f"ws_CO_{uuid.uuid4().hex}",
+                'ResponseCode': '0',
+                'ResponseDescription': 'Success. Request accepted for processing',
+                'CustomerMessage': 'Success. Request accepted for processing',
+            }
+        elif path == STK_QUERY_PATH:
+            status, body = 200, {
+                'ResponseCode': '0',
+                'CheckoutRequestID': (payload or {}).get('CheckoutRequestID'),
+                'ResultCode': '0',
+                'ResultDesc': 'The service request is processed successfully.',
+            }
+        else:
+            status, body = 404, {'errorMessage': 'Not found'}
+
+        data = json.dumps(body).encode()
+        try:
+            handler.send_response(status)
+            handler.send_header('Content-Type', 'application/json')
+            handler.send_header('Content-Length', str(len(data)))
+            handler.end_headers()
+            handler.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up waiting, which is what slow-gateway tests expect
+            handler.close_connection = True
+
+    def _token(self, handler):
+        if not handler.headers.get('Authorization', '').startswith('Basic '):
+            return 400, {'errorCode': '400.008.01', 'error_description': 'Invalid Authentication passed'}
+        with self._lock:
+            self.tokens_issued += 1
+            token = f"token-{self.tokens_issued}"
+        return 200, {'access_token': token, 'expires_in': str(self.expires_in)}
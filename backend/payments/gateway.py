@@ -0,0 +1,176 @@
+"""
+HTTP client for the Daraja payment gateway.
+
+All calls share one pooled requests.Session so connections to Safaricom are kept alive
+between payments. Every call has a connect and a read timeout. Calls that are safe to
+repeat (the OAuth token, STK status queries) are retried a bounded number of times with
+exponential backoff and full jitter; an STK push is never retried, as a repeat would
+prompt the customer twice. Failures that certainly happened before a request went out
+(the circuit is open, no connection could be made) raise GatewayUnreached, so callers
+know a push that failed that way is safe to send again. A circuit breaker stops sending requests for a while once
+the gateway keeps failing, so a Daraja outage fails payments fast instead of holding
+workers for the full timeout on every attempt.
+"""
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class MpesaError(Exception):
+    """
+    raised when the gateway cannot be reached or refuses a request
+    """
+
+
+class GatewayUnavailable(MpesaError):
+    """
+    raised when the circuit is open or the gateway did not answer
+    """
+
+
+class GatewayUnreached(GatewayUnavailable):
+    """
+    raised when the request certainly never reached the gateway: the circuit is open or no
+    connection could be made
+    """
+
+
+class CircuitBreaker:
+    """
+    opens after `failure_threshold` consecutive failures and lets a single trial call
+    through once `reset_timeout` seconds have passed
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures, self._opened_at, self._trial_running = 0, None, False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class DarajaClient:
+    """
+    pooled, time-bounded access to the Daraja API
+    """
+
+    def __init__(self, base_url, connect_timeout=3.05, read_timeout=10, max_retries=2, backoff=0.2,
+                 pool_size=20, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, path, idempotent=False, timeout=None, **kwargs):
+        """
+        send one call through the breaker, retrying idempotent calls on network errors and
+        on 429/5xx answers. Returns the final requests.Response.
+        """
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                raise GatewayUnreached("M-Pesa is not responding, please try again shortly.")
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}",
+                                                timeout=timeout or self.timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self.breaker.record_failure()
+                if attempt + 1 == attempts:
+                    error = GatewayUnreached if _not_sent(e) else GatewayUnavailable
+                    raise error(f"Network error communicating with M-Pesa: {e}")
+            else:
+                if response.status_code < 500:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+                if response.status_code not in RETRY_STATUSES or attempt + 1 == attempts:
+                    return response
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def get_access_token(self, credentials, timeout=None):
+        return self.request(
+            'GET', '/oauth/v1/generate', idempotent=True, timeout=timeout,
+            params={'grant_type': 'client_credentials'},
+            headers={'Authorization': f'Basic {credentials}'},
+        )
+
+    def stk_push(self, access_token, payload):
+        return self.request(
+            'POST', '/mpesa/stkpush/v1/processrequest',
+            headers={'Authorization': f'Bearer {access_token}'}, json=payload,
+        )
+
+    def stk_query(self, access_token, payload):
+        return self.request(
+            'POST', '/mpesa/stkpushquery/v1/query', idempotent=True,
+            headers={'Authorization': f'Bearer {access_token}'}, json=payload,
+        )
+
+
+def _not_sent(error):
+    """
+    whether a requests error happened before anything was sent: the connection timed out or
+    was refused. Read timeouts and dropped connections may come after the gateway got the
+    request.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if isinstance(error, requests.exceptions.ConnectionError) and error.args else None
+    return isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_gateway():
+    """
+    the process-wide Daraja client for the gateway in the settings
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = DarajaClient(settings.MPESA_BASE_URL)
+        return _client
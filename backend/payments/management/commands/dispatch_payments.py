@@ -0,0 +1,36 @@
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand
+
+from payments.dispatcher import dispatch_once, run_dispatcher
+
+
+class Command(BaseCommand):
+    help = (
+        "Send queued STK pushes for every tenant. Runs until interrupted; "
+        "start it next to the web workers, e.g. `manage.py dispatch_payments`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help="Pushes in flight at once (defaults to PAYMENTS_DISPATCH_CONCURRENCY).")
+        parser.add_argument('--poll-interval', type=float, default=0.5,
+                            help="Seconds to wait between rounds when nothing is queued.")
+        parser.add_argument('--once', action='store_true',
+                            help="Send what is due now and exit.")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            sent = asyncio.run(dispatch_once(options['concurrency']))
+            self.stdout.write(self.style.SUCCESS(f"Sent {sent} STK pushes."))
+            return
+        asyncio.run(self._run(options))
+
+    async def _run(self, options):
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        self.stdout.write("Dispatching STK pushes, press Ctrl+C to stop.")
+        await run_dispatcher(stop, poll_interval=options['poll_interval'], concurrency=options['concurrency'])
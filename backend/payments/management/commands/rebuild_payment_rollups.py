@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from payments.models import PaymentDailyRollup, Payments, rollup_payments
+
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily payment rollup from the payments table, e.g. after importing "
+        "payments directly. Run per tenant with `manage.py tenant_command rebuild_payment_rollups --schema=<tenant>`."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            PaymentDailyRollup.objects.all().delete()
+            batch, total = [], 0
+            for payment in Payments.objects.only(
+                'payment_type', 'total_amount', 'amount_paid', 'timestamp', 'order_id', 'tenant_id',
+            ).iterator(chunk_size=BATCH_SIZE):
+                batch.append(payment)
+                if len(batch) >= BATCH_SIZE:
+                    rollup_payments(batch)
+                    total += len(batch)
+                    batch = []
+            rollup_payments(batch)
+            total += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {total} payments into {PaymentDailyRollup.objects.count()} daily rows."
+        ))
@@ -0,0 +1,39 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from payments.statements import StatementError, reconcile_statement
+
+
+class Command(BaseCommand):
+    help = (
+        "Match an M-Pesa statement CSV against the payments of a period. "
+        "Run per tenant, e.g. `manage.py tenant_command reconcile_statement statement.csv "
+        "--start 2025-05-01 --end 2025-05-31 --schema=<tenant>`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('statement', help="Path of the statement CSV.")
+        parser.add_argument('--start', type=date.fromisoformat, required=True,
+                            help="First day of the period (YYYY-MM-DD).")
+        parser.add_argument('--end', type=date.fromisoformat, required=True,
+                            help="Last day of the period (YYYY-MM-DD).")
+        parser.add_argument('--window-days', type=int, default=1,
+                            help="How many days apart a payment and a statement line may be to match on amount and phone.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['statement'], encoding='utf-8-sig', newline='') as handle:
+                reconciliation = reconcile_statement(
+                    handle, options['start'], options['end'], connection.tenant.pk,
+                    file_name=options['statement'], window_days=options['window_days'],
+                )
+        except (OSError, StatementError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciliation #{reconciliation.pk}: {reconciliation.lines} lines, "
+            f"{reconciliation.matched_count} matched, {reconciliation.amount_mismatch_count} amount mismatches, "
+            f"{reconciliation.duplicate_count} duplicates, {reconciliation.unmatched_count} not in payments, "
+            f"{reconciliation.missing_count} payments not on the statement."
+        ))
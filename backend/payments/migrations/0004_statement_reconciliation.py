@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_mpesa_callback'),
+        ('tenants', '0007_alter_activitylogs_action_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatementReconciliation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(blank=True, max_length=255)),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+                ('lines', models.IntegerField(default=0)),
+                ('matched_count', models.IntegerField(default=0)),
+                ('amount_mismatch_count', models.IntegerField(default=0)),
+                ('duplicate_count', models.IntegerField(default=0)),
+                ('unmatched_count', models.IntegerField(default=0)),
+                ('missing_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tenants.tenant')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StatementLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('matched', 'Matched'), ('amount_mismatch', 'Amount Mismatch'), ('duplicate', 'Duplicate'), ('unmatched', 'Not In Payments'), ('missing', 'Not On Statement')], max_length=20)),
+                ('receipt_number', models.CharField(blank=True, max_length=50)),
+                ('completed_on', models.DateField(blank=True, null=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('phone_suffix', models.CharField(blank=True, max_length=3)),
+                ('details', models.CharField(blank=True, max_length=255)),
+                ('matched_on', models.CharField(blank=True, max_length=20)),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='statement_lines', to='payments.payments')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tenants.tenant')),
+                ('reconciliation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='payments.statementreconciliation')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['reconciliation', 'status'], name='payments_st_reconci_9b2b2d_idx')],
+            },
+        ),
+    ]
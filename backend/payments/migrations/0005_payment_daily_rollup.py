@@ -0,0 +1,73 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum, Value
+from django.db.models.functions import Coalesce, Lower
+
+
+def seed_payment_rollups(apps, schema_editor):
+    """
+    roll up the payments recorded before the rollup existed, one grouped query
+    """
+    Payments = apps.get_model('payments', 'Payments')
+    PaymentDailyRollup = apps.get_model('payments', 'PaymentDailyRollup')
+    buckets = (
+        Payments.objects
+        .values('timestamp', 'tenant_id')
+        .annotate(
+            kind=Lower(Coalesce('payment_type', Value(''))),
+            branch=Coalesce('order__branch_id', Value(0)),
+            cashier=Coalesce('order__cashier_id', Value(0)),
+        )
+        .values('timestamp', 'kind', 'branch', 'cashier', 'tenant_id')
+        .annotate(total=Sum('total_amount'), paid=Sum('amount_paid'), count=Count('id'))
+        .order_by()
+    )
+    PaymentDailyRollup.objects.bulk_create([
+        PaymentDailyRollup(
+            date=bucket['timestamp'], payment_type=bucket['kind'], branch_key=bucket['branch'],
+            cashier_key=bucket['cashier'], total_amount=bucket['total'], amount_paid=bucket['paid'],
+            payments_count=bucket['count'], tenant_id=bucket['tenant_id'],
+        )
+        for bucket in buckets.iterator()
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_statement_reconciliation'),
+        ('products', '0011_order_branch_reorderrequest'),
+        ('tenants', '0007_alter_activitylogs_action_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payment_type', models.CharField(blank=True, max_length=100)),
+                ('branch_key', models.BigIntegerField(default=0)),
+                ('cashier_key', models.BigIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('amount_paid', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('payments_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='payments',
+            index=models.Index(fields=['tenant', 'timestamp'], name='payments_pa_tenant__718212_idx'),
+        ),
+        migrations.AddField(
+            model_name='paymentdailyrollup',
+            name='tenant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tenants.tenant'),
+        ),
+        migrations.AddConstraint(
+            model_name='paymentdailyrollup',
+            constraint=models.UniqueConstraint(fields=('date', 'payment_type', 'branch_key', 'cashier_key'), name='unique_payment_rollup_bucket'),
+        ),
+        migrations.RunPython(seed_payment_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_payment_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentintent',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('dispatching', 'Dispatching'), ('pending', 'Awaiting Customer'), ('unknown', 'Outcome Unknown'), ('completed', 'Completed'), ('failed', 'Failed')], default='queued', max_length=12),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_payment_intent_unknown'),
+        ('tenants', '0008_alter_activitylogs_action_type'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='mpesacallback',
+            name='mpesa_callback_unapplied',
+        ),
+        migrations.AddField(
+            model_name='mpesacallback',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mpesacallback',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='mpesacallback',
+            index=models.Index(condition=models.Q(('applied_at__isnull', True)), fields=['next_attempt_at', 'id'], name='mpesa_callback_unapplied'),
+        ),
+    ]
@@ -1,4 +1,9 @@
+import uuid
+from decimal import Decimal
+
 from django.db import models
+from django.utils import timezone
+from erp.db import upsert_increment
 from tenants.models import *
 from products.models import *
 
@@ -22,4 +27,216 @@ class Payments(models.Model):
     class Meta:
         verbose_name_plural = 'Payments'
         ordering = ['-timestamp']
+        indexes = [models.Index(fields=['tenant', 'timestamp'])]
+
+
+
+
+class PaymentDailyRollup(models.Model):
+    """
+    takings per day, payment type, branch and cashier, kept up to date as payments are
+    recorded. `branch_key` and `cashier_key` hold the branch and cashier ids, 0 when the
+    payment's order has none, so every combination has exactly one row to add onto.
+    """
+    date = models.DateField()
+    payment_type = models.CharField(max_length=100, blank=True)
+    branch_key = models.BigIntegerField(default=0)
+    cashier_key = models.BigIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    amount_paid = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payments_count = models.IntegerField(default=0)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'payment_type', 'branch_key', 'cashier_key'],
+                                    name='unique_payment_rollup_bucket'),
+        ]
+
+    def __str__(self):
+        return f'{self.payment_type or "unknown"} takings on {self.date}'
+
+
+ROLLUP_COUNTERS = ['total_amount', 'amount_paid', 'payments_count']
+
+
+def rollup_payments(payments, sign=1):
+    """
+    add (sign=1) or take off (sign=-1) saved payments from the daily rollup. The orders'
+    branch and cashier are read in one query.
+    """
+    orders = {
+        pk: (branch_id, cashier_id)
+        for pk, branch_id, cashier_id in Order.objects.filter(pk__in={payment.order_id for payment in payments})
+        .values_list('pk', 'branch_id', 'cashier_id')
+    }
+    rows = []
+    for payment in payments:
+        branch_id, cashier_id = orders.get(payment.order_id, (None, None))
+        rows.append({
+            'date': payment.timestamp,
+            'payment_type': (payment.payment_type or '').lower(),
+            'branch_key': branch_id or 0,
+            'cashier_key': cashier_id or 0,
+            'total_amount': sign * payment.total_amount,
+            'amount_paid': sign * payment.amount_paid,
+            'payments_count': sign,
+            'tenant_id': payment.tenant_id,
+        })
+    return upsert_increment(PaymentDailyRollup, rows, keys=['date', 'payment_type', 'branch_key', 'cashier_key'],
+                            add=ROLLUP_COUNTERS)
+
+
+INTENT_STATUSES = [
+    ('queued', 'Queued'),
+    ('dispatching', 'Dispatching'),
+    ('pending', 'Awaiting Customer'),
+    ('unknown', 'Outcome Unknown'),
+    ('completed', 'Completed'),
+    ('failed', 'Failed'),
+]
+
+
+class PaymentIntent(models.Model):
+    """
+    an STK push waiting to be sent, or sent and waiting for the customer. The web request only
+    creates the intent; the payments dispatcher talks to the gateway and moves it along. An
+    intent whose push may or may not have reached Daraja is 'unknown' until a status query
+    or a callback settles it; it is never sent again.
+    """
+    handle = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    phone_number = models.CharField(max_length=20)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    account_reference = models.CharField(max_length=12, blank=True)
+    description = models.CharField(max_length=13, default='Payment')
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='payment_intents')
+    status = models.CharField(max_length=12, choices=INTENT_STATUSES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    checkout_request_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    merchant_request_id = models.CharField(max_length=100, blank=True)
+    response_description = models.CharField(max_length=255, blank=True)
+    result_code = models.IntegerField(null=True, blank=True)
+    mpesa_receipt_number = models.CharField(max_length=30, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f'STK push of {self.amount} to {self.phone_number} ({self.status})'
 
+
+class MpesaCallback(models.Model):
+    """
+    the raw result Safaricom posts back for an STK push, stored as received. The unique
+    checkout and receipt numbers make the gateway's retries of the same callback no-ops;
+    applied_at is set once the result has been applied to its intent and order. A callback
+    no intent matches yet (it can arrive before the dispatcher saved the push's
+    CheckoutRequestID) stays unapplied and is looked at again at next_attempt_at, backing off;
+    unapplied successful callbacks are money received that still needs matching.
+    """
+    checkout_request_id = models.CharField(max_length=100, unique=True)
+    merchant_request_id = models.CharField(max_length=100, blank=True)
+    mpesa_receipt_number = models.CharField(max_length=30, unique=True, null=True, blank=True)
+    result_code = models.IntegerField()
+    result_desc = models.CharField(max_length=255, blank=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    phone_number = models.CharField(max_length=20, blank=True)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    applied_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at', 'id'], condition=models.Q(applied_at__isnull=True),
+                         name='mpesa_callback_unapplied'),
+        ]
+
+    def __str__(self):
+        return f'Callback for {self.checkout_request_id} ({self.result_code})'
+
+    @classmethod
+    def from_payload(cls, payload, tenant):
+        """
+        build (without saving) the callback for a posted Daraja result; raises KeyError,
+        TypeError or ValueError when the body is not an STK callback
+        """
+        callback = payload['Body']['stkCallback']
+        items = {
+            item['Name']: item.get('Value')
+            for item in (callback.get('CallbackMetadata') or {}).get('Item', [])
+        }
+        amount = items.get('Amount')
+        return cls(
+            checkout_request_id=callback['CheckoutRequestID'],
+            merchant_request_id=callback.get('MerchantRequestID', ''),
+            mpesa_receipt_number=items.get('MpesaReceiptNumber') or None,
+            result_code=int(callback['ResultCode']),
+            result_desc=str(callback.get('ResultDesc', ''))[:255],
+            amount=Decimal(str(amount)) if amount is not None else None,
+            phone_number=str(items.get('PhoneNumber') or ''),
+            payload=payload,
+            tenant=tenant,
+        )
+
+
+STATEMENT_LINE_STATUSES = [
+    ('matched', 'Matched'),
+    ('amount_mismatch', 'Amount Mismatch'),
+    ('duplicate', 'Duplicate'),
+    ('unmatched', 'Not In Payments'),
+    ('missing', 'Not On Statement'),
+]
+
+
+class StatementReconciliation(models.Model):
+    """
+    one M-Pesa statement matched against the payments of a period
+    """
+    file_name = models.CharField(max_length=255, blank=True)
+    period_start = models.DateField()
+    period_end = models.DateField()
+    lines = models.IntegerField(default=0)
+    matched_count = models.IntegerField(default=0)
+    amount_mismatch_count = models.IntegerField(default=0)
+    duplicate_count = models.IntegerField(default=0)
+    unmatched_count = models.IntegerField(default=0)
+    missing_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'Statement {self.period_start} to {self.period_end}: {self.matched_count}/{self.lines} matched'
+
+
+class StatementLine(models.Model):
+    """
+    the outcome for one statement line, or for a payment the statement did not contain
+    """
+    reconciliation = models.ForeignKey(StatementReconciliation, on_delete=models.CASCADE, related_name='results')
+    status = models.CharField(max_length=20, choices=STATEMENT_LINE_STATUSES)
+    receipt_number = models.CharField(max_length=50, blank=True)
+    completed_on = models.DateField(null=True, blank=True)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    phone_suffix = models.CharField(max_length=3, blank=True)
+    details = models.CharField(max_length=255, blank=True)
+    payment = models.ForeignKey(Payments, on_delete=models.SET_NULL, null=True, blank=True, related_name='statement_lines')
+    matched_on = models.CharField(max_length=20, blank=True)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [models.Index(fields=['reconciliation', 'status'])]
+
+    def __str__(self):
+        return f'{self.receipt_number} {self.get_status_display()}'
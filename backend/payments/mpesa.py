@@ -0,0 +1,216 @@
+"""
+M-Pesa (Daraja) OAuth access tokens.
+
+A Daraja token is valid for `expires_in` seconds (an hour in practice), so there is no
+need to ask for a new one on every STK push. AccessTokenManager keeps the token in the
+shared Django cache until shortly before it expires, and makes sure that only one caller
+refreshes it at a time: threads of a process queue on a lock, and processes take turns
+through a short-lived `cache.add()` lock while the others wait for the new token to
+appear in the cache. Across processes this needs the default cache to be a shared backend
+(REDIS_URL); the payments.W001 check warns when it is not.
+"""
+import base64
+import datetime
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+
+from .gateway import GatewayUnavailable, MpesaError, get_gateway
+
+
+class AccessTokenManager:
+    """
+    hands out a valid access token for one consumer key/secret pair, refreshing it single-flight
+    """
+
+    def __init__(self, consumer_key, consumer_secret, client, cache=None, refresh_margin=60,
+                 lock_timeout=10, timeout=None):
+        if not consumer_key or not consumer_secret:
+            raise MpesaError("M-Pesa consumer key or secret not found in environment variables")
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.client = client
+        self.cache = cache if cache is not None else default_cache
+        self.refresh_margin = refresh_margin
+        self.lock_timeout = lock_timeout
+        self.timeout = timeout
+
+        name = hashlib.sha256(consumer_key.encode()).hexdigest()[:16]
+        self.cache_key = f"mpesa:token:{name}"
+        self.lock_key = f"mpesa:token:{name}:lock"
+
+        self._lock = threading.Lock()
+        # counters get their own lock, so a hit never queues behind a refresh holding _lock
+        self._metrics_lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0
+        self._metrics = {
+            'hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'refresh_failures': 0,
+            'lock_waits': 0,
+            'last_refresh_seconds': None,
+            'last_refreshed_at': None,
+        }
+
+    def get_token(self):
+        """
+        a token that stays valid for at least `refresh_margin` more seconds
+        """
+        token = self._fresh_token()
+        if token:
+            self._count('hits')
+            return token
+        with self._lock:
+            # another thread may have refreshed while this one queued for the lock
+            token = self._fresh_token()
+            if token:
+                self._count('hits')
+                return token
+            self._count('misses')
+            return self._refresh()
+
+    def invalidate(self):
+        """
+        forget the current token, e.g. after the gateway rejected it with a 401
+        """
+        with self._lock:
+            self._token, self._expires_at = None, 0.0
+            self.cache.delete(self.cache_key)
+
+    def metrics(self):
+        with self._metrics_lock:
+            return dict(self._metrics)
+
+    def _count(self, name, **values):
+        with self._metrics_lock:
+            self._metrics[name] += 1
+            self._metrics.update(values)
+
+    def _fresh_token(self):
+        now = time.time()
+        if self._token and self._expires_at - self.refresh_margin > now:
+            return self._token
+        cached = self.cache.get(self.cache_key)
+        if cached and cached['expires_at'] - self.refresh_margin > now:
+            self._token, self._expires_at = cached['token'], cached['expires_at']
+            return self._token
+        return None
+
+    def _refresh(self):
+        deadline = time.time() + self.lock_timeout
+        while not self.cache.add(self.lock_key, 1, self.lock_timeout):
+            # another process is refreshing: wait for its token rather than asking again
+            self._count('lock_waits')
+            if time.time() >= deadline:
+                # the holder died or hung; its lock expires with lock_timeout anyway
+                break
+            time.sleep(0.05)
+            token = self._fresh_token()
+            if token:
+                return token
+        try:
+            token = self._fresh_token()
+            if token:
+                return token
+            return self._fetch()
+        finally:
+            self.cache.delete(self.lock_key)
+
+    def _fetch(self):
+        started = time.monotonic()
+        credentials = base64.b64encode(f"{self.consumer_key}:{self.consumer_secret}".encode()).decode()
+        try:
+            response = self.client.get_access_token(credentials, timeout=self.timeout)
+            body = response.json()
+        except GatewayUnavailable:
+            self._count('refresh_failures')
+            raise
+        except ValueError as e:
+            self._count('refresh_failures')
+            raise MpesaError(f"Failed to get M-Pesa access token: {e}")
+        if response.status_code != 200 or 'access_token' not in body:
+            self._count('refresh_failures')
+            raise MpesaError(
+                "Failed to get M-Pesa access token: " + body.get('error_description', f"HTTP {response.status_code}")
+            )
+
+        expires_in = int(body.get('expires_in', 3599))
+        self._token, self._expires_at = body['access_token'], time.time() + expires_in
+        self.cache.set(
+            self.cache_key,
+            {'token': self._token, 'expires_at': self._expires_at},
+            max(expires_in - self.refresh_margin, 1),
+        )
+        self._count('refreshes', last_refresh_seconds=round(time.monotonic() - started, 4),
+                    last_refreshed_at=time.time())
+        return self._token
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_token_manager():
+    """
+    the process-wide token manager for the credentials in the settings
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = AccessTokenManager(
+                settings.MPESA_CONSUMER_KEY,
+                settings.MPESA_CONSUMER_SECRET,
+                get_gateway(),
+            )
+        return _manager
+
+
+def _short_code_password():
+    """
+    (short code, password, timestamp) authenticating an STK call for the short code in the settings
+    """
+    business_short_code = settings.MPESA_BUSINESS_SHORT_CODE
+    pass_key = settings.MPESA_PASS_KEY
+    if not business_short_code or not pass_key:
+        raise MpesaError("M-Pesa business short code or pass key not found in environment variables")
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    password = base64.b64encode((business_short_code + pass_key + timestamp).encode('utf-8')).decode('utf-8')
+    return business_short_code, password, timestamp
+
+
+def stk_push_payload(phone_number, amount, account_reference, description, callback_url):
+    """
+    the body of a CustomerPayBillOnline STK push for the short code in the settings
+    """
+    business_short_code, password, timestamp = _short_code_password()
+    return {
+        "BusinessShortCode": business_short_code,
+        "Password": password,
+        "Timestamp": timestamp,
+        "TransactionType": "CustomerPayBillOnline",
+        "Amount": int(amount),
+        "PartyA": phone_number,
+        "PartyB": business_short_code,
+        "PhoneNumber": phone_number,
+        "CallBackURL": callback_url,
+        "AccountReference": account_reference,
+        "TransactionDesc": description,
+    }
+
+
+def stk_query_payload(checkout_request_id):
+    """
+    the body of a status query for the STK push Daraja accepted as `checkout_request_id`
+    """
+    business_short_code, password, timestamp = _short_code_password()
+    return {
+        "BusinessShortCode": business_short_code,
+        "Password": password,
+        "Timestamp": timestamp,
+        "CheckoutRequestID": checkout_request_id,
+    }
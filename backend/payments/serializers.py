@@ -1,12 +1,80 @@
+from django.utils import timezone
 from rest_framework import serializers
 from .models import *
+from .analytics import GROUPS
 
 class PaymentSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Payments
         fields = ['id','customer_name','customer_email','customer_phone',
-                  'payment_type','total_amount','total_vat','transaction_id',
+                  'payment_type','total_amount','amount_paid','transaction_id',
                   'mpesa_reference','card_last4','timestamp','order','tenant']
         read_only_fields = ['tenant','mpesa_reference','card_last4',
-                            'transaction_id','timestamp']
\ No newline at end of file
+                            'transaction_id','timestamp']
+
+
+class PaymentSummarySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    group_by = serializers.MultipleChoiceField(choices=list(GROUPS), required=False)
+
+    def validate(self, attrs):
+        # month to date unless a period is given
+        attrs.setdefault('end', timezone.localdate())
+        attrs.setdefault('start', attrs['end'].replace(day=1))
+        if attrs['start'] > attrs['end']:
+            raise serializers.ValidationError("The start date must not be after the end date.")
+        # query strings without group_by arrive as an empty selection rather than the default
+        attrs['group_by'] = attrs.get('group_by') or {'payment_type'}
+        return attrs
+
+
+class PaymentIntentSerializer(serializers.ModelSerializer):
+    phone_number = serializers.RegexField(r'^2547\d{8}$|^2541\d{8}$',
+                                          error_messages={'invalid': 'Use the 2547XXXXXXXX phone number format.'})
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=1)
+    company_name = serializers.CharField(source='account_reference', max_length=12, required=False, allow_blank=True)
+
+    class Meta:
+        model = PaymentIntent
+        fields = ['handle','phone_number','amount','company_name','description','order','status',
+                  'checkout_request_id','response_description','error','created_at','dispatched_at']
+        read_only_fields = ['handle','status','checkout_request_id','response_description','error',
+                            'created_at','dispatched_at']
+
+    def validate_amount(self, amount):
+        if amount != amount.to_integral_value():
+            raise serializers.ValidationError("M-Pesa only accepts whole shillings.")
+        return amount
+
+
+
+class StatementUploadSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    period_start = serializers.DateField()
+    period_end = serializers.DateField()
+    window_days = serializers.IntegerField(min_value=0, max_value=7, default=1)
+
+    def validate(self, attrs):
+        if attrs['period_start'] > attrs['period_end']:
+            raise serializers.ValidationError("The period must not end before it starts.")
+        return attrs
+
+
+class StatementReconciliationSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = StatementReconciliation
+        fields = ['id','file_name','period_start','period_end','lines','matched_count','amount_mismatch_count',
+                  'duplicate_count','unmatched_count','missing_count','created_at']
+        read_only_fields = fields
+
+
+class StatementLineSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = StatementLine
+        fields = ['id','status','receipt_number','completed_on','amount','phone_suffix','details',
+                  'payment','matched_on']
+        read_only_fields = fields
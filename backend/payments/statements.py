@@ -0,0 +1,204 @@
+"""
+M-Pesa statement reconciliation.
+
+A statement export is read one row at a time and matched against the period's Payments,
+which are loaded once into two in-memory hash indexes:
+
+* by reference: the M-Pesa receipt number (Payments.mpesa_reference) or, failing that,
+  the checkout/transaction id; a hit whose amount differs is an amount mismatch.
+* by amount and phone: the amount in cents together with the last three digits of the
+  payer's phone (statements mask the middle of the number), then the closest unused
+  payment within `window_days` of the statement line.
+
+A receipt that appears twice in the file, or that points at a payment another line has
+already taken, is a duplicate. Statement lines nothing matched are unmatched, and M-Pesa
+payments of the period that no line matched are recorded as missing from the statement.
+Results are written with bulk_create as the file is read.
+"""
+import csv
+import re
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .models import Payments, StatementLine, StatementReconciliation
+
+HEADER_ALIASES = {
+    'receipt': ('receipt no.', 'receipt no', 'receipt', 'transaction id'),
+    'completed_at': ('completion time', 'transaction date', 'date'),
+    'details': ('details', 'description'),
+    'status': ('transaction status', 'status'),
+    'paid_in': ('paid in', 'amount', 'credit'),
+    'party': ('other party info', 'phone number', 'msisdn'),
+}
+DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%d-%m-%Y %H:%M:%S', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%Y-%m-%d')
+BATCH_SIZE = 5000
+
+
+class StatementError(Exception):
+    """
+    raised when a statement file cannot be read
+    """
+
+
+def _cents(value):
+    try:
+        return int((Decimal(str(value).replace(',', '').strip() or '0') * 100).to_integral_value())
+    except InvalidOperation:
+        return None
+
+
+def _phone_suffix(value):
+    digits = re.sub(r'\D', '', (value or '').split('-')[0])
+    return digits[-3:] if len(digits) >= 3 else None
+
+
+def _parse_date(value):
+    value = (value or '').strip()
+    try:
+        # the portal exports ISO timestamps; strptime is only needed for other layouts
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def read_statement(handle):
+    """
+    yield (receipt, date, cents, phone suffix, details) for every completed incoming line,
+    skipping whatever preamble precedes the header row
+    """
+    reader = csv.reader(handle)
+    columns = None
+    for row in reader:
+        cells = [cell.strip().lower() for cell in row]
+        if columns is None:
+            found = {
+                name: next((cells.index(alias) for alias in aliases if alias in cells), None)
+                for name, aliases in HEADER_ALIASES.items()
+            }
+            if found['receipt'] is not None and found['paid_in'] is not None:
+                columns = found
+            continue
+        if len(row) <= max(index for index in columns.values() if index is not None):
+            continue
+
+        def cell(name):
+            index = columns[name]
+            return row[index].strip() if index is not None else ''
+
+        if columns['status'] is not None and cell('status').lower() not in ('completed', 'success', ''):
+            continue
+        cents = _cents(cell('paid_in'))
+        if not cents or cents <= 0:
+            continue
+        yield cell('receipt').upper(), _parse_date(cell('completed_at')), cents, _phone_suffix(cell('party')), cell('details')
+    if columns is None:
+        raise StatementError("No header row with a receipt number and a paid in column was found.")
+
+
+class _PaymentIndex:
+
+    def __init__(self, payments):
+        self.by_reference = {}
+        self.by_amount_phone = {}
+        for payment in payments:
+            for reference in (payment['mpesa_reference'], payment['transaction_id']):
+                if reference:
+                    self.by_reference.setdefault(reference.strip().upper(), payment)
+            key = (_cents(payment['amount_paid']), _phone_suffix(payment['customer_phone']))
+            if key[1]:
+                self.by_amount_phone.setdefault(key, []).append(payment)
+
+    def closest(self, cents, phone, day, window):
+        best = None
+        for payment in self.by_amount_phone.get((cents, phone), ()):
+            if payment['used'] or day is None:
+                continue
+            distance = abs((payment['timestamp'] - day).days)
+            if distance <= window and (best is None or distance < abs((best['timestamp'] - day).days)):
+                best = payment
+        return best
+
+
+def reconcile_statement(handle, period_start, period_end, tenant_id, file_name='', window_days=1):
+    """
+    reconcile one statement (a text file object) against the payments recorded between
+    `period_start` and `period_end`, and return the saved StatementReconciliation
+    """
+    window = timedelta(days=window_days)
+    payments = list(
+        Payments.objects.filter(timestamp__gte=period_start - window, timestamp__lte=period_end + window)
+        .values('id', 'mpesa_reference', 'transaction_id', 'amount_paid', 'customer_phone', 'timestamp', 'payment_type')
+    )
+    for payment in payments:
+        payment['used'] = False
+    index = _PaymentIndex(payments)
+
+    with transaction.atomic():
+        reconciliation = StatementReconciliation.objects.create(
+            file_name=file_name, period_start=period_start, period_end=period_end, tenant_id=tenant_id,
+        )
+        counts = dict.fromkeys(('matched', 'amount_mismatch', 'duplicate', 'unmatched', 'missing'), 0)
+        seen, batch = set(), []
+
+        def add(status, **fields):
+            counts[status] += 1
+            batch.append(StatementLine(reconciliation_id=reconciliation.pk, status=status, tenant_id=tenant_id, **fields))
+            if len(batch) >= BATCH_SIZE:
+                StatementLine.objects.bulk_create(batch)
+                batch.clear()
+
+        lines = 0
+        for receipt, day, cents, phone, details in read_statement(handle):
+            lines += 1
+            line = {
+                'receipt_number': receipt,
+                'completed_on': day,
+                'amount': Decimal(cents) / 100,
+                'phone_suffix': phone or '',
+                'details': details[:255],
+            }
+            if receipt in seen:
+                add('duplicate', **line)
+                continue
+            seen.add(receipt)
+
+            payment = index.by_reference.get(receipt)
+            if payment is not None:
+                if payment['used']:
+                    add('duplicate', payment_id=payment['id'], matched_on='reference', **line)
+                    continue
+                payment['used'] = True
+                status = 'matched' if _cents(payment['amount_paid']) == cents else 'amount_mismatch'
+                add(status, payment_id=payment['id'], matched_on='reference', **line)
+                continue
+
+            payment = index.closest(cents, phone, day, window_days)
+            if payment is not None:
+                payment['used'] = True
+                add('matched', payment_id=payment['id'], matched_on='amount_phone_time', **line)
+            else:
+                add('unmatched', **line)
+
+        for payment in payments:
+            in_period = period_start <= payment['timestamp'] <= period_end
+            is_mpesa = bool(payment['mpesa_reference']) or (payment['payment_type'] or '').lower() == 'mpesa'
+            if not payment['used'] and in_period and is_mpesa:
+                add('missing', payment_id=payment['id'], receipt_number=(payment['mpesa_reference'] or '').upper(),
+                    completed_on=payment['timestamp'], amount=payment['amount_paid'],
+                    phone_suffix=_phone_suffix(payment['customer_phone']) or '')
+        StatementLine.objects.bulk_create(batch)
+
+        reconciliation.lines = lines
+        for status, count in counts.items():
+            setattr(reconciliation, f'{status}_count', count)
+        reconciliation.save()
+    return reconciliation
+
@@ -1,3 +1,353 @@
-from django.test import TestCase
+import io
+import threading
+import time
+import uuid
+from datetime import date
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from django_tenants.test.cases import TenantTestCase
+
+from products.models import Order
+from .callbacks import apply_callbacks
+
+from .checks import check_shared_cache, check_shared_cache_deploy
+from .fake_daraja import OAUTH_PATH, STK_PUSH_PATH, STK_QUERY_PATH, FakeDaraja
+from .dispatcher import _send
+from .gateway import CircuitBreaker, DarajaClient, GatewayUnavailable, GatewayUnreached
+from .models import MpesaCallback, PaymentIntent, Payments
+from .mpesa import AccessTokenManager, MpesaError
+from .statements import StatementError, read_statement
+
+
+def run_threads(targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class AccessTokenManagerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.gateway = FakeDaraja()
+        self.addCleanup(self.gateway.close)
+        self.daraja = DarajaClient(self.gateway.base_url, backoff=0)
+        self.cache = LocMemCache(f'mpesa-tests-{uuid.uuid4()}', {})
+
+    def manager(self, **kwargs):
+        return AccessTokenManager('key', 'secret', self.daraja, cache=self.cache, **kwargs)
+
+    def test_token_is_reused_until_close_to_expiry(self):
+        manager = self.manager()
+        self.assertEqual(manager.get_token(), 'token-1')
+        self.assertEqual(manager.get_token(), 'token-1')
+        self.assertEqual(self.gateway.calls[OAUTH_PATH], 1)
+        metrics = manager.metrics()
+        self.assertEqual((metrics['hits'], metrics['misses'], metrics['refreshes']), (1, 1, 1))
+
+    def test_token_is_refreshed_within_the_margin(self):
+        self.gateway.expires_in = 2
+        manager = self.manager(refresh_margin=1)
+        self.assertEqual(manager.get_token(), 'token-1')
+        time.sleep(1.1)
+        self.assertEqual(manager.get_token(), 'token-2')
+        self.assertEqual(self.gateway.calls[OAUTH_PATH], 2)
+
+    def test_concurrent_threads_refresh_once(self):
+        self.gateway.delay = 0.2
+        manager = self.manager()
+        tokens = []
+        run_threads([lambda: tokens.append(manager.get_token())] * 20)
+        self.assertEqual(tokens, ['token-1'] * 20)
+        self.assertEqual(self.gateway.calls[OAUTH_PATH], 1)
+
+    def test_managers_sharing_one_cache_refresh_once(self):
+        # two managers over one in-process cache object; across processes the same holds only
+        # when the default cache is a shared backend (see CacheCheckTests)
+        self.gateway.delay = 0.2
+        managers = [self.manager(), self.manager()]
+        tokens = []
+        run_threads([lambda m=manager: tokens.append(m.get_token()) for manager in managers for _ in range(5)])
+        self.assertEqual(tokens, ['token-1'] * 10)
+        self.assertEqual(self.gateway.calls[OAUTH_PATH], 1)
+        self.assertGreater(sum(manager.metrics()['lock_waits'] for manager in managers), 0)
+
+    def test_counts_are_not_lost_under_concurrency(self):
+        manager = self.manager()
+        manager.get_token()
+
+        def hits():
+            for _ in range(500):
+                manager.get_token()
+
+        run_threads([hits] * 8)
+        self.assertEqual(manager.metrics()['hits'], 4000)
+
+    def test_invalidate_forces_a_new_token(self):
+        manager = self.manager()
+        manager.get_token()
+        manager.invalidate()
+        self.assertEqual(manager.get_token(), 'token-2')
+
+    def test_rejected_credentials_raise(self):
+        self.gateway.fail(OAUTH_PATH, 400)
+        manager = self.manager()
+        with self.assertRaisesMessage(MpesaError, 'HTTP 400'):
+            manager.get_token()
+        self.assertEqual(manager.metrics()['refresh_failures'], 1)
+        self.assertIsNone(self.cache.get(manager.lock_key))
+
+
+class DarajaClientTests(SimpleTestCase):
+
+    def setUp(self):
+        self.gateway = FakeDaraja()
+        self.addCleanup(self.gateway.close)
+
+    def daraja(self, **kwargs):
+        kwargs.setdefault('backoff', 0.01)
+        return DarajaClient(self.gateway.base_url, **kwargs)
+
+    def test_idempotent_calls_are_retried(self):
+        self.gateway.fail(STK_QUERY_PATH, 503, 502)
+        response = self.daraja(max_retries=2).stk_query('token', {'CheckoutRequestID': 'ws_CO_1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.gateway.calls[STK_QUERY_PATH], 3)
+
+    def test_retries_are_bounded(self):
+        self.gateway.fail(STK_QUERY_PATH, 503, 503, 503, 503)
+        response = self.daraja(max_retries=2).stk_query('token', {})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.gateway.calls[STK_QUERY_PATH], 3)
+
+    def test_stk_push_is_never_retried(self):
+        self.gateway.fail(STK_PUSH_PATH, 503)
+        response = self.daraja(max_retries=2).stk_push('token', {'Amount': 1})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.gateway.calls[STK_PUSH_PATH], 1)
+
+    def test_connections_are_kept_alive(self):
+        client = self.daraja()
+        for _ in range(5):
+            client.stk_query('token', {})
+        self.assertEqual(len(self.gateway.connections), 1)
+
+    def test_slow_gateway_is_cut_off_by_the_read_timeout(self):
+        self.gateway.delay = 1
+        client = self.daraja(read_timeout=0.2, max_retries=1)
+        started = time.monotonic()
+        with self.assertRaises(GatewayUnavailable):
+            client.stk_query('token', {})
+        self.assertLess(time.monotonic() - started, 0.9)
+
+    def test_a_refused_connection_is_known_not_to_have_been_sent(self):
+        self.gateway.close()
+        with self.assertRaises(GatewayUnreached):
+            self.daraja().stk_push('token', {})
+
+    def test_a_push_cut_off_by_the_read_timeout_may_have_been_sent(self):
+        self.gateway.delay = 1
+        with self.assertRaises(GatewayUnavailable) as raised:
+            self.daraja(read_timeout=0.2).stk_push('token', {})
+        self.assertNotIsInstance(raised.exception, GatewayUnreached)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        self.gateway.fail(STK_PUSH_PATH, *[500] * 3)
+        client = self.daraja(breaker=CircuitBreaker(failure_threshold=3, reset_timeout=0.3))
+        for _ in range(3):
+            client.stk_push('token', {})
+        self.assertEqual(client.breaker.state, 'open')
+        with self.assertRaises(GatewayUnreached):
+            client.stk_push('token', {})
+        self.assertEqual(self.gateway.calls[STK_PUSH_PATH], 3)
+
+        time.sleep(0.3)
+        self.assertEqual(client.stk_push('token', {}).status_code, 200)
+        self.assertEqual(client.breaker.state, 'closed')
+
+
+@override_settings(MPESA_BUSINESS_SHORT_CODE='174379', MPESA_PASS_KEY='passkey')
+class SendIntentTests(SimpleTestCase):
+
+    def setUp(self):
+        self.gateway = FakeDaraja()
+        self.addCleanup(self.gateway.close)
+        self.daraja = DarajaClient(self.gateway.base_url, read_timeout=0.2, backoff=0)
+        self.manager = AccessTokenManager('key', 'secret', self.daraja,
+                                          cache=LocMemCache(f'mpesa-tests-{uuid.uuid4()}', {}))
+        # the token is fetched before the gateway misbehaves
+        self.manager.get_token()
+        self.outcomes = []
+        for name in ('_retry_or_fail', '_mark_unknown', '_fail'):
+            patcher = mock.patch(f'payments.dispatcher.{name}',
+                                 side_effect=lambda intent, error, name=name: self.outcomes.append(name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name, value in (('get_gateway', self.daraja), ('get_token_manager', self.manager)):
+            patcher = mock.patch(f'payments.dispatcher.{name}', return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def send(self):
+        intent = PaymentIntent(phone_number='254708374149', amount=Decimal('100'), attempts=1)
+        with mock.patch.object(intent, 'save'):
+            _send(intent, 'https://example.com/callback/')
+        return intent
+
+    def test_an_accepted_push_is_pending(self):
+        intent = self.send()
+        self.assertEqual(intent.status, 'pending')
+        self.assertTrue(intent.checkout_request_id.startswith('ws_CO_'))
+
+    def test_a_push_that_never_left_is_retried(self):
+        self.daraja.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        self.daraja.breaker.record_failure()
+        self.send()
+        self.assertEqual(self.outcomes, ['_retry_or_fail'])
+
+    def test_a_push_that_timed_out_is_not_sent_again(self):
+        self.gateway.delay = 1
+        self.send()
+        self.assertEqual(self.outcomes, ['_mark_unknown'])
+        self.assertEqual(self.gateway.calls[STK_PUSH_PATH], 1)
+
+    def test_a_server_error_leaves_the_outcome_unknown(self):
+        self.gateway.fail(STK_PUSH_PATH, 503)
+        self.send()
+        self.assertEqual(self.outcomes, ['_mark_unknown'])
+
+    def test_a_rate_limited_push_is_retried(self):
+        self.gateway.fail(STK_PUSH_PATH, 429)
+        self.send()
+        self.assertEqual(self.outcomes, ['_retry_or_fail'])
+
+
+class MpesaCallbackPayloadTests(SimpleTestCase):
+
+    def test_successful_payment(self):
+        payload = {'Body': {'stkCallback': {
+            'MerchantRequestID': '29115-34620561-1',
+            'CheckoutRequestID': 'ws_CO_191220191020363925',
+            'ResultCode': 0,
+            'ResultDesc': 'The service request is processed successfully.',
+            'CallbackMetadata': {'Item': [
+                {'Name': 'Amount', 'Value': 1.0},
+                {'Name': 'MpesaReceiptNumber', 'Value': 'NLJ7RT61SV'},
+                {'Name': 'Balance'},
+                {'Name': 'TransactionDate', 'Value': 20191219102115},
+                {'Name': 'PhoneNumber', 'Value': 254708374149},
+            ]},
+        }}}
+        callback = MpesaCallback.from_payload(payload, tenant=None)
+        self.assertEqual(callback.checkout_request_id, 'ws_CO_191220191020363925')
+        self.assertEqual(callback.mpesa_receipt_number, 'NLJ7RT61SV')
+        self.assertEqual(callback.result_code, 0)
+        self.assertEqual(str(callback.amount), '1.0')
+        self.assertEqual(callback.phone_number, '254708374149')
+
+    def test_cancelled_payment_has_no_receipt(self):
+        payload = {'Body': {'stkCallback': {
+            'MerchantRequestID': '29115-34620561-1',
+            'CheckoutRequestID': 'ws_CO_191220191020363925',
+            'ResultCode': 1032,
+            'ResultDesc': 'Request cancelled by user',
+        }}}
+        callback = MpesaCallback.from_payload(payload, tenant=None)
+        self.assertIsNone(callback.mpesa_receipt_number)
+        self.assertEqual(callback.result_code, 1032)
+        self.assertIsNone(callback.amount)
+
+    def test_other_bodies_are_rejected(self):
+        with self.assertRaises(KeyError):
+            MpesaCallback.from_payload({'Body': {}}, tenant=None)
+
+
+class ApplyCallbacksTests(TenantTestCase):
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Test Mart'
+        tenant.contact_person = 'Tester'
+        tenant.phone_number = '0700000000'
+
+    def callback(self, checkout_request_id, result_code=0, **fields):
+        fields = {'mpesa_receipt_number': f'R-{checkout_request_id}', 'amount': Decimal('100'),
+                  'phone_number': '254708374149', **fields} if result_code == 0 else fields
+        return MpesaCallback.objects.create(checkout_request_id=checkout_request_id, result_code=result_code,
+                                            payload={}, tenant=self.tenant, **fields)
+
+    def intent(self, checkout_request_id, **fields):
+        order = Order.objects.create(total_amount=Decimal('100'), tenant=self.tenant)
+        return PaymentIntent.objects.create(phone_number='254708374149', amount=Decimal('100'), order=order,
+                                            checkout_request_id=checkout_request_id, tenant=self.tenant, **fields)
+
+    def test_a_callback_without_its_intent_waits_for_a_later_pass(self):
+        callback = self.callback('ws_CO_early')
+        self.assertEqual(apply_callbacks(), 0)
+        callback.refresh_from_db()
+        self.assertIsNone(callback.applied_at)
+        self.assertEqual(callback.attempts, 1)
+        self.assertGreater(callback.next_attempt_at, timezone.now())
+
+        # the dispatcher saves the push, and the callback is applied once it is due again
+        intent = self.intent('ws_CO_early', status='pending')
+        MpesaCallback.objects.filter(pk=callback.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(apply_callbacks(), 1)
+        intent.refresh_from_db()
+        self.assertEqual(intent.status, 'completed')
+        self.assertEqual(Payments.objects.get(order=intent.order).mpesa_reference, 'R-ws_CO_early')
+
+    def test_money_received_for_a_failed_intent_is_recorded(self):
+        intent = self.intent('ws_CO_late', status='failed', error="M-Pesa sent no result.")
+        self.callback('ws_CO_late')
+        self.assertEqual(apply_callbacks(), 1)
+        intent.refresh_from_db()
+        self.assertEqual((intent.status, intent.error), ('completed', ''))
+        self.assertEqual(Payments.objects.get(order=intent.order).amount_paid, Decimal('100'))
+        intent.order.refresh_from_db()
+        self.assertEqual(intent.order.status, 'completed')
+
+    def test_a_failed_result_for_a_failed_intent_changes_nothing(self):
+        intent = self.intent('ws_CO_gone', status='failed', error="Timed out")
+        self.callback('ws_CO_gone', result_code=1032, result_desc='Request cancelled by user')
+        self.assertEqual(apply_callbacks(), 1)
+        intent.refresh_from_db()
+        self.assertEqual((intent.status, intent.error), ('failed', 'Timed out'))
+        self.assertFalse(Payments.objects.exists())
+
+
+class StatementReaderTests(SimpleTestCase):
+
+    def test_reads_completed_incoming_lines_after_the_preamble(self):
+        statement = io.StringIO(
+            "M-PESA Statement,,,,,,,,\n"
+            "Receipt No.,Completion Time,Initiation Time,Details,Transaction Status,Paid In,Withdrawn,Balance,Other Party Info\n"
+            "qfk1abc2de,2025-05-02 10:15:00,2025-05-02 10:14:58,Pay Bill from 2547******678,Completed,\"1,250.00\",,0,2547******678 - JANE DOE\n"
+            "QFK1ABC2DF,2025-05-02 11:00:00,2025-05-02 10:59:58,Pay Bill Charge,Completed,,30.00,0,\n"
+            "QFK1ABC2DG,2025-05-02 12:00:00,2025-05-02 11:59:58,Pay Bill from 2547******111,Failed,500.00,,0,\n"
+        )
+        self.assertEqual(list(read_statement(statement)), [
+            ('QFK1ABC2DE', date(2025, 5, 2), 125000, '678', 'Pay Bill from 2547******678'),
+        ])
+
+    def test_a_file_without_a_header_is_rejected(self):
+        with self.assertRaises(StatementError):
+            list(read_statement(io.StringIO("a,b,c\n1,2,3\n")))
+
+
+class CacheCheckTests(SimpleTestCase):
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_a_process_local_cache_is_flagged(self):
+        self.assertEqual([message.id for message in check_shared_cache(None)], ['payments.W001'])
+        self.assertEqual([message.id for message in check_shared_cache_deploy(None)], ['payments.E001'])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                           'LOCATION': 'redis://127.0.0.1:6379/1'}})
+    def test_a_shared_cache_passes(self):
+        self.assertEqual(check_shared_cache(None) + check_shared_cache_deploy(None), [])
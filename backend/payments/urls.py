@@ -3,5 +3,12 @@ from .views import *
 
 
 urlpatterns = [
-    path('mpesa_pay/',STKPushAPIView.as_view() )
+    path('payments/', PaymentsListCreateAPIView.as_view()),
+    path('payments/summary/', PaymentSummaryAPIView.as_view()),
+    path('mpesa_pay/',STKPushAPIView.as_view() ),
+    path('mpesa_pay/<uuid:handle>/', PaymentIntentRetrieveAPIView.as_view(), name='payment_intent'),
+    path('mpesa/token_metrics/', MpesaTokenMetricsAPIView.as_view()),
+    path('mpesa/callback/', mpesa_callback, name='mpesa_callback'),
+    path('statements/', StatementReconciliationListCreateAPIView.as_view()),
+    path('statements/<int:pk>/lines/', StatementLineListAPIView.as_view()),
 ]
\ No newline at end of file
@@ -7,6 +7,16 @@ from rest_framework.response import Response
 from rest_framework import status
 from .models import * 
 from .serializers import *
+from .analytics import payment_summary
+from erp.pagination import IdCursorPagination
+from cash_management.models import CashDrawerError, record_cash_payment
+from .mpesa import get_token_manager
+from .statements import StatementError, reconcile_statement
+import io
+import csv
+from django.db import connection, transaction
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 import json
 import os
@@ -21,108 +31,167 @@ from dotenv import load_dotenv
 import os
 
 
+class PaymentsListCreateAPIView(APIView):
+    serializer_class = PaymentSerializer
+    pagination_class = IdCursorPagination
+
+    """
+    GET METHOD: To list the payments behind a summary a page at a time, newest first, e.g.
+    ?start=2025-05-01&end=2025-05-31&payment_type=mpesa&order=12
+    """
+    def get(self, request):
+        payments = Payments.objects.filter(tenant=request.user.tenant)
+        params = request.query_params
+        try:
+            if params.get('start'):
+                payments = payments.filter(timestamp__gte=datetime.date.fromisoformat(params['start']))
+            if params.get('end'):
+                payments = payments.filter(timestamp__lte=datetime.date.fromisoformat(params['end']))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if params.get('payment_type'):
+            payments = payments.filter(payment_type__iexact=params['payment_type'])
+        if params.get('order'):
+            payments = payments.filter(order_id=params['order'])
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(payments, request, view=self)
+        serializer = self.serializer_class(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    """
+    POST METHOD: To record a payment taken at the till (cash, card)
+    """
+    def post(self, request):
+        serializer = self.serializer_class(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                payment = serializer.save(tenant = request.user.tenant)
+                rollup_payments([payment])
+                # cash goes into the cashier's drawer, so the end-of-day close expects it
+                record_cash_payment(payment, recorded_by=request.user)
+        except CashDrawerError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class PaymentSummaryAPIView(APIView):
+    serializer_class = PaymentSummarySerializer
+
+    """
+    GET METHOD: To get takings per payment type, day, branch and/or cashier, month to date
+    unless a period is given, e.g. ?start=2025-05-01&group_by=payment_type&group_by=branch
+    """
+    def get(self, request):
+        serializer = self.serializer_class(data = request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        summary = payment_summary(data['start'], data['end'], group_by=data['group_by'])
+        return Response({'start': data['start'], 'end': data['end'], 'results': summary}, status=status.HTTP_200_OK)
+
+
 class STKPushAPIView(APIView):
     
     permission_classes = [AllowAny]
     authentication_classes = []
+    serializer_class = PaymentIntentSerializer
+
+    """
+    POST METHOD: To queue an STK push. The push is sent by the payments dispatcher, so this
+    answers at once with a handle to poll for the outcome
+    """
+    def post(self, request):
+        serializer = self.serializer_class(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        intent = serializer.save(tenant = connection.tenant)
+        data = dict(serializer.data)
+        data['poll_url'] = request.build_absolute_uri(reverse('payment_intent', args=[intent.handle]))
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+
+class PaymentIntentRetrieveAPIView(APIView):
     
-    @staticmethod
-    def get_access_token():
-        consumer_key = os.getenv("MPESA_CONSUMER_KEY")
-        consumer_secret = os.getenv("MPESA_CONSUMER_SECRET")
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    serializer_class = PaymentIntentSerializer
 
-        if not consumer_key or not consumer_secret:
-            raise Exception("M-Pesa consumer key or secret not found in environment variables")
+    """
+    GET METHOD: To poll the status of a queued STK push by its handle
+    """
+    def get(self, request, handle):
+        intent = get_object_or_404(PaymentIntent, handle=handle)
+        return Response(self.serializer_class(intent).data, status=status.HTTP_200_OK)
+
+
+class MpesaTokenMetricsAPIView(APIView):
+    """
+    GET METHOD: To see how often the M-Pesa access token was served from the cache or refreshed
+    """
+    def get(self, request):
+        return Response(get_token_manager().metrics(), status=status.HTTP_200_OK)
 
-        url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-        try:
-            encoded_credentials = base64.b64encode(f"{consumer_key}:{consumer_secret}".encode()).decode()
-            headers = {
-                "Authorization": f"Basic {encoded_credentials}",
-                "Content-Type": "application/json"
-            }
-            response = requests.get(url, headers=headers).json()
-            print(response) 
-            if "access_token" in response:
-                return response["access_token"]
-            else:
-                raise Exception("Failed to get M-Pesa access token: " + response.get("error_description", "Unknown error"))
-        except Exception as e:
-            raise Exception("Failed to get M-Pesa access token: " + str(e))
 
+@csrf_exempt
+def mpesa_callback(request):
+    """
+    POST METHOD: Where Safaricom posts STK push results. The payload is stored as it came and
+    applied later by the payments dispatcher; retried callbacks hit the unique checkout or
+    receipt number and are dropped, so the answer is always a quick acknowledgement.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    try:
+        callback = MpesaCallback.from_payload(json.loads(request.body), connection.tenant)
+    except (KeyError, TypeError, ValueError, ArithmeticError):
+        return JsonResponse({'ResultCode': 1, 'ResultDesc': 'Rejected'}, status=400)
+    MpesaCallback.objects.bulk_create([callback], ignore_conflicts=True)
+    return JsonResponse({'ResultCode': 0, 'ResultDesc': 'Accepted'})
+
+
+class StatementReconciliationListCreateAPIView(APIView):
+    serializer_class = StatementReconciliationSerializer
+
+    """
+    GET METHOD: To list the statement reconciliations that have been run
+    """
+    def get(self, request):
+        reconciliations = StatementReconciliation.objects.all()
+        serializer = self.serializer_class(reconciliations, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    """
+    POST METHOD: To reconcile an uploaded M-Pesa statement (CSV) against the period's payments
+    """
     def post(self, request):
+        serializer = StatementUploadSerializer(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        handle = io.TextIOWrapper(data['file'].file, encoding='utf-8-sig', newline='')
         try:
-            user_id = request.data.get('user_id')
-            print('User...', user_id)
-            phone = request.data.get('phone_number')
-            
-            if not user_id:
-                return Response({'error': 'invalid user'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            NGROK_BASE_URL = "https://fbb4-102-219-210-106.ngrok-free.app"
-            access_token = self.get_access_token()
-            headers = {"Authorization": f"Bearer {access_token}"}
-            timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-            business_short_code = os.getenv("MPESA_BUSINESS_SHORT_CODE")
-            pass_key = os.getenv("MPESA_PASS_KEY")
-
-            if not business_short_code or not pass_key:
-                raise Exception("M-Pesa business short code or pass key not found in environment variables")
-
-            phone_number = request.data.get('phone_number')
-            amount = request.data.get('amount')
-            company_name = request.data.get('company_name')
-            if not phone_number or not amount:
-                return Response({'error': 'Phone number and amount are required'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            web_name = company_name
-            stk_password = base64.b64encode((business_short_code + pass_key + timestamp).encode('utf-8')).decode('utf-8')
-
-            print("stk coming....", request.data)
-            payload = {
-                "BusinessShortCode": business_short_code,
-                "Password": stk_password,
-                "Timestamp": timestamp,
-                "TransactionType": "CustomerPayBillOnline",
-                "Amount": amount,
-                "PartyA": phone_number,
-                "PartyB": business_short_code,
-                "PhoneNumber": phone_number,
-                "CallBackURL": f"{NGROK_BASE_URL}/payments/api/v1/mpesa/callback/",
-                "AccountReference": web_name,
-                "TransactionDesc": "Payment of a product",
-            }
-
-            response = requests.post(
-                "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest",
-                headers=headers,
-                json=payload,
+            reconciliation = reconcile_statement(
+                handle, data['period_start'], data['period_end'], request.user.tenant_id,
+                file_name=data['file'].name, window_days=data['window_days'],
             )
+        except (StatementError, UnicodeDecodeError, csv.Error) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.serializer_class(reconciliation).data, status=status.HTTP_201_CREATED)
+
+
+class StatementLineListAPIView(APIView):
+    serializer_class = StatementLineSerializer
 
-            # Assign to response_json for consistent access
-            response_json = response.json()
-            print(f"M-Pesa STK Push API response: {response_json}")
-
-            if response.status_code == 200:
-                if response_json.get('ResponseCode') == '0':
-                    payment = Payments(
-                        user_id=user_id,
-                        amount=amount,
-                        status='pending',
-                        transaction_id=response_json.get('CheckoutRequestID', str(uuid.uuid4()))
-                    )
-                    payment.save()
-                    return Response(response_json)
-                else:
-                    return Response({'error': response_json.get('ResponseDescription', 'M-Pesa API error'), 'details': response_json}, status=status.HTTP_400_BAD_REQUEST)
-            else:
-                return Response({'error': 'Failed to initiate STK Push with M-Pesa API', 'details': response_json}, status=response.status_code)
-
-        except json.JSONDecodeError:
-            return JsonResponse({'error': 'Invalid JSON format in request body'}, status=400)
-        except requests.exceptions.RequestException as e:
-            print(f"Network error during M-Pesa STK push: {e}")
-            return JsonResponse({'error': f'Network error communicating with M-Pesa: {e}'}, status=500)
-        except Exception as e:
-            print(f"Unhandled error in stkpush: {e}")
-            return JsonResponse({'error': f'Internal server error: {e}'}, status=500)
+    """
+    GET METHOD: To get the results of a statement reconciliation, optionally only those with
+    a given status (?status=unmatched)
+    """
+    def get(self, request, pk):
+        reconciliation = get_object_or_404(StatementReconciliation, pk=pk)
+        lines = reconciliation.results.all().order_by('id')
+        if request.query_params.get('status'):
+            lines = lines.filter(status=request.query_params['status'])
+        serializer = self.serializer_class(lines, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
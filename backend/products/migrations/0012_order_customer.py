@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0003_customer_search'),
+        ('multi_location', '0008_unique_lookup_names'),
+        ('products', '0011_order_branch_reorderrequest'),
+        ('tenants', '0008_alter_activitylogs_action_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='customer',
+            field=models.ForeignKey(blank=True, help_text='The loyalty customer the sale was rung up for', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='customers.customer'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'timestamp'], name='products_or_custome_976e5d_idx'),
+        ),
+    ]
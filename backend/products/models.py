@@ -1,9 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from authentication.models import *
 from django.conf import settings
 from tenants.models import *
-from django.db.models import Sum, F
+from django.db.models import Sum, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
 
 CATEGORIES = [
     ('dairy', 'Dairy'),
@@ -96,6 +97,9 @@ class Order(models.Model):
     order_id = models.CharField(max_length=30, editable=False, blank=True)
     timestamp = models.DateTimeField(default=timezone.now)
     cashier = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
+    branch = models.ForeignKey('multi_location.Branch', on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
+    customer = models.ForeignKey('customers.Customer', on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='orders', help_text="The loyalty customer the sale was rung up for")
     total_amount = models.DecimalField(decimal_places=2,max_digits=10, default=0)
     total_vat = models.DecimalField(decimal_places=2, max_digits=10, default=0)
     tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, null = True)
@@ -113,11 +117,83 @@ class Order(models.Model):
         
     def __str__(self):
         return f'Order {self.order_id} - {self.status}'
+
+    def complete_order(self):
+        """
+        set order as completed, take the sold quantities off the selling branch's stock,
+        raise re-order requests for products that ran low, count the sale on the
+        branch dashboard and add it to the customer's stats.
+        """
+        from customers.stats import record_purchases
+        from multi_location.models import Branch, adjust_daily_metrics, lock_branch_stock, save_branch_stock
+
+        if self.status == 'completed':
+            return
+        with transaction.atomic():
+            # two completions racing on one order must not both count it
+            if Order.objects.select_for_update().values_list('status', flat=True).get(pk=self.pk) == 'completed':
+                self.status = 'completed'
+                return
+            items = list(self.items.select_related('product').order_by('pk'))
+            sold = {}
+            for item in items:
+                branch_id = self.branch_id or item.product.branch_id
+                if branch_id is None:
+                    Product.objects.filter(pk=item.product_id).update(
+                        current_stock=Greatest(F('current_stock') - item.quantity, 0)
+                    )
+                    continue
+                pair = (branch_id, item.product_id)
+                sold[pair] = sold.get(pair, 0) + item.quantity
+
+            rows = lock_branch_stock(sold)
+            for pair, quantity in sold.items():
+                rows[pair].quantity = max(rows[pair].quantity - quantity, 0)
+            save_branch_stock(rows.values())
+            ReorderRequest.objects.bulk_create([
+                ReorderRequest(
+                    product_id=row.product_id,
+                    branch_id=row.branch_id,
+                    requested_quantity=row.min_level * 2,
+                    tenant_id=row.tenant_id,
+                )
+                for row in rows.values() if row.is_low
+            ])
+
+            self.status = 'completed'
+            self.save(update_fields=['status'])
+
+            # orders rung up without a branch count on their first item's home branch (see
+            # sale_branch, which the rebuild_branch_metrics command groups on)
+            branch_id = self.branch_id or next((branch for branch, _ in sold), None)
+            if branch_id:
+                adjust_daily_metrics([{
+                    'branch_id': branch_id,
+                    'tenant_id': Branch.objects.values_list('tenant_id', flat=True).get(pk=branch_id),
+                    'date': timezone.localdate(self.timestamp),
+                    'sales_total': self.total_amount,
+                    'orders_count': 1,
+                }])
+            if self.customer_id:
+                record_purchases([(self.customer_id, timezone.localdate(self.timestamp), self.total_amount, self.tenant_id)])
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [models.Index(fields=['customer', 'timestamp'])]
         
     
+def sale_branch():
+    """
+    the branch an order's sale counts on, as an expression: its own branch, or else the home
+    branch of its first item with one, as in Order.complete_order
+    """
+    home = (
+        OrderItem.objects.filter(order=OuterRef('pk'), product__branch__isnull=False)
+        .order_by('pk').values('product__branch_id')[:1]
+    )
+    return Coalesce('branch_id', Subquery(home), output_field=models.BigIntegerField())
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_items')
@@ -132,28 +208,3 @@ class OrderItem(models.Model):
         if not self.order_id:
           self.order_id = f'ORD-{timezone.now().strftime("%Y%m%d%H%M%S")}'  
         super().save(*args, **kwargs)
-          
-    def complete_order(self):
-        """
-        set order as completed, update stock levels for products,
-        and check for re-order needs if product level/stock runs low.
-        """
-        if self.status != 'completed':
-            for item in self.items.all():
-                product = item.product
-                product.current_stock = F('current_stock') - item.quantity
-                product.save(update_fields=['current_stock'])
-
-                # refresh product from DB to get updated stock
-                product.refresh_from_db()
-
-                if product.current_stock <= product.minimum_stock_level:
-                    # Here you could trigger a re-order workflow
-                    ReorderRequest.objects.create(
-                        product=product,
-                        branch=product.branch,
-                        requested_quantity=product.minimum_stock_level * 2,  # Example logic
-                        tenant=product.tenant
-                    )
-            self.status = 'completed'
-            self.save()
\ No newline at end of file
@@ -6,6 +6,7 @@ from .models import *
 from .serializers import *
 from django.shortcuts import get_object_or_404
 from tenants.models import *
+from multi_location.models import sync_home_stock
 class ProductListCreateAPIView(APIView):
     serializer_class = ProductSerializer
     """
@@ -23,7 +24,8 @@ class ProductListCreateAPIView(APIView):
         product_name = request.data.get('name')
         serializer = self.serializer_class(data = request.data)
         if serializer.is_valid():
-            serializer.save(tenant = request.user.tenant)
+            product = serializer.save(tenant = request.user.tenant)
+            sync_home_stock(product)
             ActivityLogs.objects.create(
                         tenant=request.user.tenant,
                         action_type='product_created',
@@ -55,7 +57,8 @@ class ProductRetrieveUpdateDestroyAPIView(APIView):
         serializer = self.serializer_class(product, data = request.data, partial = True)
         
         if serializer.is_valid():
-            serializer.save()
+            product = serializer.save()
+            sync_home_stock(product)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.error)
     """
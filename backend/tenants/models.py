@@ -38,11 +38,15 @@ class ActivityLogs(models.Model):
         ('bill_created', 'Bill Created'),
         ('branch_created', 'Branch Created'),
         ('stock_transfer_initiated', 'Stock Transfer Initiated'),
+        ('stock_transfer_approved', 'Stock Transfer Approved'),
+        ('stock_transfer_dispatched', 'Stock Transfer Dispatched'),
+        ('stock_transfer_received', 'Stock Transfer Received'),
         ('cash_recon_created', 'Cash Recon Created'),
         ('invoice_created', 'Invoice Created'),
         ('inventory_item_created', 'Inventory Item Created'),
         ('product_created', 'Product Created'),
         ('payment_received', 'Payment Received'),
+        ('payment_run_paid', 'Payment Run Paid'),
         ('customer_added', 'Customer Added'),
         ('user_added', 'User Added'),
         ('inventory_alert', 'Inventory Alert'),